@@ -0,0 +1,13 @@
+"""
+Benchmarks for tlpy, in airspeed velocity (asv) format.
+
+Run from the repository root with
+
+    asv run
+    asv compare <old commit> <new commit>
+
+time_* methods are timed, and peakmem_* methods record the peak resident memory.
+Every benchmark is parameterised over synthetic defect sets (see benchmarks.synthetic),
+so that scaling with the number of defects, charge states and chemical potential points
+can be followed as well as the absolute timings.
+"""
@@ -0,0 +1,100 @@
+from benchmarks.synthetic import make_defect, make_defects, make_delta_mu, make_host
+
+import numpy as np
+
+class FormationEnergy:
+    """Defect_Charge_State.formation_energy for every charge state of one defect, at ten Fermi energies."""
+
+    params = ( [ 3, 10, 30 ], [ 1, 100, 10000 ] )
+    param_names = [ 'n_charge_states', 'n_points' ]
+
+    def setup( self, n_charge_states, n_points ):
+        host = make_host()
+        self.defect = make_defect( 'D', host, n_charge_states )
+        self.delta_mu = make_delta_mu( host, n_points )
+        self.e_fermi = np.linspace( 0.0, host.fundamental_gap, 10 )
+
+    def time_formation_energy( self, n_charge_states, n_points ):
+        for charge_state in self.defect.charge_state.values():
+            for e_fermi in self.e_fermi:
+                charge_state.formation_energy( e_fermi, self.delta_mu )
+
+    def peakmem_formation_energy( self, n_charge_states, n_points ):
+        for charge_state in self.defect.charge_state.values():
+            for e_fermi in self.e_fermi:
+                charge_state.formation_energy( e_fermi, self.delta_mu )
+
+class ChargeStateAtFermiEnergy:
+    """Finding the stable charge state, with and without a cached breakpoint table."""
+
+    params = [ 3, 10, 30, 100 ]
+    param_names = [ 'n_charge_states' ]
+
+    def setup( self, n_charge_states ):
+        self.defect = make_defect( 'D', make_host(), n_charge_states )
+        self.e_fermi = np.linspace( 0.0, self.defect.host.fundamental_gap, 100 )
+        self.e_fermi_grid = np.linspace( 0.0, self.defect.host.fundamental_gap, 100000 )
+
+    def time_charge_state_at_fermi_energy( self, n_charge_states ):
+        for e_fermi in self.e_fermi:
+            self.defect.charge_state_at_fermi_energy( e_fermi )
+
+    def time_charge_state_at_fermi_energy_uncached( self, n_charge_states ):
+        self.defect._breakpoint_table = None
+        self.defect.charge_state_at_fermi_energy( 1.0 )
+
+    def time_charges_at_fermi_energy_grid( self, n_charge_states ):
+        self.defect.charges_at_fermi_energy( self.e_fermi_grid )
+
+class TLProfile:
+    """Defect.tl_profile for one defect, over a number of chemical potential points."""
+
+    params = ( [ 3, 10, 30 ], [ 1, 100, 10000 ] )
+    param_names = [ 'n_charge_states', 'n_points' ]
+
+    def setup( self, n_charge_states, n_points ):
+        host = make_host()
+        self.defect = make_defect( 'D', host, n_charge_states )
+        self.delta_mu = make_delta_mu( host, n_points )
+        self.ef_max = host.fundamental_gap
+
+    def time_tl_profile( self, n_charge_states, n_points ):
+        self.defect.tl_profile( self.delta_mu, 0.0, self.ef_max )
+
+    def time_tl_profile_uncached( self, n_charge_states, n_points ):
+        self.defect._breakpoint_table = None
+        self.defect.tl_profile( self.delta_mu, 0.0, self.ef_max )
+
+    def peakmem_tl_profile( self, n_charge_states, n_points ):
+        self.defect.tl_profile( self.delta_mu, 0.0, self.ef_max )
+
+class PlotOutput:
+    """xmgrace_output and matplotlib_data for a collection of defects at one chemical potential point."""
+
+    params = ( [ 1, 10, 100 ], [ 3, 10, 30 ] )
+    param_names = [ 'n_defects', 'n_charge_states' ]
+
+    def setup( self, n_defects, n_charge_states ):
+        self.defects = make_defects( n_defects, n_charge_states )
+        self.delta_mu = make_delta_mu( self.defects[0].host, 1 )
+
+    def time_xmgrace_output( self, n_defects, n_charge_states ):
+        for defect in self.defects:
+            defect.xmgrace_output( self.delta_mu )
+
+    def time_matplotlib_data( self, n_defects, n_charge_states ):
+        for defect in self.defects:
+            defect.matplotlib_data( self.delta_mu )
+
+    def peakmem_xmgrace_output( self, n_defects, n_charge_states ):
+        for defect in self.defects:
+            defect.xmgrace_output( self.delta_mu )
+
+class ChargeStateMemory:
+    """Peak memory for building a collection of defects, and so for holding their charge states."""
+
+    params = [ 1000, 20000 ]
+    param_names = [ 'n_defects' ]
+
+    def peakmem_make_defects( self, n_defects ):
+        make_defects( n_defects, 5 )
@@ -0,0 +1,60 @@
+from benchmarks.synthetic import make_defect_set, make_delta_mu
+
+from tlpy.concentration import log_defect_concentrations
+from tlpy.defect_map import dominant_defect_map
+from tlpy.fermi_level import self_consistent_fermi_energy
+
+import numpy as np
+
+class DefectSetFormationEnergies:
+    """Batched formation energies for many defects, Fermi energies and chemical potential points."""
+
+    params = ( [ 10, 100, 1000 ], [ 1, 10, 100 ] )
+    param_names = [ 'n_defects', 'n_points' ]
+
+    def setup( self, n_defects, n_points ):
+        self.defect_set = make_defect_set( n_defects, 5 )
+        self.delta_mu = make_delta_mu( self.defect_set.host, n_points )
+        self.e_fermi = np.linspace( 0.0, self.defect_set.host.fundamental_gap, 50 )
+
+    def time_formation_energies( self, n_defects, n_points ):
+        self.defect_set.formation_energies( self.e_fermi, self.delta_mu )
+
+    def peakmem_formation_energies( self, n_defects, n_points ):
+        self.defect_set.formation_energies( self.e_fermi, self.delta_mu )
+
+    def time_log_defect_concentrations( self, n_defects, n_points ):
+        log_defect_concentrations( self.defect_set, self.e_fermi, 1000.0, self.delta_mu )
+
+class SelfConsistentFermiEnergy:
+    """Charge neutrality solutions over chemical potential points and temperatures."""
+
+    params = ( [ 10, 100 ], [ 1, 100 ] )
+    param_names = [ 'n_defects', 'n_points' ]
+
+    def setup( self, n_defects, n_points ):
+        self.defect_set = make_defect_set( n_defects, 5 )
+        self.delta_mu = make_delta_mu( self.defect_set.host, n_points )
+        self.temperatures = np.linspace( 300.0, 1500.0, 10 )
+
+    def time_self_consistent_fermi_energy( self, n_defects, n_points ):
+        self_consistent_fermi_energy( self.defect_set, self.defect_set.host, self.delta_mu, self.temperatures )
+
+    def peakmem_self_consistent_fermi_energy( self, n_defects, n_points ):
+        self_consistent_fermi_energy( self.defect_set, self.defect_set.host, self.delta_mu, self.temperatures )
+
+class SelfConsistentDominantDefectMap:
+    """Dominant defects at the self-consistent Fermi energy over a 2D chemical potential grid."""
+
+    params = [ 100, 500 ]
+    param_names = [ 'n_grid' ]
+
+    def setup( self, n_grid ):
+        self.defect_set = make_defect_set( 15, 5 )
+        self.x = np.linspace( -2.0, 0.0, n_grid )
+
+    def time_dominant_defect_map( self, n_grid ):
+        dominant_defect_map( self.defect_set, 'E0', self.x, 'E1', self.x, { 'E2' : -0.5 }, temperature = 1000.0 )
+
+    def peakmem_dominant_defect_map( self, n_grid ):
+        dominant_defect_map( self.defect_set, 'E0', self.x, 'E1', self.x, { 'E2' : -0.5 }, temperature = 1000.0 )
@@ -0,0 +1,60 @@
+"""
+Synthetic hosts and defects for benchmarking.
+
+Every generator takes a seed, so that each benchmark sees the same data on every run.
+Energies are chosen so that every charge state lies on the lower envelope, which makes
+the number of transition levels grow with the number of charge states.
+"""
+
+from tlpy.defect import Defect
+from tlpy.defect_set import DefectSet
+from tlpy.host import Host
+
+import numpy as np
+
+def make_host( n_elements = 3, seed = 0 ):
+    """A Host with n_elements elements, labelled E0, E1, ..., and a 4 eV gap."""
+    rng = np.random.RandomState( seed )
+    elements = [ 'E{}'.format( i ) for i in range( n_elements ) ]
+    return Host( energy = -2884.8,
+                 vbm = 0.5,
+                 cbm = 4.5,
+                 elemental_energies = dict( zip( elements, rng.uniform( -8.0, -2.0, size = n_elements ) ) ),
+                 correction_scaling = 0.1,
+                 site_densities = { 'S{}'.format( i ) : 4.0e22 for i in range( n_elements ) } )
+
+def make_defect( name, host, n_charge_states, seed = 0 ):
+    """A Defect with n_charge_states charges, centred on zero, and a transition level in the gap between every pair of neighbouring charges."""
+    rng = np.random.RandomState( seed )
+    elements = sorted( host.elemental_energies )
+    stoichiometry = { e : int( rng.choice( [ -1, 1 ] ) ) for e in rng.choice( elements, size = min( 2, len( elements ) ), replace = False ) }
+    defect = Defect( name, stoichiometry, host, 'S{}'.format( rng.randint( len( elements ) ) ) )
+    charges = np.arange( n_charge_states ) - n_charge_states // 2
+    # The (q+1/q) transition level lies at E_Fermi = c_q - c_(q+1), where c_q is the intercept of charge q.
+    # Levels that decrease with increasing charge give a lower envelope that includes every charge state.
+    levels = np.sort( rng.uniform( 0.0, host.fundamental_gap, size = n_charge_states - 1 ) )[ ::-1 ]
+    intercepts = -np.cumsum( np.concatenate( ( [ 0.0 ], levels ) ) )
+    # Shift every charge state so that the lowest formation energy in the gap is 3 eV at delta_mu = 0.
+    intercepts += 3.0 - min( np.min( intercepts ), np.min( intercepts + charges * host.fundamental_gap ) )
+    reference = sum( n * host.elemental_energies[ e ] for e, n in stoichiometry.items() )
+    for q, c in zip( charges, intercepts ):
+        energy = host.energy + c - q * host.vbm - host.correction_scaling * q * q + reference
+        defect.add_charge_state( int( q ), energy )
+    return defect
+
+def make_defects( n_defects, n_charge_states, n_elements = 3, seed = 0 ):
+    """A list of n_defects synthetic defects that share one Host."""
+    host = make_host( n_elements, seed )
+    return [ make_defect( 'D{}'.format( i ), host, n_charge_states, seed + i ) for i in range( n_defects ) ]
+
+def make_defect_set( n_defects, n_charge_states, n_elements = 3, seed = 0 ):
+    """A DefectSet of n_defects synthetic defects."""
+    return DefectSet( make_defects( n_defects, n_charge_states, n_elements, seed ) )
+
+def make_delta_mu( host, n_points, seed = 0 ):
+    """Chemical potentials for every host element: a dict of floats for n_points = 1, otherwise a dict of (n_points) arrays."""
+    rng = np.random.RandomState( seed )
+    delta_mu = { e : rng.uniform( -1.0, 0.0, size = n_points ) for e in sorted( host.elemental_energies ) }
+    if n_points == 1:
+        return { e : float( mu[0] ) for e, mu in delta_mu.items() }
+    return delta_mu
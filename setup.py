@@ -29,6 +29,7 @@ config = {
     'license': 'MIT',
     'packages': ['tlpy'],
     'scripts': [],
+    'entry_points': { 'console_scripts': [ 'tlpy = tlpy.cli:main' ] },
     'name': 'tlpy'
 }
 
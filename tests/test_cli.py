@@ -0,0 +1,93 @@
+import unittest
+import json
+import os
+import tempfile
+import tlpy.cli
+import tlpy.database
+import tlpy.defect
+import tlpy.fermi_level
+import tlpy.host
+import numpy as np
+
+class CLITestCase( unittest.TestCase ):
+    """Test for `cli.py`"""
+
+    def setUp( self ):
+        self.directory = tempfile.TemporaryDirectory()
+        self.spec = { 'name' : 'germanate',
+                      'host' : { 'energy' : -2884.79313425,
+                                 'vbm' : 0.4657,
+                                 'cbm' : 4.0154,
+                                 'elemental_energies' : { 'Ge' : -4.48604, 'P' : -5.18405, 'O' : -4.54934575 },
+                                 'correction_scaling' : 0.099720981,
+                                 'site_densities' : { 'O' : 4.0e22, 'Ge1' : 2.0e22 } },
+                      'defects' : [ { 'name' : 'V_O1', 'site' : 'O', 'stoichiometry' : { 'O' : -1 },
+                                      'charge_states' : [ { 'charge' : 0, 'energy' : -2876.05861202 },
+                                                          { 'charge' : 1, 'energy' : -2877.36415986, 'degeneracy' : 2 },
+                                                          { 'charge' : 2, 'energy' : -2880.33856625 } ] },
+                                    { 'name' : 'PGe1', 'site' : 'Ge1', 'stoichiometry' : { 'P' : 1, 'Ge' : -1 },
+                                      'charge_states' : [ { 'charge' : 0, 'energy' : -2885.223 },
+                                                          { 'charge' : 1, 'energy' : -2889.005 } ] } ],
+                      'limits' : { 'A' : { 'Ge' : -4.8746, 'P' : -8.165, 'O' : 0.0 },
+                                   'B' : { 'Ge' : -4.8664, 'P' : -8.718, 'O' : 0.0 },
+                                   'C' : { 'Ge' : 0.0, 'P' : -2.0718, 'O' : -2.4373 } },
+                      'temperatures' : [ 600.0, 1200.0 ] }
+        self.filename = os.path.join( self.directory.name, 'germanate.json' )
+        with open( self.filename, 'w' ) as f:
+            json.dump( self.spec, f )
+
+    def tearDown( self ):
+        self.directory.cleanup()
+
+    def test_read_study( self ):
+        """A study file is read into a DefectSet"""
+        study = tlpy.cli.read_study( self.filename )
+        defect_set = study[ 'defect_set' ]
+        self.assertEqual( defect_set.names, [ 'V_O1', 'PGe1' ] )
+        self.assertEqual( defect_set.degeneracies[ 0, 1 ], 2 )
+        self.assertEqual( defect_set.host.site_densities[ 'O' ], 4.0e22 )
+
+    def test_study_tasks_are_chunked( self ):
+        """The chemical potential limits are split into chunks"""
+        study = tlpy.cli.read_study( self.filename )
+        tasks = tlpy.cli.study_tasks( study, output = 'out', chunk_size = 2 )
+        self.assertEqual( [ t[0] for t in tasks ], [ os.path.join( 'out', 'germanate_0000.npz' ), os.path.join( 'out', 'germanate_0001.npz' ) ] )
+        self.assertEqual( [ t[1] for t in tasks ], [ [ 'A', 'B' ], [ 'C' ] ] )
+        self.assertEqual( tasks[0][2].shape, ( 2, 3 ) )
+
+    def test_main_writes_results( self ):
+        """Running the command writes one result file per chunk, matching a direct calculation"""
+        output = os.path.join( self.directory.name, 'results' )
+        tlpy.cli.main( [ self.filename, '--workers', '2', '--chunk-size', '2', '--output', output ] )
+        self.assertEqual( sorted( os.listdir( output ) ), [ 'germanate_0000.npz', 'germanate_0001.npz' ] )
+        study = tlpy.cli.read_study( self.filename )
+        e_fermi, concentrations = tlpy.fermi_level.self_consistent_fermi_energy( study[ 'defect_set' ], study[ 'defect_set' ].host,
+                                                                                 [ self.spec[ 'limits' ][ 'C' ] ], [ 600.0, 1200.0 ] )
+        with np.load( os.path.join( output, 'germanate_0001.npz' ) ) as results:
+            self.assertEqual( results[ 'labels' ].tolist(), [ 'C' ] )
+            np.testing.assert_allclose( results[ 'e_fermi' ], e_fermi )
+            np.testing.assert_allclose( results[ 'concentrations' ], concentrations )
+            self.assertEqual( results[ 'pinned' ].tolist(), [ [ False, False ] ] )
+            self.assertEqual( results[ 'intercepts' ].shape, ( 2, 3, 1 ) )
+
+    def test_study_from_database( self ):
+        """A study can read its defects from a defect database"""
+        study = tlpy.cli.read_study( self.filename )
+        tlpy.database.save_defect_set( os.path.join( self.directory.name, 'db' ), study[ 'defect_set' ] )
+        spec = { 'name' : 'from_db', 'database' : 'db', 'limits' : self.spec[ 'limits' ], 'temperatures' : [ 600.0 ] }
+        filename = os.path.join( self.directory.name, 'from_db.json' )
+        with open( filename, 'w' ) as f:
+            json.dump( spec, f )
+        output = os.path.join( self.directory.name, 'results' )
+        written = list( tlpy.cli.run_studies( [ tlpy.cli.read_study( filename ) ], workers = 1, output = output, chunk_size = 3 ) )
+        self.assertEqual( written, [ os.path.join( output, 'from_db_0000.npz' ) ] )
+        with np.load( written[0] ) as results:
+            np.testing.assert_allclose( results[ 'intercepts' ], study[ 'defect_set' ].intercepts( list( self.spec[ 'limits' ].values() ) ) )
+
+    def test_duplicate_study_names_raise_value_error( self ):
+        """Studies must have different names"""
+        study = tlpy.cli.read_study( self.filename )
+        self.assertRaises( ValueError, list, tlpy.cli.run_studies( [ study, study ] ) )
+
+if __name__ == '__main__':
+    unittest.main()
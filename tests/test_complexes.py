@@ -0,0 +1,92 @@
+import unittest
+import tlpy.complexes
+import tlpy.defect
+import tlpy.host
+import numpy as np
+
+class ComplexesTestCase( unittest.TestCase ):
+    """Test for `complexes.py`"""
+
+    def setUp( self ):
+        elemental_energies = { 'Ge' : -4.48604,
+                               'P'  : -5.18405,
+                               'O'  : -4.54934575 }
+
+        self.host = tlpy.host.Host( energy = -2884.79313425,
+                                    vbm = 0.4657,
+                                    cbm = 4.0154,
+                                    elemental_energies = elemental_energies,
+                                    correction_scaling = 0.099720981 )
+
+        vo = tlpy.defect.Defect( 'V_O1', { 'O' : -1 }, self.host, 'O' )
+        vo.add_charge_state(  0, -2876.05861202 )
+        vo.add_charge_state( +1, -2877.36415986 )
+        vo.add_charge_state( +2, -2880.33856625 )
+
+        vge = tlpy.defect.Defect( 'V_Ge1', { 'Ge' : -1 }, self.host, 'Ge' )
+        vge.add_charge_state(  0, -2870.216817 )
+        vge.add_charge_state( -1, -2868.426975 )
+
+        pge = tlpy.defect.Defect( 'PGe1', { 'P' : +1, 'Ge' : -1 }, self.host, 'Ge1' )
+        pge.add_charge_state(  0, -2885.223 )
+        pge.add_charge_state( +1, -2889.005 )
+
+        gep = tlpy.defect.Defect( 'GeP', { 'P' : -1, 'Ge' : +1 }, self.host, 'P' )
+        gep.add_charge_state(  0, -2879.026 )
+        gep.add_charge_state( -1, -2878.217 )
+
+        divacancy = tlpy.defect.Defect( 'V_O-V_Ge', { 'O' : -1, 'Ge' : -1 }, self.host, 'O' )
+        divacancy.add_charge_state(  0, -2862.5 )
+        divacancy.add_charge_state( +1, -2864.0 )
+
+        antisite_pair = tlpy.defect.Defect( 'PGe-GeP', {}, self.host, 'Ge1' )
+        antisite_pair.add_charge_state( 0, -2881.0 )
+
+        self.defects = [ vo, vge, pge, gep ]
+        self.complexes = [ divacancy, antisite_pair ]
+        self.delta_mu = { 'Ge' : -4.8746, 'P' : -8.165, 'O' : 0.0 }
+
+    def test_constituent_pairs( self ):
+        """Pairs of point defects are matched to complexes by stoichiometry"""
+        c, a, b = tlpy.complexes.constituent_pairs( self.defects, self.complexes )
+        self.assertEqual( list( zip( c, a, b ) ), [ ( 0, 0, 1 ), ( 1, 2, 3 ) ] )
+
+    def test_binding_energies_match_scalar_calculation( self ):
+        """Binding energies agree with formation energies calculated for each charge state"""
+        e_fermi = np.array( [ 0.5, 2.0 ] )
+        ( c, a, b ), energies = tlpy.complexes.binding_energies( self.defects, self.complexes, e_fermi, self.delta_mu )
+        self.assertEqual( energies.shape, ( 2, 2, 3, 3, 2 ) )
+        divacancy, vo, vge = self.complexes[0], self.defects[0], self.defects[1]
+        expected = ( divacancy.charge_state[ +1 ].formation_energy( 2.0, self.delta_mu )
+                     - vo.charge_state[ +2 ].formation_energy( 2.0, self.delta_mu )
+                     - vge.charge_state[ -1 ].formation_energy( 2.0, self.delta_mu ) )
+        self.assertAlmostEqual( energies[ 0, 1, 2, 0, 1 ], expected )
+        self.assertTrue( np.all( np.isnan( energies[ 1, 1 ] ) ) )
+        self.assertTrue( np.all( np.isnan( energies[ 1, :, 2 ] ) ) )
+
+    def test_charge_conserving_binding_energies_are_independent_of_conditions( self ):
+        """When the complex charge equals the total constituent charge, the binding energy does not depend on E_Fermi or delta_mu"""
+        delta_mu = [ self.delta_mu, { 'Ge' : 0.0, 'P' : -2.0888, 'O' : -2.4332 } ]
+        _, energies = tlpy.complexes.binding_energies( self.defects, self.complexes, [ 0.0, 1.0, 3.0 ], delta_mu )
+        self.assertEqual( energies.shape, ( 2, 2, 3, 3, 3, 2 ) )
+        conserving = energies[ 0, 1, 2, 0 ] # +1 -> +2 + -1
+        self.assertTrue( np.allclose( conserving, conserving[ 0, 0 ] ) )
+
+    def test_ground_state_binding_energies( self ):
+        """Ground state binding energies use the lowest energy charge state of each defect"""
+        e_fermi = np.linspace( 0.0, 3.5, 8 )
+        _, energies = tlpy.complexes.ground_state_binding_energies( self.defects, self.complexes, e_fermi, self.delta_mu )
+        self.assertEqual( energies.shape, ( 2, 8 ) )
+        expected = [ min( cs.formation_energy( ef, self.delta_mu ) for cs in self.complexes[0].charge_state.values() )
+                     - self.defects[0].defect_energy_at_fermi_energy( ef, self.delta_mu )
+                     - self.defects[1].defect_energy_at_fermi_energy( ef, self.delta_mu ) for ef in e_fermi ]
+        np.testing.assert_allclose( energies[0], expected )
+
+    def test_different_hosts_raise_value_error( self ):
+        """Complexes and point defects must share a host"""
+        other_host = tlpy.host.Host( 0.0, 0.0, 1.0, { 'O' : 0.0 }, 0.0 )
+        other = tlpy.defect.Defect( 'X', { 'O' : -1 }, other_host, 'O' )
+        self.assertRaises( ValueError, tlpy.complexes.binding_energies, self.defects, [ other ], 0.0, self.delta_mu )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import tlpy.concentration
+import tlpy.defect
+import tlpy.defect_set
+import tlpy.host
+import numpy as np
+
+class ConcentrationTestCase( unittest.TestCase ):
+    """Test for `concentration.py`"""
+
+    def setUp( self ):
+        elemental_energies = { 'Ge' : -4.48604,
+                               'P'  : -5.18405,
+                               'O'  : -4.54934575 }
+
+        self.host = tlpy.host.Host( energy = -2884.79313425,
+                                    vbm = 0.4657,
+                                    cbm = 4.0154,
+                                    elemental_energies = elemental_energies,
+                                    correction_scaling = 0.099720981,
+                                    site_densities = { 'O' : 4.0e22, 'Ge' : 1.0e22 } )
+
+        self.vo = tlpy.defect.Defect( 'V_O1', { 'O' : -1 }, self.host, 'O' )
+        self.vo.add_charge_state(  0, -2876.05861202 )
+        self.vo.add_charge_state( +1, -2877.36415986, degeneracy = 2 )
+        self.vo.add_charge_state( +2, -2880.33856625 )
+
+        self.vge = tlpy.defect.Defect( 'V_Ge1', { 'Ge' : -1 }, self.host, 'Ge' )
+        self.vge.add_charge_state(  0, -2870.216817 )
+        self.vge.add_charge_state( -1, -2868.426975 )
+
+        self.defect_set = tlpy.defect_set.DefectSet( [ self.vo, self.vge ] )
+        self.delta_mu = { 'O' : -2.4332, 'Ge' : 0.0 }
+
+    def test_concentrations_match_scalar_calculation( self ):
+        """Charge state concentrations agree with N_site g exp( -H_f / kT )"""
+        e_fermi = np.array( [ 0.5, 2.0 ] )
+        temperature = np.array( [ 800.0, 1200.0, 1500.0 ] )
+        c, totals = tlpy.concentration.defect_concentrations( self.defect_set, e_fermi, temperature, self.delta_mu )
+        self.assertEqual( c.shape, ( 2, 3, 3, 2 ) )
+        self.assertEqual( totals.shape, ( 2, 3, 2 ) )
+        for i, t in enumerate( temperature ):
+            kT = tlpy.concentration.BOLTZMANN_CONSTANT * t
+            for j, ef in enumerate( e_fermi ):
+                cs = self.vo.charge_state[ +1 ]
+                expected = 4.0e22 * 2 * np.exp( -cs.formation_energy( ef, self.delta_mu ) / kT )
+                self.assertAlmostEqual( c[ 0, 1, i, j ] / expected, 1.0 )
+                self.assertAlmostEqual( totals[ 0, i, j ] / c[ 0, :, i, j ].sum(), 1.0 )
+        self.assertTrue( np.all( c[ 1, 2 ] == 0.0 ) )
+
+    def test_log_concentrations_do_not_underflow( self ):
+        """Log concentrations remain finite where the concentrations themselves underflow"""
+        log_c = tlpy.concentration.log_defect_concentrations( self.defect_set, 0.0, 10.0, self.delta_mu )
+        self.assertTrue( np.all( np.isfinite( log_c[ self.defect_set.mask ] ) ) )
+        self.assertTrue( np.all( np.exp( log_c[ 1, :2 ] ) == 0.0 ) )
+
+    def test_multiple_chemical_potentials_add_trailing_axis( self ):
+        """Multiple chemical potential points add a trailing axis"""
+        c, totals = tlpy.concentration.defect_concentrations( [ self.vo, self.vge ], [ 0.5 ], 1000.0,
+                                                              [ self.delta_mu, { 'O' : 0.0, 'Ge' : -1.0 } ] )
+        self.assertEqual( c.shape, ( 2, 3, 1, 1, 2 ) )
+        self.assertEqual( totals.shape, ( 2, 1, 1, 2 ) )
+
+    def test_site_densities_missing_raises_value_error( self ):
+        """Raise ValueError if no site densities are available"""
+        self.host.site_densities = None
+        self.assertRaises( ValueError, tlpy.concentration.log_defect_concentrations, self.defect_set, 0.0, 300.0, self.delta_mu )
+
+    def test_concentration_tracker_updates_changed_defects( self ):
+        """ConcentrationTracker recalculates only changed defects, and agrees with a full calculation"""
+        tracker = tlpy.concentration.ConcentrationTracker( self.defect_set, [ 0.5, 2.0 ], [ 800.0, 1200.0 ], self.delta_mu )
+        self.assertEqual( len( tracker.update() ), 0 )
+        self.vge.charge_state[ -1 ].energy = -2869.0
+        np.testing.assert_array_equal( tracker.update(), [ 1 ] )
+        expected = tlpy.concentration.log_defect_concentrations( self.defect_set, [ 0.5, 2.0 ], [ 800.0, 1200.0 ], self.delta_mu )
+        self.assertTrue( np.allclose( tracker.log_concentrations[ self.defect_set.mask ], expected[ self.defect_set.mask ] ) )
+        self.assertEqual( tracker.totals.shape, ( 2, 2, 2 ) )
+
+    def test_logsumexp( self ):
+        """log-sum-exp of large and empty inputs"""
+        self.assertAlmostEqual( tlpy.concentration.logsumexp( np.array( [ 1000.0, 1000.0 ] ), axis = 0 ), 1000.0 + np.log( 2.0 ) )
+        self.assertEqual( tlpy.concentration.logsumexp( np.array( [ -np.inf, -np.inf ] ), axis = 0 ), -np.inf )
+
+if __name__ == '__main__':
+    unittest.main()
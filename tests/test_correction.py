@@ -0,0 +1,121 @@
+import unittest
+import os
+import pathlib
+import tempfile
+import tlpy.correction
+import tlpy.defect
+import tlpy.host
+import numpy as np
+from unittest.mock import patch
+
+class CorrectionTestCase( unittest.TestCase ):
+    """Test for `correction.py`"""
+
+    def setUp( self ):
+        elemental_energies = { 'O' : -4.54934575 }
+        self.host = tlpy.host.Host( energy = -2884.79313425,
+                                    vbm = 0.4657,
+                                    cbm = 4.0154,
+                                    elemental_energies = elemental_energies,
+                                    correction_scaling = 0.099720981 )
+        self.defect = tlpy.defect.Defect( 'V_O1', { 'O' : -1 }, self.host, 'O' )
+        self.directory = tempfile.TemporaryDirectory()
+        shape = ( 4, 5, 20 )
+        self.host_grid = np.zeros( shape )
+        self.defect_grid = np.zeros( shape ) + np.linspace( 0.0, 1.9, 20 )
+        self.host_path = os.path.join( self.directory.name, 'host.npy' )
+        self.defect_path = os.path.join( self.directory.name, 'defect.npy' )
+        np.save( self.host_path, self.host_grid )
+        np.save( self.defect_path, self.defect_grid )
+
+    def tearDown( self ):
+        self.directory.cleanup()
+
+    def test_correction_is_abstract( self ):
+        """Correction schemes must implement energy"""
+        class NoEnergy( tlpy.correction.Correction ):
+            pass
+        self.assertRaises( TypeError, tlpy.correction.Correction )
+        self.assertRaises( TypeError, NoEnergy )
+
+    def test_default_correction_is_scaled_quadratic( self ):
+        """Without a correction scheme, the correction is host.correction_scaling * q^2"""
+        cs = self.defect.add_charge_state( +2, -2880.33856625 )
+        self.assertAlmostEqual( cs.correction, 4 * 0.099720981 )
+        self.assertAlmostEqual( tlpy.correction.ScaledQuadraticCorrection( 0.099720981 ).energy( cs ), cs.correction )
+
+    def test_host_and_charge_state_schemes( self ):
+        """Charge state correction schemes override the host correction scheme"""
+        self.host.correction_scheme = tlpy.correction.MakovPayneCorrection( 2.8373, 10.0, 10.0 )
+        cs1 = self.defect.add_charge_state( +1, 0.0 )
+        cs2 = self.defect.add_charge_state( +2, 0.0, correction_scheme = tlpy.correction.ScaledQuadraticCorrection( 0.5 ) )
+        self.assertAlmostEqual( cs1.correction, tlpy.correction.COULOMB_CONSTANT * 2.8373 / 200.0 )
+        self.assertAlmostEqual( cs2.correction, 2.0 )
+
+    def test_fixed_correction_ignores_host( self ):
+        """A fixed correction is not changed by the host correction scaling"""
+        cs = self.defect.add_charge_state( +2, 0.0, correction_scheme = tlpy.correction.FixedCorrection( 1.25 ) )
+        self.host.correction_scaling = 0.5
+        self.assertEqual( cs.correction, 1.25 )
+
+    def test_makov_payne_quadrupole_term( self ):
+        """Makov-Payne third order term"""
+        cs = self.defect.add_charge_state( -1, 0.0 )
+        scheme = tlpy.correction.MakovPayneCorrection( 2.8373, 10.0, 5.0, quadrupole_moment = 3.0 )
+        expected = tlpy.correction.COULOMB_CONSTANT * ( 2.8373 / 100.0 - 2.0 * np.pi * 3.0 / 15000.0 )
+        self.assertAlmostEqual( scheme.energy( cs ), expected )
+
+    def test_lany_zunger_correction( self ):
+        """Lany-Zunger correction scales the first order Makov-Payne term"""
+        cs = self.defect.add_charge_state( +2, 0.0 )
+        mp = tlpy.correction.MakovPayneCorrection( 2.8373, 10.0, 5.0 ).energy( cs )
+        lz = tlpy.correction.LanyZungerCorrection( 2.8373, 10.0, 5.0, shape_factor = -0.369 ).energy( cs )
+        self.assertAlmostEqual( lz, mp * ( 1.0 - 0.369 * 0.8 ) )
+
+    def test_planar_average( self ):
+        """Planar average along one axis"""
+        self.assertTrue( np.allclose( tlpy.correction.planar_average( self.defect_grid, 2 ), np.linspace( 0.0, 1.9, 20 ) ) )
+        self.assertTrue( np.allclose( tlpy.correction.planar_average( self.defect_grid, 0 ), 0.95 ) )
+
+    def test_potential_alignment( self ):
+        """Potential alignment averages V_defect - V_host over the sampling region, and adds -q delta_V"""
+        alignment = tlpy.correction.PotentialAlignment( self.host_path, self.defect_path, axis = 2, region = ( 0.4, 0.6 ) )
+        self.assertAlmostEqual( alignment.delta_v(), 1.0 )
+        cs = self.defect.add_charge_state( +2, 0.0, potential_alignment = alignment )
+        self.assertAlmostEqual( cs.correction, 4 * 0.099720981 - 2.0 )
+
+    def test_potential_alignment_from_path_objects( self ):
+        """Potential grids can be given as os.PathLike paths, with or without a cache"""
+        cache = tlpy.correction.CorrectionCache( os.path.join( self.directory.name, 'cache' ) )
+        for c in [ None, cache ]:
+            alignment = tlpy.correction.PotentialAlignment( pathlib.Path( self.host_path ), pathlib.Path( self.defect_path ), cache = c )
+            self.assertAlmostEqual( alignment.delta_v(), 1.0 )
+        self.assertEqual( len( os.listdir( cache.directory ) ), 2 )
+
+    def test_correction_cache( self ):
+        """Cached planar averages are reused without reading the grid again"""
+        cache = tlpy.correction.CorrectionCache( os.path.join( self.directory.name, 'cache' ) )
+        first = tlpy.correction.PotentialAlignment( self.host_path, self.defect_path, cache = cache ).delta_v()
+        with patch( 'tlpy.correction.planar_average', side_effect = AssertionError ):
+            second = tlpy.correction.PotentialAlignment( self.host_path, self.defect_path, cache = cache ).delta_v()
+        self.assertEqual( first, second )
+        self.assertEqual( len( os.listdir( cache.directory ) ), 2 )
+
+    def test_freysoldt_lattice_energy( self ):
+        """For a large cubic cell, E_iso - E_per approaches the first order Makov-Payne correction"""
+        scheme = tlpy.correction.FreysoldtCorrection( np.eye( 3 ) * 20.0, 1.0, gaussian_width = 1.0 )
+        mp = tlpy.correction.COULOMB_CONSTANT * 2.8373 / 40.0
+        self.assertAlmostEqual( scheme.lattice_energy( 1 ), mp, delta = 0.01 )
+
+    def test_freysoldt_correction_subtracts_model_potential( self ):
+        """Freysoldt alignment is taken after subtracting the model potential"""
+        scheme = tlpy.correction.FreysoldtCorrection( np.eye( 3 ) * 10.0, 5.0, position = 0.0 )
+        model = scheme.model_potential( 1, 20, 2 )
+        alignment = tlpy.correction.PotentialAlignment( self.host_grid, self.host_grid + model + 0.3 )
+        cs = self.defect.add_charge_state( +1, 0.0, correction_scheme = scheme, potential_alignment = alignment )
+        self.assertAlmostEqual( cs.correction, scheme.lattice_energy( 1 ) - 0.3 )
+        self.assertEqual( scheme.energy( self.defect.add_charge_state( 0, 0.0 ) ), 0.0 )
+        self.assertRaises( ValueError, scheme.energy, self.defect.add_charge_state( -1, 0.0 ) )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import tempfile
+import tlpy.correction
+import tlpy.database
+import tlpy.defect
+import tlpy.defect_set
+import tlpy.host
+import numpy as np
+
+class DatabaseTestCase( unittest.TestCase ):
+    """Test for `database.py`"""
+
+    def setUp( self ):
+        elemental_energies = { 'Ge' : -4.48604,
+                               'P'  : -5.18405,
+                               'O'  : -4.54934575 }
+
+        self.host = tlpy.host.Host( energy = -2884.79313425,
+                                    vbm = 0.4657,
+                                    cbm = 4.0154,
+                                    elemental_energies = elemental_energies,
+                                    correction_scaling = 0.099720981,
+                                    site_densities = { 'O' : 4.0e22 } )
+
+        self.vo = tlpy.defect.Defect( 'V_O1', { 'O' : -1 }, self.host, 'O' )
+        self.vo.add_charge_state(  0, -2876.05861202 )
+        self.vo.add_charge_state( +1, -2877.36415986, degeneracy = 2 )
+        self.vo.add_charge_state( +2, -2880.33856625 )
+
+        self.pge = tlpy.defect.Defect( 'PGe1', { 'P' : +1, 'Ge' : -1 }, self.host, 'Ge1' )
+        self.pge.add_charge_state(  0, -2885.223 )
+        self.pge.add_charge_state( +1, -2889.005 )
+
+        self.directory = tempfile.TemporaryDirectory()
+        tlpy.database.save_defect_set( self.directory.name, [ self.vo, self.pge ] )
+
+    def tearDown( self ):
+        self.directory.cleanup()
+
+    def test_load_host( self ):
+        """The host is restored from the database"""
+        host = tlpy.database.load_host( self.directory.name )
+        self.assertEqual( host.energy, self.host.energy )
+        self.assertEqual( host.vbm, self.host.vbm )
+        self.assertEqual( host.cbm, self.host.cbm )
+        self.assertEqual( host.correction_scaling, self.host.correction_scaling )
+        self.assertEqual( host.elemental_energies, self.host.elemental_energies )
+        self.assertEqual( host.site_densities, self.host.site_densities )
+        self.assertIsNone( host.dos )
+
+    def test_host_dos_is_saved( self ):
+        """A host density of states is saved and restored"""
+        self.host.dos = np.array( [ [ 0.0, 1.0e22 ], [ 0.1, 2.0e22 ] ] )
+        tlpy.database.save_defect_set( self.directory.name, [ self.vo, self.pge ] )
+        np.testing.assert_array_equal( tlpy.database.load_host( self.directory.name ).dos, self.host.dos )
+
+    def test_load_defect_set_is_memory_mapped( self ):
+        """Arrays are memory-mapped, and no Defect objects are created on loading"""
+        defect_set = tlpy.database.load_defect_set( self.directory.name )
+        self.assertIsInstance( defect_set.energies, np.memmap )
+        self.assertEqual( defect_set._defects, [ None, None ] )
+        self.assertEqual( len( defect_set ), 2 )
+
+    def test_loaded_formation_energies( self ):
+        """Formation energies from a loaded database agree with the original defects"""
+        delta_mu = { 'Ge' : 0.0, 'P' : -2.0888, 'O' : -2.4332 }
+        loaded = tlpy.database.load_defect_set( self.directory.name )
+        original = tlpy.defect_set.DefectSet( [ self.vo, self.pge ] )
+        self.assertTrue( np.allclose( loaded.formation_energies( [ 0.0, 1.5 ], delta_mu ),
+                                      original.formation_energies( [ 0.0, 1.5 ], delta_mu ) ) )
+
+    def test_defects_are_built_on_access( self ):
+        """Defect objects are built from the packed arrays on access"""
+        defect_set = tlpy.database.load_defect_set( self.directory.name )
+        defect = defect_set.defect( 1 )
+        self.assertEqual( defect_set._defects[0], None )
+        self.assertEqual( defect.name, 'PGe1' )
+        self.assertEqual( defect.site, 'Ge1' )
+        self.assertEqual( defect.stoichiometry, { 'P' : 1, 'Ge' : -1 } )
+        self.assertEqual( sorted( defect.charge_state ), [ 0, 1 ] )
+        self.assertEqual( defect.charge_state[ 1 ].energy, -2889.005 )
+        self.assertIs( defect_set.defect( 1 ), defect )
+        self.assertEqual( defect_set.defects[0].charge_state[ 1 ].degeneracy, 2 )
+
+    def test_built_defects_keep_stored_corrections( self ):
+        """Defects built from a loaded database use the stored corrections, which survive repacking"""
+        self.vo.charge_state[ +2 ].correction_scheme = tlpy.correction.ScaledQuadraticCorrection( 2.0 )
+        tlpy.database.save_defect_set( self.directory.name, [ self.vo, self.pge ] )
+        defect_set = tlpy.database.load_defect_set( self.directory.name, mmap_mode = None )
+        self.assertEqual( defect_set.defect( 0 ).charge_state[ +2 ].correction, 8.0 )
+        defect_set.update_charge_state( 0, 0, -2876.0 )
+        self.assertEqual( defect_set.corrections[ 0, 2 ], 8.0 )
+        self.assertAlmostEqual( defect_set.reference_energies[ 0, 2 ], self.vo.charge_state[ +2 ].relative_formation_energy( 0.0 ) )
+
+if __name__ == '__main__':
+    unittest.main()
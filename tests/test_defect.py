@@ -1,9 +1,32 @@
 import unittest
+import tracemalloc
+import tlpy.correction
 import tlpy.defect
+import tlpy.defect_charge_state
+import tlpy.defect_set
 import tlpy.host
 import numpy as np
 from unittest.mock import Mock
 
+class DictChargeState:
+    """A charge state held in a per-object __dict__, with the same attributes as the original Defect_Charge_State."""
+
+    def __init__( self, charge, energy, host, stoichiometry ):
+        self.charge = charge
+        self.energy = energy
+        self.host = host
+        self.stoichiometry = stoichiometry
+
+def allocated_memory( build ):
+    """Bytes allocated, and still held, by build()."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        objects = build()
+        return tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
 class DefectTestCase( unittest.TestCase ):
     """Test for `defect.py`"""
 
@@ -49,6 +72,136 @@ class DefectTestCase( unittest.TestCase ):
         self.assertEqual( self.defect.charge_state_at_fermi_energy( 0.0 ), self.charge_states[ 2 ] )
         self.assertEqual( self.defect.charge_state_at_fermi_energy( 3.0 ), self.charge_states[ 0 ] )
 
+    def test_charges_at_fermi_energy( self ):
+        """Lowest formation energy charges for an array of Fermi energies"""
+        e_fermi = np.linspace( 0.0, 3.0, 31 )
+        expected = [ self.defect.charge_state_at_fermi_energy( ef ).charge for ef in e_fermi ]
+        np.testing.assert_array_equal( self.defect.charges_at_fermi_energy( e_fermi ), expected )
+
+    def test_breakpoint_table_is_rebuilt_after_add_charge_state( self ):
+        """Adding a charge state invalidates the cached breakpoint table"""
+        self.assertEqual( self.defect.charge_state_at_fermi_energy( 3.0 ).charge, 0 )
+        self.defect.add_charge_state( -1, -2880.0 )
+        self.assertEqual( self.defect.charge_state_at_fermi_energy( 3.0 ).charge, -1 )
+
+    def test_breakpoint_table_is_rebuilt_after_host_change( self ):
+        """Changing the host invalidates the cached breakpoint table"""
+        self.assertEqual( self.defect.charge_state_at_fermi_energy( 0.0 ).charge, 2 )
+        self.host.correction_scaling = 10.0
+        self.assertEqual( self.defect.charge_state_at_fermi_energy( 0.0 ).charge, 0 )
+
+    def test_cached_results_are_recalculated_after_host_is_replaced( self ):
+        """Replacing the host with a different Host object invalidates the cached corrections and breakpoint table,
+           even if both hosts have the same revision"""
+        self.assertEqual( self.defect.charge_state_at_fermi_energy( 0.0 ).charge, 2 )
+        host = tlpy.host.Host( energy = self.host.energy,
+                               vbm = self.host.vbm,
+                               cbm = self.host.cbm,
+                               elemental_energies = self.host.elemental_energies,
+                               correction_scaling = 10.0 )
+        self.assertEqual( host.revision, self.host.revision )
+        self.defect.host = host
+        self.assertAlmostEqual( self.charge_states[2].correction, 40.0 )
+        self.assertEqual( self.defect.charge_state_at_fermi_energy( 0.0 ).charge, 0 )
+
+    def test_defect_energy_at_fermi_energy( self ):
+        """Lowest formation energies for arrays of Fermi energies and chemical potentials"""
+        e_fermi = np.array( [ 0.0, 1.0, 3.0 ] )
+        energies = self.defect.defect_energy_at_fermi_energy( e_fermi, [ { 'O' : 0.0 }, { 'O' : -1.0 } ] )
+        self.assertEqual( energies.shape, ( 2, 3 ) )
+        for ef, e in zip( e_fermi, energies[1] ):
+            self.assertAlmostEqual( e, min( cs.formation_energy( ef, { 'O' : -1.0 } ) for cs in self.charge_states ) )
+        self.assertAlmostEqual( self.defect.defect_energy_at_fermi_energy( 0.0, { 'O' : 0.0 } ), 1.23550617 )
+
+    def test_update_charge_state( self ):
+        """Updating a charge state energy updates the transition levels"""
+        revision = self.defect.revision
+        self.defect.update_charge_state( +1, -2879.0 )
+        self.assertEqual( self.defect.revision, revision + 1 )
+        self.assertEqual( self.defect.charge_state[ +1 ].energy, -2879.0 )
+        charges, _ = self.defect.lower_envelope()
+        np.testing.assert_array_equal( charges, [ 2, 1, 0 ] )
+
+    def test_larger_correction_uncovers_hidden_charge_states( self ):
+        """Replacing a charge state with one with the same energy but a larger correction can uncover hidden charge states"""
+        charges, _ = self.defect.lower_envelope()
+        np.testing.assert_array_equal( charges, [ 2, 0 ] )
+        self.defect.add_charge_state( +2, -2880.33856625, correction_scheme = tlpy.correction.ScaledQuadraticCorrection( 2.0 ) )
+        charges, levels = self.defect.lower_envelope()
+        np.testing.assert_array_equal( charges, [ 2, 1, 0 ] )
+        np.testing.assert_array_almost_equal( levels, [ -5.39157263, 0.74012686 ] )
+
+    def test_setting_correction_scheme_updates_envelope( self ):
+        """Setting the correction scheme or potential alignment of a charge state updates the transition levels"""
+        revision = self.defect.revision
+        self.charge_states[2].correction_scheme = tlpy.correction.ScaledQuadraticCorrection( 2.0 )
+        self.assertEqual( self.defect.revision, revision + 1 )
+        charges, levels = self.defect.lower_envelope()
+        np.testing.assert_array_equal( charges, [ 2, 1, 0 ] )
+        np.testing.assert_array_almost_equal( levels, [ -5.39157263, 0.74012686 ] )
+        self.charge_states[2].potential_alignment = Mock( delta_v = Mock( return_value = 0.1 ) )
+        self.assertEqual( self.defect.revision, revision + 2 )
+
+    def test_replaced_charge_state_is_detached( self ):
+        """Changing a charge state that has been replaced does not change the defect"""
+        defect = tlpy.defect.Defect( 'V_O', { 'O' : -1 }, self.host, 'O' )
+        defect.add_charge_state( 0, -100.0 )
+        old = defect.add_charge_state( 1, -96.0 )
+        defect.add_charge_state( 1, -94.0 )
+        self.assertIsNone( old.defect )
+        defect.breakpoint_table()
+        revision = defect.revision
+        old.energy = -99.0
+        self.assertEqual( defect.revision, revision )
+        charges, levels = defect.lower_envelope()
+        defect._breakpoint_table = None
+        expected_charges, expected_levels = defect.lower_envelope()
+        np.testing.assert_array_equal( charges, expected_charges )
+        np.testing.assert_array_almost_equal( levels, expected_levels )
+
+    def test_incremental_envelope_matches_full_rebuild( self ):
+        """Incrementally updated breakpoint tables agree with tables rebuilt from scratch"""
+        rng = np.random.RandomState( 0 )
+        replaced = []
+        for _ in range( 200 ):
+            q = int( rng.randint( -3, 4 ) )
+            self.defect.breakpoint_table()
+            if q in self.defect.charge_state and rng.rand() < 0.3:
+                self.defect.charge_state[ q ].energy += rng.uniform( -1.0, 1.0 )
+            elif q in self.defect.charge_state and rng.rand() < 0.5:
+                correction = tlpy.correction.ScaledQuadraticCorrection( rng.uniform( 0.0, 2.0 ) )
+                replaced.append( self.defect.charge_state[ q ] )
+                self.defect.add_charge_state( q, self.defect.charge_state[ q ].energy, correction_scheme = correction )
+            elif replaced and rng.rand() < 0.3:
+                replaced[ rng.randint( len( replaced ) ) ].energy -= rng.uniform( 0.0, 5.0 )
+            else:
+                self.defect.update_charge_state( q, -2878.0 - 0.5 * q + rng.uniform( -2.0, 2.0 ) )
+            charges, levels, intercepts = self.defect.breakpoint_table()
+            self.defect._breakpoint_table = None
+            expected_charges, expected_levels, expected_intercepts = self.defect.breakpoint_table()
+            np.testing.assert_array_equal( charges, expected_charges )
+            self.assertTrue( np.allclose( levels, expected_levels ) )
+            self.assertTrue( np.allclose( intercepts, expected_intercepts ) )
+
+    def test_charge_states_are_smaller_than_dict_objects( self ):
+        """Slotted charge states use less memory than charge states with a per-object __dict__"""
+        self.assertFalse( hasattr( self.charge_states[0], '__dict__' ) )
+        energies = np.linspace( -2880.0, -2870.0, 1000 ).tolist()
+        slotted = allocated_memory( lambda: [ tlpy.defect_charge_state.Defect_Charge_State( 1, e, self.defect ) for e in energies ] )
+        with_dict = allocated_memory( lambda: [ DictChargeState( 1, e, self.host, self.stoichiometry ) for e in energies ] )
+        self.assertLess( slotted, with_dict )
+
+    def test_correction_is_cached_until_host_changes( self ):
+        """The finite-size correction is cached, and recalculated after the host or correction scheme changes"""
+        charge_state = self.charge_states[2]
+        self.assertAlmostEqual( charge_state.correction, 4 * 0.099720981 )
+        self.host.correction_scaling = 0.2
+        self.assertAlmostEqual( charge_state.correction, 0.8 )
+        charge_state.correction_scheme = Mock( energy = Mock( return_value = 1.5 ) )
+        self.assertEqual( charge_state.correction, 1.5 )
+        self.assertEqual( charge_state.correction, 1.5 )
+        self.assertEqual( charge_state.correction_scheme.energy.call_count, 1 )
+
     def test_charge_state_list( self ):
         """List of charge states returned"""
         self.assertEqual( self.defect.charge_state_list(), [ cs.charge for cs in self.charge_states ] )
@@ -71,6 +224,41 @@ class DefectTestCase( unittest.TestCase ):
                              [ 3.0,         4.18517648] ]
         self.assertTrue( np.allclose( tl_profile, expected_profile ) )
 
+    def test_transition_level_profile_for_multiple_chemical_potentials( self ):
+        """Transition level profiles can be calculated for an array of chemical potentials at once"""
+        tl_profile = self.defect.tl_profile( [ { 'O' : 0 }, { 'O' : -1.0 } ], 0.0, 3.0 )
+        self.assertEqual( tl_profile.shape, ( 2, 3, 2 ) )
+        self.assertTrue( np.allclose( tl_profile[0], self.defect.tl_profile( { 'O' : 0 }, 0.0, 3.0 ) ) )
+        self.assertTrue( np.allclose( tl_profile[1,:,1], tl_profile[0,:,1] - 1.0 ) )
+
+    def test_transition_level_profile_many_charge_states( self ):
+        """Transition level profile follows the lowest formation energy charge state"""
+        defect = tlpy.defect.Defect( 'V_P', { 'P' : -1 }, self.host, 'P' )
+        for q, e in zip( [ 0, -1, -2, -3, -4, -5 ], [ -2864.292, -2863.078, -2860.643, -2857.421, -2853.678, -2849.884 ] ):
+            defect.add_charge_state( q, e )
+        delta_mu = { 'P' : -2.0888 }
+        tl_profile = defect.tl_profile( delta_mu, 0.0, 3.5 )
+        for e_fermi in np.linspace( 0.0, 3.5, 51 ):
+            expected = min( cs.formation_energy( e_fermi, delta_mu ) for cs in defect.charge_state.values() )
+            self.assertAlmostEqual( np.interp( e_fermi, tl_profile[:,0], tl_profile[:,1] ), expected )
+
+    def test_array_chemical_potentials_follow_sorted_elements( self ):
+        """Array chemical potentials have columns in sorted element order, as for DefectSet.elements"""
+        defect = tlpy.defect.Defect( 'P_Ge', { 'P' : +1, 'Ge' : -1 }, self.host, 'Ge' )
+        defect.add_charge_state( 0, -2884.1 )
+        delta_mu = { 'P' : -2.0888, 'Ge' : -0.3887 }
+        expected = defect.chemical_potential_terms( delta_mu )
+        mu = np.array( [ [ delta_mu[ 'Ge' ], delta_mu[ 'P' ] ] ] )
+        self.assertTrue( np.allclose( defect.chemical_potential_terms( mu ), expected ) )
+        self.assertTrue( np.allclose( tlpy.defect_set.DefectSet( [ defect ] ).chemical_potential_terms( mu ), expected ) )
+        self.assertTrue( np.allclose( defect.tl_profile( mu, 0.0, 3.0 )[0], defect.tl_profile( delta_mu, 0.0, 3.0 ) ) )
+
+    def test_lower_envelope( self ):
+        """Stable charge states and transition levels for this defect"""
+        charges, levels = self.defect.lower_envelope()
+        np.testing.assert_array_equal( charges, [ 2, 0 ] )
+        self.assertTrue( np.allclose( levels, [ 1.474835153 ] ) )
+
     def test_xmgrace_output_generated_correctly( self ):
         self.defect.name = 'name'
         self.defect.tl_profile = Mock( return_value = np.array( [[1,2],[3,4],[5,6]] ) )
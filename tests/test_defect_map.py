@@ -0,0 +1,110 @@
+import unittest
+import warnings
+import tlpy.defect
+import tlpy.defect_map
+import tlpy.fermi_level
+import tlpy.host
+import tlpy.stability_region
+import numpy as np
+
+class DefectMapTestCase( unittest.TestCase ):
+    """Test for `defect_map.py`"""
+
+    def setUp( self ):
+        elemental_energies = { 'Ge' : -4.48604,
+                               'P'  : -5.18405,
+                               'O'  : -4.54934575 }
+
+        self.host = tlpy.host.Host( energy = -2884.79313425,
+                                    vbm = 0.4657,
+                                    cbm = 4.0154,
+                                    elemental_energies = elemental_energies,
+                                    correction_scaling = 0.099720981,
+                                    site_densities = { 'O' : 4.0e22, 'Ge' : 1.0e22, 'P' : 1.0e22 } )
+
+        vo = tlpy.defect.Defect( 'V_O1', { 'O' : -1 }, self.host, 'O' )
+        vo.add_charge_state(  0, -2876.05861202 )
+        vo.add_charge_state( +1, -2877.36415986 )
+        vo.add_charge_state( +2, -2880.33856625 )
+
+        vge = tlpy.defect.Defect( 'V_Ge1', { 'Ge' : -1 }, self.host, 'Ge' )
+        vge.add_charge_state(  0, -2870.216817 )
+        vge.add_charge_state( -1, -2868.426975 )
+        vge.add_charge_state( -2, -2866.739624 )
+
+        pge = tlpy.defect.Defect( 'PGe1', { 'P' : +1, 'Ge' : -1 }, self.host, 'Ge' )
+        pge.add_charge_state(  0, -2885.223 )
+        pge.add_charge_state( +1, -2889.005 )
+
+        self.defects = [ vo, vge, pge ]
+        self.x = np.linspace( -3.0, 0.0, 7 )
+        self.y = np.linspace( -5.0, 0.0, 5 )
+
+    def test_dominant_defect_map_at_fixed_fermi_energy( self ):
+        """Dominant defects agree with a loop over Defect.defect_energy_at_fermi_energy"""
+        index, charge, energy = tlpy.defect_map.dominant_defect_map( self.defects, 'O', self.x, 'Ge', self.y,
+                                                                     { 'P' : -2.0888 }, e_fermi = 1.0 )
+        self.assertEqual( index.shape, ( 5, 7 ) )
+        for i, mu_ge in enumerate( self.y ):
+            for j, mu_o in enumerate( self.x ):
+                mu = { 'O' : mu_o, 'Ge' : mu_ge, 'P' : -2.0888 }
+                energies = [ d.defect_energy_at_fermi_energy( 1.0, mu ) for d in self.defects ]
+                best = int( np.argmin( energies ) )
+                self.assertEqual( index[ i, j ], best )
+                self.assertEqual( charge[ i, j ], self.defects[ best ].charge_state_at_fermi_energy( 1.0 ).charge )
+                self.assertAlmostEqual( energy[ i, j ], energies[ best ] )
+
+    def test_dominant_defect_map_self_consistent( self ):
+        """Dominant defects at the self-consistent Fermi energy"""
+        index, charge, energy = tlpy.defect_map.dominant_defect_map( self.defects, 'O', self.x, 'Ge', self.y,
+                                                                     { 'P' : -2.0888 }, temperature = 1000.0 )
+        mu = { 'O' : self.x[2], 'Ge' : self.y[3], 'P' : -2.0888 }
+        e_fermi, _ = tlpy.fermi_level.self_consistent_fermi_energy( self.defects, self.host, mu, 1000.0 )
+        energies = [ d.defect_energy_at_fermi_energy( e_fermi[ 0, 0 ], mu ) for d in self.defects ]
+        self.assertEqual( index[ 3, 2 ], np.argmin( energies ) )
+        self.assertAlmostEqual( energy[ 3, 2 ], min( energies ) )
+
+    def test_dominant_defect_map_self_consistent_at_every_point( self ):
+        """Dominant defects and charge states agree with Defect methods at the self-consistent Fermi energy of every grid point"""
+        index, charge, energy = tlpy.defect_map.dominant_defect_map( self.defects, 'O', self.x, 'Ge', self.y,
+                                                                     { 'P' : -2.0888 }, temperature = 1000.0 )
+        for i, mu_ge in enumerate( self.y ):
+            for j, mu_o in enumerate( self.x ):
+                mu = { 'O' : mu_o, 'Ge' : mu_ge, 'P' : -2.0888 }
+                with warnings.catch_warnings():
+                    warnings.simplefilter( 'ignore', RuntimeWarning )
+                    e_fermi, _ = tlpy.fermi_level.self_consistent_fermi_energy( self.defects, self.host, mu, 1000.0 )
+                energies = [ d.defect_energy_at_fermi_energy( e_fermi[ 0, 0 ], mu ) for d in self.defects ]
+                best = int( np.argmin( energies ) )
+                self.assertEqual( index[ i, j ], best )
+                self.assertEqual( charge[ i, j ], self.defects[ best ].charge_state_at_fermi_energy( e_fermi[ 0, 0 ] ).charge )
+                self.assertAlmostEqual( energy[ i, j ], energies[ best ] )
+
+    def test_dominant_defect_map_self_consistent_tolerance( self ):
+        """A looser self-consistent Fermi energy tolerance gives the same dominant defects"""
+        index, charge, energy = tlpy.defect_map.dominant_defect_map( self.defects, 'O', self.x, 'Ge', self.y,
+                                                                     { 'P' : -2.0888 }, temperature = 1000.0 )
+        loose = tlpy.defect_map.dominant_defect_map( self.defects, 'O', self.x, 'Ge', self.y,
+                                                     { 'P' : -2.0888 }, temperature = 1000.0, tolerance = 1e-4 )
+        np.testing.assert_array_equal( loose[0], index )
+        np.testing.assert_array_equal( loose[1], charge )
+        self.assertTrue( np.allclose( loose[2], energy, atol = 1e-3, equal_nan = True ) )
+
+    def test_missing_fermi_energy_and_temperature_raises_value_error( self ):
+        """Raise ValueError if neither a Fermi energy nor a temperature is given"""
+        self.assertRaises( ValueError, tlpy.defect_map.dominant_defect_map, self.defects, 'O', self.x, 'Ge', self.y, { 'P' : 0.0 } )
+
+    def test_stability_region_constrains_remaining_element( self ):
+        """The remaining host element is constrained by the stability region, and unstable points are flagged"""
+        region = tlpy.stability_region.StabilityRegion( { 'Ge' : 1, 'P' : 1, 'O' : 4 }, -40.0,
+                                                        self.host.elemental_energies, {} )
+        mu, inside = tlpy.defect_map.chemical_potential_grid( 'O', self.x, 'Ge', self.y, {}, region )
+        self.assertTrue( np.allclose( mu[ 'Ge' ] + mu[ 'P' ] + 4 * mu[ 'O' ], region.formation_enthalpy ) )
+        self.assertTrue( np.all( inside == ( mu[ 'P' ] <= 1e-8 ) ) )
+        index, charge, energy = tlpy.defect_map.dominant_defect_map( self.defects, 'O', self.x, 'Ge', self.y, {},
+                                                                     e_fermi = 1.0, stability_region = region )
+        self.assertTrue( np.all( ( index == -1 ) == ~inside ) )
+        self.assertTrue( np.all( np.isnan( energy[ ~inside ] ) ) )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+import pickle
+import tlpy.correction
+import tlpy.defect
+import tlpy.defect_set
+import tlpy.host
+import numpy as np
+
+class DefectSetTestCase( unittest.TestCase ):
+    """Test for `defect_set.py`"""
+
+    def setUp( self ):
+        elemental_energies = { 'Ge' : -4.48604,
+                               'P'  : -5.18405,
+                               'O'  : -4.54934575 }
+
+        self.host = tlpy.host.Host( energy = -2884.79313425,
+                                    vbm = 0.4657,
+                                    cbm = 4.0154,
+                                    elemental_energies = elemental_energies,
+                                    correction_scaling = 0.099720981 )
+
+        self.vo = tlpy.defect.Defect( 'V_O1', { 'O' : -1 }, self.host, 'O' )
+        self.vo.add_charge_state(  0, -2876.05861202 )
+        self.vo.add_charge_state( +1, -2877.36415986 )
+        self.vo.add_charge_state( +2, -2880.33856625 )
+
+        self.pge = tlpy.defect.Defect( 'PGe1', { 'P' : +1, 'Ge' : -1 }, self.host, 'Ge1' )
+        self.pge.add_charge_state(  0, -2885.223 )
+        self.pge.add_charge_state( +1, -2889.005 )
+
+        self.defect_set = tlpy.defect_set.DefectSet( [ self.vo, self.pge ] )
+
+    def test_arrays_are_packed( self ):
+        """Charge states are packed into padded arrays, sorted by charge"""
+        self.assertEqual( self.defect_set.elements, [ 'Ge', 'O', 'P' ] )
+        np.testing.assert_array_equal( self.defect_set.charges, [ [ 0, 1, 2 ], [ 0, 1, 0 ] ] )
+        np.testing.assert_array_equal( self.defect_set.mask, [ [ True, True, True ], [ True, True, False ] ] )
+        np.testing.assert_array_equal( self.defect_set.stoichiometry, [ [ 0, -1, 0 ], [ -1, 0, 1 ] ] )
+        self.assertTrue( np.isinf( self.defect_set.reference_energies[ 1, 2 ] ) )
+
+    def test_mixed_hosts_raise_value_error( self ):
+        """Defects with different hosts cannot be packed into one DefectSet"""
+        other_host = tlpy.host.Host( 0.0, 0.0, 1.0, {}, 0.0 )
+        other = tlpy.defect.Defect( 'X', {}, other_host, 'X' )
+        self.assertRaises( ValueError, tlpy.defect_set.DefectSet, [ self.vo, other ] )
+
+    def test_formation_energies_match_scalar_calculation( self ):
+        """Batched formation energies agree with Defect_Charge_State.formation_energy"""
+        delta_mu = [ { 'Ge' : -4.8746, 'P' : -8.165, 'O' : 0.0 },
+                     { 'Ge' : 0.0, 'P' : -2.0888, 'O' : -2.4332 } ]
+        e_fermi = np.array( [ 0.0, 1.2, 3.5 ] )
+        energies = self.defect_set.formation_energies( e_fermi, delta_mu )
+        self.assertEqual( energies.shape, ( 2, 3, 3, 2 ) )
+        for i, defect in enumerate( [ self.vo, self.pge ] ):
+            for j, q in enumerate( sorted( defect.charge_state ) ):
+                for k, ef in enumerate( e_fermi ):
+                    for m, mu in enumerate( delta_mu ):
+                        self.assertAlmostEqual( energies[ i, j, k, m ], defect.charge_state[ q ].formation_energy( ef, mu ) )
+        self.assertTrue( np.all( np.isinf( energies[ 1, 2 ] ) ) )
+
+    def test_formation_energies_accept_dict_of_arrays( self ):
+        """delta_mu may be given as a dict of arrays"""
+        delta_mu = { 'Ge' : [ -4.8746, 0.0 ], 'P' : [ -8.165, -2.0888 ], 'O' : [ 0.0, -2.4332 ] }
+        energies = self.defect_set.formation_energies( 0.5, delta_mu )
+        self.assertEqual( energies.shape, ( 2, 3, 1, 2 ) )
+        self.assertAlmostEqual( energies[ 0, 0, 0, 1 ], self.vo.charge_state[ 0 ].formation_energy( 0.5, { 'O' : -2.4332 } ) )
+
+    def test_missing_mu_raises_key_error( self ):
+        """Raise KeyError if a chemical potential is missing"""
+        self.assertRaises( KeyError, self.defect_set.formation_energies, 0.0, { 'O' : 0.0 } )
+
+    def test_update_charge_state( self ):
+        """Updating one charge state repacks only that defect's row"""
+        self.defect_set.update_charge_state( 1, +1, -2890.0 )
+        np.testing.assert_array_equal( self.defect_set.row_revisions, [ 0, 1 ] )
+        self.assertEqual( self.defect_set.energies[ 1, 1 ], -2890.0 )
+        self.assertEqual( self.pge.charge_state[ +1 ].energy, -2890.0 )
+        self.assertAlmostEqual( self.defect_set.reference_energies[ 1, 1 ], self.pge.charge_state[ +1 ].relative_formation_energy( 0.0 ) )
+
+    def test_refresh_after_defect_changes( self ):
+        """Changes made through Defect objects are picked up by refresh, growing the arrays if needed"""
+        self.assertEqual( len( self.defect_set.refresh() ), 0 )
+        self.vo.charge_state[ 0 ].energy = -2877.0
+        self.vo.add_charge_state( -1, -2870.0 )
+        self.vo.add_charge_state( +3, -2880.0 )
+        np.testing.assert_array_equal( self.defect_set.refresh(), [ 0 ] )
+        self.assertEqual( self.defect_set.mask.shape, ( 2, 5 ) )
+        np.testing.assert_array_equal( self.defect_set.charges[ 0 ], [ -1, 0, 1, 2, 3 ] )
+        self.assertEqual( self.defect_set.energies[ 0, 1 ], -2877.0 )
+        self.assertTrue( np.all( np.isinf( self.defect_set.reference_energies[ 1, 2: ] ) ) )
+
+    def test_refresh_after_correction_scheme_changes( self ):
+        """Setting the correction scheme of a charge state is picked up by refresh"""
+        self.vo.charge_state[ +2 ].correction_scheme = tlpy.correction.ScaledQuadraticCorrection( 2.0 )
+        np.testing.assert_array_equal( self.defect_set.refresh(), [ 0 ] )
+        self.assertAlmostEqual( self.defect_set.corrections[ 0, 2 ], 8.0 )
+        self.assertAlmostEqual( self.defect_set.reference_energies[ 0, 2 ], self.vo.charge_state[ +2 ].relative_formation_energy( 0.0 ) )
+
+    def test_refresh_after_host_changes( self ):
+        """Changing the host repacks every row"""
+        self.host.vbm = 0.5
+        np.testing.assert_array_equal( self.defect_set.refresh(), [ 0, 1 ] )
+        self.assertAlmostEqual( self.defect_set.reference_energies[ 0, 2 ], self.vo.charge_state[ +2 ].relative_formation_energy( 0.0 ) )
+
+    def test_defects_are_not_changed_by_packing( self ):
+        """Creating a DefectSet leaves the charge states of its defects as they were"""
+        charge_states = dict( self.vo.charge_state )
+        revision = self.vo.revision
+        tlpy.defect_set.DefectSet( [ self.vo, self.pge ] )
+        self.assertEqual( self.vo.charge_state, charge_states )
+        self.assertEqual( self.vo.revision, revision )
+        self.assertIs( self.vo.charge_state[ 1 ].defect, self.vo )
+        self.assertEqual( self.vo.charge_state[ 1 ].energy, -2877.36415986 )
+
+    def test_pickled_defects_keep_their_charge_states( self ):
+        """After unpickling, charge states still belong to their Defect, and changes to them update it"""
+        vo = pickle.loads( pickle.dumps( self.vo ) )
+        self.assertIs( vo.charge_state[ 1 ].defect, vo )
+        self.assertIs( vo.charge_state[ 1 ].host, vo.host )
+        revision = vo.revision
+        vo.charge_state[ 1 ].energy = -2878.0
+        self.assertEqual( vo.revision, revision + 1 )
+        self.assertAlmostEqual( vo.charge_state[ 1 ].relative_formation_energy( 0.0 ),
+                                self.vo.charge_state[ 1 ].relative_formation_energy( 0.0 ) - 2878.0 + 2877.36415986 )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+import tlpy.envelope
+import numpy as np
+
+class EnvelopeTestCase( unittest.TestCase ):
+    """Test for `envelope.py`"""
+
+    def test_lower_envelope( self ):
+        """Lower envelope of three lines, where the middle line is never lowest"""
+        hull, breakpoints = tlpy.envelope.lower_envelope( [ 1, 0, -1 ], [ 0.0, 2.0, 2.0 ] )
+        np.testing.assert_array_equal( hull, [ 0, 2 ] )
+        self.assertTrue( np.allclose( breakpoints, [ 1.0 ] ) )
+
+    def test_lower_envelope_parallel_lines( self ):
+        """Only the lowest of a set of parallel lines is kept"""
+        hull, breakpoints = tlpy.envelope.lower_envelope( [ 1, 1, -1 ], [ 1.0, 0.0, 2.0 ] )
+        np.testing.assert_array_equal( hull, [ 1, 2 ] )
+        self.assertTrue( np.allclose( breakpoints, [ 1.0 ] ) )
+
+    def test_lower_envelope_matches_brute_force( self ):
+        """Lower envelope agrees with a brute force minimum over randomly generated lines"""
+        rng = np.random.RandomState( 0 )
+        slopes = np.arange( -5, 4 )
+        intercepts = rng.uniform( -3.0, 3.0, size = len( slopes ) )
+        hull, breakpoints = tlpy.envelope.lower_envelope( slopes, intercepts )
+        self.assertTrue( np.all( np.diff( breakpoints ) > 0.0 ) )
+        x = np.linspace( -10.0, 10.0, 1001 )
+        brute_force = np.min( intercepts[ :, np.newaxis ] + slopes[ :, np.newaxis ] * x, axis = 0 )
+        segment = np.searchsorted( breakpoints, x )
+        envelope = intercepts[ hull[ segment ] ] + slopes[ hull[ segment ] ] * x
+        self.assertTrue( np.allclose( envelope, brute_force ) )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+import warnings
+import tlpy.defect
+import tlpy.defect_set
+import tlpy.fermi_level
+import tlpy.host
+import numpy as np
+
+class FermiLevelTestCase( unittest.TestCase ):
+    """Test for `fermi_level.py`"""
+
+    def setUp( self ):
+        elemental_energies = { 'Ge' : -4.48604,
+                               'P'  : -5.18405,
+                               'O'  : -4.54934575 }
+
+        self.host = tlpy.host.Host( energy = -2884.79313425,
+                                    vbm = 0.4657,
+                                    cbm = 4.0154,
+                                    elemental_energies = elemental_energies,
+                                    correction_scaling = 0.099720981 )
+
+        vo = tlpy.defect.Defect( 'V_O1', { 'O' : -1 }, self.host, 'O' )
+        vo.add_charge_state(  0, -2876.05861202 )
+        vo.add_charge_state( +1, -2877.36415986 )
+        vo.add_charge_state( +2, -2880.33856625 )
+
+        oi = tlpy.defect.Defect( 'O_i', { 'O' : +1 }, self.host, 'i' )
+        oi.add_charge_state(  0, -2887.757 )
+        oi.add_charge_state( -1, -2885.340 )
+        oi.add_charge_state( -2, -2882.347 )
+
+        self.defects = [ vo, oi ]
+        self.site_densities = { 'O' : 4.0e22, 'i' : 1.0e22 }
+        self.delta_mu = [ { 'O' : 0.0 }, { 'O' : -1.5 }, { 'O' : -2.4332 } ]
+        self.temperature = np.array( [ 300.0, 800.0, 1500.0 ] )
+
+    def net_charge( self, e_fermi, delta_mu, temperature ):
+        kT = tlpy.fermi_level.BOLTZMANN_CONSTANT * temperature
+        charge = 0.0
+        for d in self.defects:
+            for cs in d.charge_state.values():
+                charge += cs.charge * self.site_densities[ d.site ] * np.exp( -cs.formation_energy( e_fermi, delta_mu ) / kT )
+        n, p = tlpy.fermi_level.carrier_concentrations( self.host, e_fermi, temperature )
+        return charge + p - n
+
+    def test_self_consistent_fermi_energy_shape( self ):
+        """Fermi energies and concentrations are returned for every condition"""
+        e_fermi, concentrations = tlpy.fermi_level.self_consistent_fermi_energy( self.defects, self.host, self.delta_mu,
+                                                                                 self.temperature, self.site_densities )
+        self.assertEqual( e_fermi.shape, ( 3, 3 ) )
+        self.assertEqual( concentrations.shape, ( 2, 3, 3, 3 ) )
+
+    def test_self_consistent_fermi_energy_is_charge_neutral( self ):
+        """The net charge changes sign across each self-consistent Fermi energy"""
+        e_fermi, _ = tlpy.fermi_level.self_consistent_fermi_energy( self.defects, self.host, self.delta_mu,
+                                                                    self.temperature, self.site_densities, tolerance = 1e-10 )
+        for i, mu in enumerate( self.delta_mu ):
+            for j, t in enumerate( self.temperature ):
+                self.assertGreater( self.net_charge( e_fermi[ i, j ] - 1e-6, mu, t ), 0.0 )
+                self.assertLess( self.net_charge( e_fermi[ i, j ] + 1e-6, mu, t ), 0.0 )
+
+    def test_fermi_energy_without_concentrations( self ):
+        """With return_concentrations = False, the same Fermi energies are found, and no concentrations are returned"""
+        expected, _ = tlpy.fermi_level.self_consistent_fermi_energy( self.defects, self.host, self.delta_mu,
+                                                                     self.temperature, self.site_densities )
+        e_fermi, concentrations = tlpy.fermi_level.self_consistent_fermi_energy( self.defects, self.host, self.delta_mu,
+                                                                                 self.temperature, self.site_densities,
+                                                                                 return_concentrations = False )
+        self.assertIsNone( concentrations )
+        np.testing.assert_array_equal( e_fermi, expected )
+
+    def test_conditions_without_a_solution_are_pinned( self ):
+        """Conditions without a charge neutral Fermi energy in range are pinned at the bounds, flagged, and warned about"""
+        with warnings.catch_warnings():
+            warnings.simplefilter( 'error' )
+            e_fermi, _, pinned = tlpy.fermi_level.self_consistent_fermi_energy( self.defects, self.host, self.delta_mu, self.temperature,
+                                                                                self.site_densities, return_pinned = True )
+        self.assertFalse( np.any( pinned ) )
+        for ef_min, ef_max, bound in [ ( 0.0, e_fermi[ 0, 0 ] - 0.1, e_fermi[ 0, 0 ] - 0.1 ),
+                                       ( e_fermi[ 0, 0 ] + 0.1, self.host.fundamental_gap, e_fermi[ 0, 0 ] + 0.1 ) ]:
+            with self.assertWarns( RuntimeWarning ):
+                pinned_e_fermi, _, pinned = tlpy.fermi_level.self_consistent_fermi_energy( self.defects, self.host, self.delta_mu[0], 300.0,
+                                                                                           self.site_densities, ef_min = ef_min, ef_max = ef_max,
+                                                                                           return_pinned = True )
+            self.assertTrue( pinned[ 0, 0 ] )
+            self.assertEqual( pinned_e_fermi[ 0, 0 ], bound )
+
+    def test_fermi_energy_without_defects( self ):
+        """Without defects, the Fermi energy lies at midgap for equal effective masses"""
+        e_fermi, _ = tlpy.fermi_level.self_consistent_fermi_energy( [], self.host, {}, 300.0, {} )
+        self.assertAlmostEqual( e_fermi[ 0, 0 ], self.host.fundamental_gap / 2.0, places = 6 )
+
+    def test_missing_site_density_raises_key_error( self ):
+        """Raise KeyError if a site density is missing"""
+        self.assertRaises( KeyError, tlpy.fermi_level.self_consistent_fermi_energy, self.defects, self.host,
+                           self.delta_mu, self.temperature, { 'O' : 4.0e22 } )
+
+    def parabolic_dos_host( self ):
+        """A copy of self.host, with the density of states for free-electron-mass parabolic bands"""
+        g0 = 6.8125e21 # states / eV^(3/2) / cm^3, for m* = m_e
+        energies = np.arange( self.host.vbm - 1.0, self.host.cbm + 1.0, 0.001 )
+        dos = g0 * ( np.sqrt( np.clip( energies - self.host.cbm, 0.0, None ) ) + np.sqrt( np.clip( self.host.vbm - energies, 0.0, None ) ) )
+        return tlpy.host.Host( self.host.energy, self.host.vbm, self.host.cbm, self.host.elemental_energies,
+                               self.host.correction_scaling, dos = np.stack( ( energies, dos ), axis = 1 ) )
+
+    def test_carrier_table_matches_parabolic_bands( self ):
+        """Carrier concentrations from a parabolic band DOS agree with the effective mass expressions"""
+        host = self.parabolic_dos_host()
+        table = tlpy.fermi_level.CarrierTable( host, self.temperature )
+        e_fermi = np.array( [ [ 1.0 ], [ 1.7777 ], [ 2.5 ] ] )
+        log_n, log_p = table.log_carrier_concentrations( e_fermi, self.temperature )
+        expected_n, expected_p = tlpy.fermi_level.log_carrier_concentrations( self.host, e_fermi, self.temperature )
+        np.testing.assert_allclose( log_n, expected_n, atol = 2e-3 )
+        np.testing.assert_allclose( log_p, expected_p, atol = 2e-3 )
+
+    def test_self_consistent_fermi_energy_with_dos( self ):
+        """The solver uses the host DOS when one is given"""
+        expected, _ = tlpy.fermi_level.self_consistent_fermi_energy( self.defects, self.host, self.delta_mu, self.temperature, self.site_densities )
+        host = self.parabolic_dos_host()
+        defects = tlpy.defect_set.DefectSet.from_arrays( host, **tlpy.defect_set.DefectSet( self.defects ).arrays() )
+        e_fermi, _ = tlpy.fermi_level.self_consistent_fermi_energy( defects, host, self.delta_mu, self.temperature,
+                                                                    self.site_densities )
+        np.testing.assert_allclose( e_fermi, expected, atol = 1e-3 )
+
+    def test_carrier_table_requires_dos( self ):
+        """Raise ValueError if the host has no density of states"""
+        self.assertRaises( ValueError, tlpy.fermi_level.CarrierTable, self.host, 300.0 )
+
+if __name__ == '__main__':
+    unittest.main()
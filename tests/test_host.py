@@ -1,4 +1,5 @@
 import unittest
+import pickle
 import tlpy.host
 
 class HostTestCase( unittest.TestCase ):
@@ -28,6 +29,23 @@ class HostTestCase( unittest.TestCase ):
         self.assertEqual( self.host.elemental_energies, self.elemental_energies )
         self.assertEqual( self.host.correction_scaling, self.correction_scaling )
         self.assertEqual( self.host.fundamental_gap, self.cbm - self.vbm )
+        self.assertEqual( self.host.site_densities, None )
+
+    def test_revision_is_incremented_when_attributes_change( self ):
+        """Setting a Host attribute increments Host.revision"""
+        revision = self.host.revision
+        self.host.vbm = 0.5
+        self.assertEqual( self.host.revision, revision + 1 )
+
+    def test_host_is_slotted_and_picklable( self ):
+        """Host attributes are held in slots, and survive pickling"""
+        self.assertFalse( hasattr( self.host, '__dict__' ) )
+        host = pickle.loads( pickle.dumps( self.host ) )
+        self.assertEqual( host.elemental_energies, self.elemental_energies )
+        self.assertEqual( host.fundamental_gap, self.cbm - self.vbm )
+        revision = host.revision
+        host.vbm = 0.5
+        self.assertEqual( host.revision, revision + 1 )
 
 if __name__ == '__main__':
     unittest.main()
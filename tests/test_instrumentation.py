@@ -0,0 +1,71 @@
+import unittest
+import io
+import tlpy.defect
+import tlpy.defect_charge_state
+import tlpy.host
+import tlpy.instrumentation
+from tlpy.instrumentation import Instrumentation
+
+class InstrumentationTestCase( unittest.TestCase ):
+    """Test for `instrumentation.py`"""
+
+    def setUp( self ):
+        elemental_energies = { 'Ge' : -4.48604,
+                               'P'  : -5.18405,
+                               'O'  : -4.54934575 }
+
+        self.host = tlpy.host.Host( energy = -2884.79313425,
+                                    vbm = 0.4657,
+                                    cbm = 4.0154,
+                                    elemental_energies = elemental_energies,
+                                    correction_scaling = 0.099720981 )
+
+        self.defect = tlpy.defect.Defect( 'V_O1', { 'O' : -1 }, self.host, 'O' )
+        self.defect.add_charge_state(  0, -2876.05861202 )
+        self.defect.add_charge_state( +1, -2877.36415986 )
+        self.defect.add_charge_state( +2, -2880.33856625 )
+        self.delta_mu = { 'O' : 0.0 }
+
+    def test_calls_are_counted_per_method_and_defect( self ):
+        """Calls are counted for each method, and attributed to the calling defect"""
+        with Instrumentation() as stats:
+            self.defect.transition_level( 2, 0, self.delta_mu )
+            self.defect.transition_level( 1, 0, self.delta_mu )
+        self.assertEqual( stats.calls( 'Defect.transition_level' ), 2 )
+        self.assertEqual( stats.calls( 'Defect_Charge_State.formation_energy', defect = 'V_O1' ), 4 )
+        self.assertEqual( stats.calls( 'Defect_Charge_State.correction' ), 4 )
+        self.assertEqual( stats.calls( defect = 'other' ), 0 )
+        self.assertGreaterEqual( stats.time( 'Defect.transition_level' ), stats.time( 'Defect_Charge_State.formation_energy' ) )
+
+    def test_methods_are_restored( self ):
+        """The original methods are restored when the context exits, so later calls are not recorded"""
+        original = tlpy.defect_charge_state.Defect_Charge_State.__dict__[ 'formation_energy' ]
+        correction = tlpy.defect_charge_state.Defect_Charge_State.__dict__[ 'correction' ]
+        with Instrumentation() as stats:
+            self.defect.tl_profile( self.delta_mu, 0.0, 3.0 )
+        self.defect.tl_profile( self.delta_mu, 0.0, 3.0 )
+        self.assertEqual( stats.calls( 'Defect.tl_profile' ), 1 )
+        self.assertIs( tlpy.defect_charge_state.Defect_Charge_State.__dict__[ 'formation_energy' ], original )
+        self.assertIs( tlpy.defect_charge_state.Defect_Charge_State.__dict__[ 'correction' ], correction )
+
+    def test_custom_targets( self ):
+        """Only the requested methods are instrumented"""
+        with Instrumentation( targets = [ ( tlpy.defect.Defect, 'lower_envelope' ) ] ) as stats:
+            self.defect.lower_envelope()
+            self.defect.tl_profile( self.delta_mu, 0.0, 3.0 )
+        self.assertEqual( list( stats.by_method() ), [ 'Defect.lower_envelope' ] )
+
+    def test_report_and_csv( self ):
+        """Records are exported as a text report and as CSV"""
+        with Instrumentation() as stats:
+            self.defect.xmgrace_output( self.delta_mu )
+        self.assertIn( 'Defect.xmgrace_output', stats.report() )
+        f = io.StringIO()
+        stats.write_csv( f )
+        lines = f.getvalue().splitlines()
+        self.assertEqual( lines[0], 'defect,method,calls,time' )
+        self.assertEqual( len( lines ), len( stats.records ) + 1 )
+        self.assertTrue( any( line.startswith( 'V_O1,Defect.xmgrace_output,1,' ) for line in lines ) )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import io
+import tlpy.defect
+import tlpy.defect_set
+import tlpy.host
+import tlpy.output
+import numpy as np
+
+class OutputTestCase( unittest.TestCase ):
+    """Test for `output.py`"""
+
+    def setUp( self ):
+        elemental_energies = { 'Ge' : -4.48604,
+                               'P'  : -5.18405,
+                               'O'  : -4.54934575 }
+
+        self.host = tlpy.host.Host( energy = -2884.79313425,
+                                    vbm = 0.4657,
+                                    cbm = 4.0154,
+                                    elemental_energies = elemental_energies,
+                                    correction_scaling = 0.099720981 )
+
+        vo = tlpy.defect.Defect( 'V_O1', { 'O' : -1 }, self.host, 'O' )
+        vo.add_charge_state(  0, -2876.05861202 )
+        vo.add_charge_state( +1, -2877.36415986 )
+        vo.add_charge_state( +2, -2880.33856625 )
+
+        oi = tlpy.defect.Defect( 'O_i', { 'O' : +1 }, self.host, 'i' )
+        oi.add_charge_state(  0, -2887.757 )
+        oi.add_charge_state( -1, -2885.340 )
+        oi.add_charge_state( -2, -2882.347 )
+
+        self.defects = [ vo, oi ]
+        self.delta_mu_sets = { 'A' : { 'O' : 0.0 }, 'C' : { 'O' : -2.4373 } }
+
+    def test_iter_profiles( self ):
+        """Profiles are generated for every defect and chemical potential set"""
+        profiles = list( tlpy.output.iter_profiles( self.defects, self.delta_mu_sets ) )
+        self.assertEqual( [ ( n, l ) for n, l, _ in profiles ], [ ( 'V_O1', 'A' ), ( 'V_O1', 'C' ), ( 'O_i', 'A' ), ( 'O_i', 'C' ) ] )
+        self.assertTrue( np.allclose( profiles[3][2], self.defects[1].tl_profile( { 'O' : -2.4373 }, 0.0, self.host.fundamental_gap ) ) )
+
+    def test_write_xmgrace( self ):
+        """Multi-set xmgrace output"""
+        f = io.StringIO()
+        tlpy.output.write_xmgrace( f, self.defects[:1], [ { 'O' : 0.0 } ], ef_max = 3.0, fmt = '%.4f' )
+        self.assertEqual( f.getvalue(), "# V_O1 0\n0.0000 1.2355\n1.4748 4.1852\n3.0000 4.1852\n&\n" )
+
+    def test_write_csv( self ):
+        """CSV output"""
+        f = io.StringIO()
+        tlpy.output.write_csv( f, self.defects[:1], self.delta_mu_sets, ef_max = 3.0, fmt = '%.4f' )
+        lines = f.getvalue().splitlines()
+        self.assertEqual( lines[0], 'defect,label,e_fermi,formation_energy' )
+        self.assertEqual( lines[1], 'V_O1,A,0.0000,1.2355' )
+        self.assertEqual( len( lines ), 7 )
+
+    def test_write_binary_round_trip( self ):
+        """Binary output can be read back"""
+        f = io.BytesIO()
+        tlpy.output.write_binary( f, self.defects, self.delta_mu_sets )
+        f.seek( 0 )
+        records = list( tlpy.output.read_binary( f ) )
+        self.assertEqual( len( records ), 4 )
+        self.assertEqual( records[2][ 'defect' ][0], 'O_i' )
+        expected = self.defects[1].tl_profile( { 'O' : 0.0 }, 0.0, self.host.fundamental_gap )
+        self.assertTrue( np.allclose( records[2][ 'e_fermi' ], expected[ :, 0 ] ) )
+        self.assertTrue( np.allclose( records[2][ 'formation_energy' ], expected[ :, 1 ] ) )
+
+    def test_defect_set_profiles_do_not_build_defects( self ):
+        """Profiles for a DefectSet are calculated from its packed arrays, without building Defect objects"""
+        defect_set = tlpy.defect_set.DefectSet.from_arrays( self.host, **tlpy.defect_set.DefectSet( self.defects ).arrays() )
+        f = io.StringIO()
+        tlpy.output.write_csv( f, defect_set, self.delta_mu_sets )
+        self.assertEqual( defect_set._defects, [ None, None ] )
+        expected = io.StringIO()
+        tlpy.output.write_csv( expected, self.defects, self.delta_mu_sets )
+        self.assertEqual( f.getvalue(), expected.getvalue() )
+
+if __name__ == '__main__':
+    unittest.main()
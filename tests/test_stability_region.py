@@ -0,0 +1,107 @@
+import unittest
+import itertools
+import tlpy.stability_region
+import numpy as np
+
+class StabilityRegionTestCase( unittest.TestCase ):
+    """Test for `stability_region.py`"""
+
+    def setUp( self ):
+        self.elemental_energies = { 'Mg' : -1.5, 'O' : -4.9, 'Si' : -5.4 }
+        # formation enthalpies: MgO -6.0, SiO2 -9.0, Mg2SiO4 -21.5
+        self.competing_phases = { 'MgO'  : ( { 'Mg' : 1, 'O' : 1 }, -12.4 ),
+                                  'SiO2' : ( { 'Si' : 1, 'O' : 2 }, -24.2 ) }
+        self.region = tlpy.stability_region.StabilityRegion( { 'Mg' : 2, 'Si' : 1, 'O' : 4 }, -49.5,
+                                                             self.elemental_energies, self.competing_phases )
+
+    def test_formation_enthalpy( self ):
+        """Formation enthalpy relative to the elemental reference energies"""
+        self.assertAlmostEqual( tlpy.stability_region.formation_enthalpy( { 'Mg' : 1, 'O' : 1 }, -12.4, self.elemental_energies ), -6.0 )
+        self.assertAlmostEqual( self.region.formation_enthalpy, -21.5 )
+
+    def test_binary_vertices( self ):
+        """A binary host with no competing phases is stable between the two elemental limits"""
+        region = tlpy.stability_region.StabilityRegion( { 'Mg' : 1, 'O' : 1 }, -12.4, self.elemental_energies, {} )
+        self.assertEqual( region.elements, [ 'Mg', 'O' ] )
+        self.assertTrue( np.allclose( sorted( region.vertices.tolist() ), [ [ -6.0, 0.0 ], [ 0.0, -6.0 ] ] ) )
+
+    def test_ternary_vertices( self ):
+        """Vertices lie on the host plane, satisfy every constraint, and at least two constraints are active at each"""
+        vertices = self.region.vertices
+        self.assertEqual( vertices.shape[1], 3 )
+        self.assertTrue( len( vertices ) >= 3 )
+        self.assertTrue( np.all( self.region.contains( vertices ) ) )
+        active = np.isclose( np.dot( vertices, self.region.constraints.T ), self.region.bounds )
+        self.assertTrue( np.all( active.sum( axis = 1 ) >= 2 ) )
+        # Mg2SiO4 vs. 2 MgO + SiO2: delta_H = -21.5 - ( -12.0 - 9.0 ) < 0, so the MgO and SiO2 limits are both reached.
+        self.assertTrue( np.any( active[ :, 3 ] ) )
+        self.assertTrue( np.any( active[ :, 4 ] ) )
+
+    def test_vertices_as_dicts( self ):
+        """Vertices are returned as delta_mu dicts"""
+        vertices = self.region.vertices_as_dicts()
+        self.assertEqual( len( vertices ), len( self.region.vertices ) )
+        self.assertEqual( sorted( vertices[0] ), [ 'Mg', 'O', 'Si' ] )
+
+    def test_sample( self ):
+        """Sampled points lie inside the stability region"""
+        samples = self.region.sample( 1000, seed = 0 )
+        self.assertEqual( samples.shape, ( 1000, 3 ) )
+        self.assertTrue( np.all( self.region.contains( samples ) ) )
+
+    def test_unknown_element_raises_value_error( self ):
+        """Raise ValueError if a competing phase contains an element not in the host"""
+        self.assertRaises( ValueError, tlpy.stability_region.StabilityRegion, { 'Mg' : 1, 'O' : 1 }, -12.4,
+                           self.elemental_energies, self.competing_phases )
+
+    def test_empty_region( self ):
+        """An unstable host has no vertices, and cannot be sampled"""
+        region = tlpy.stability_region.StabilityRegion( { 'Mg' : 2, 'Si' : 1, 'O' : 4 }, -48.5,
+                                                        self.elemental_energies, self.competing_phases )
+        self.assertEqual( len( region.vertices ), 0 )
+        self.assertRaises( ValueError, region.sample, 10 )
+
+    def test_phases_that_are_never_limiting_do_not_change_vertices( self ):
+        """Competing phases that cannot be active anywhere on the host plane do not change the vertices"""
+        phases = dict( self.competing_phases )
+        for i in range( 200 ):
+            phases[ 'X{}'.format( i ) ] = ( { 'Mg' : 1 + i % 3, 'Si' : 1, 'O' : 1 + i % 5 }, 0.0 )
+        region = tlpy.stability_region.StabilityRegion( { 'Mg' : 2, 'Si' : 1, 'O' : 4 }, -49.5, self.elemental_energies, phases )
+        self.assertTrue( np.allclose( region.vertices, self.region.vertices ) )
+
+    def test_vertices_match_every_combination_of_constraints( self ):
+        """The vertices are the feasible solutions for every combination of (n_elements - 1) constraint planes"""
+        rng = np.random.RandomState( 0 )
+        elements = [ 'A', 'B', 'C', 'D' ]
+        phases = {}
+        for i in range( 12 ):
+            composition = { e : int( n ) for e, n in zip( elements, rng.randint( 0, 3, 4 ) ) if n > 0 }
+            phases[ 'P{}'.format( i ) ] = ( composition, -2.0 * sum( composition.values() ) * rng.uniform( 0.3, 0.8 ) )
+        region = tlpy.stability_region.StabilityRegion( { e : 1 for e in elements }, -8.0, { e : 0.0 for e in elements }, phases )
+        expected = []
+        for combination in itertools.combinations( range( len( region.constraints ) ), 3 ):
+            a = np.vstack( ( region.host_composition, region.constraints[ list( combination ) ] ) )
+            b = np.concatenate( ( [ region.formation_enthalpy ], region.bounds[ list( combination ) ] ) )
+            if abs( np.linalg.det( a ) ) > 1e-8:
+                point = np.linalg.solve( a, b )
+                if region.contains( point )[0]:
+                    expected.append( tuple( np.round( point, 6 ) ) )
+        self.assertTrue( len( region.vertices ) > 4 )
+        self.assertEqual( sorted( set( expected ) ), sorted( tuple( np.round( v, 6 ) ) for v in region.vertices ) )
+
+    def test_non_positive_host_composition_raises_value_error( self ):
+        """Raise ValueError if the host composition is not positive for every element"""
+        self.assertRaises( ValueError, tlpy.stability_region.StabilityRegion, { 'Mg' : 1, 'O' : 0 }, -12.4,
+                           self.elemental_energies, {} )
+
+    def test_sample_zero_volume_region( self ):
+        """A stability region with zero volume has vertices, but sampling stops after max_batches batches"""
+        # 2 MgO + SiO2 has the same energy as Mg2SiO4, so both phases are limiting everywhere in the stability region.
+        phases = { 'MgO'  : ( { 'Mg' : 1, 'O' : 1 }, -12.4 ),
+                   'SiO2' : ( { 'Si' : 1, 'O' : 2 }, -24.7 ) }
+        region = tlpy.stability_region.StabilityRegion( { 'Mg' : 2, 'Si' : 1, 'O' : 4 }, -49.5, self.elemental_energies, phases )
+        self.assertEqual( len( region.vertices ), 2 )
+        self.assertRaises( ValueError, region.sample, 1000, seed = 0, batch_size = 1000, max_batches = 5 )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+import tlpy.defect
+import tlpy.host
+import tlpy.uncertainty
+import numpy as np
+
+class UncertaintyTestCase( unittest.TestCase ):
+    """Test for `uncertainty.py`"""
+
+    def setUp( self ):
+        elemental_energies = { 'Ge' : -4.48604,
+                               'P'  : -5.18405,
+                               'O'  : -4.54934575 }
+
+        self.host = tlpy.host.Host( energy = -2884.79313425,
+                                    vbm = 0.4657,
+                                    cbm = 4.0154,
+                                    elemental_energies = elemental_energies,
+                                    correction_scaling = 0.099720981 )
+
+        self.defect = tlpy.defect.Defect( 'V_O1', { 'O' : -1 }, self.host, 'O' )
+        self.defect.add_charge_state(  0, -2876.05861202 )
+        self.defect.add_charge_state( +1, -2877.36415986 )
+        self.defect.add_charge_state( +2, -2880.33856625 )
+
+    def test_zero_error_reproduces_transition_levels( self ):
+        """Without any errors, every sample equals Defect.transition_level"""
+        pairs, levels, on_envelope = tlpy.uncertainty.sample_transition_levels( self.defect, 10 )
+        self.assertEqual( pairs, [ ( 2, 1 ), ( 2, 0 ), ( 1, 0 ) ] )
+        for k, ( q1, q2 ) in enumerate( pairs ):
+            self.assertTrue( np.allclose( levels[ :, k ], self.defect.transition_level( q1, q2, { 'O' : 0.0 } )[0] ) )
+        np.testing.assert_array_equal( on_envelope[0], [ False, True, False ] )
+
+    def test_vbm_error_shifts_levels( self ):
+        """An error in the VBM shifts every transition level by the same amount"""
+        pairs, levels, _ = tlpy.uncertainty.sample_transition_levels( self.defect, 1000, vbm_error = 0.1, seed = 0 )
+        shifts = levels - levels.mean( axis = 0 )
+        self.assertTrue( np.allclose( shifts, shifts[ :, :1 ] ) )
+        self.assertAlmostEqual( np.std( levels[ :, 0 ] ), 0.1, places = 2 )
+
+    def test_callable_and_per_charge_errors( self ):
+        """Errors can be given as callables, or separately for each charge"""
+        charges, intercepts = tlpy.uncertainty.sample_intercepts( self.defect, 100,
+                                                                  energy_error = { 0 : lambda rng, size : np.full( size, 0.5 ) } )
+        np.testing.assert_array_equal( charges, [ 2, 1, 0 ] )
+        expected = [ self.defect.charge_state[ q ].relative_formation_energy( 0.0 ) for q in charges ]
+        self.assertTrue( np.allclose( intercepts - expected, [ 0.0, 0.0, 0.5 ] ) )
+
+    def test_confidence_intervals( self ):
+        """Confidence intervals of normally distributed levels"""
+        _, levels, on_envelope = tlpy.uncertainty.sample_transition_levels( self.defect, 100000, energy_error = 0.05, seed = 1 )
+        lower, median, upper = tlpy.uncertainty.confidence_intervals( levels, 0.95 )
+        # e(2/0) has a standard deviation of sqrt( 2 ) * 0.05 / 2
+        self.assertAlmostEqual( median[1], 1.474835153, places = 2 )
+        self.assertAlmostEqual( upper[1] - lower[1], 2 * 1.96 * np.sqrt( 2 ) * 0.05 / 2, places = 2 )
+        lower, median, upper = tlpy.uncertainty.confidence_intervals( levels, mask = on_envelope )
+        self.assertAlmostEqual( median[1], 1.474835153, places = 2 )
+        self.assertGreater( on_envelope[ :, 1 ].mean(), 0.9 )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import numpy as np
+
+def is_single_point( delta_mu ):
+    """Returns True if a set of elemental chemical potentials describes a single chemical potential point,
+       i.e. a dict with a scalar value for each element, e.g. { 'O' : -0.345 }.
+
+    Args:
+        delta_mu (dict, list(dict), or np.array): elemental chemical potentials.
+
+    Returns:
+        bool"""
+    return isinstance( delta_mu, dict ) and all( np.ndim( v ) == 0 for v in delta_mu.values() )
+
+def delta_mu_array( delta_mu, elements ):
+    """Converts a set of elemental chemical potentials into an array of chemical potential points.
+
+    Args:
+        delta_mu (dict, list(dict), or np.array): elemental chemical potentials. One of:
+            a single dict, e.g. { 'O' : -0.345 };
+            a dict of equal-length arrays, e.g. { 'O' : [ 0.0, -0.345 ] };
+            a list of dicts, e.g. [ { 'O' : 0.0 }, { 'O' : -0.345 } ];
+            an array with shape (n_points, n_elements), with columns ordered as `elements`.
+        elements (list(str)): the elements to extract, in column order.
+
+    Returns:
+        np.array: chemical potentials with shape (n_points, n_elements).
+
+    Raises:
+        KeyError: if a chemical potential is missing for any element in `elements`."""
+    if isinstance( delta_mu, dict ):
+        if not elements:
+            n_points = max( [ np.size( v ) for v in delta_mu.values() ] + [ 1 ] )
+            return np.zeros( ( n_points, 0 ) )
+        columns = np.broadcast_arrays( *[ np.atleast_1d( np.asarray( delta_mu[ e ], dtype = float ) ) for e in elements ] )
+        return np.stack( [ c.ravel() for c in columns ], axis = 1 )
+    if isinstance( delta_mu, ( list, tuple ) ) and all( isinstance( d, dict ) for d in delta_mu ):
+        return np.array( [ [ d[ e ] for e in elements ] for d in delta_mu ], dtype = float ).reshape( len( delta_mu ), len( elements ) )
+    delta_mu = np.asarray( delta_mu, dtype = float )
+    if delta_mu.shape[-1] != len( elements ):
+        raise ValueError( 'delta_mu array has {} columns, but {} elements were expected'.format( delta_mu.shape[-1], len( elements ) ) )
+    return delta_mu.reshape( -1, len( elements ) )
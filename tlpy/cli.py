@@ -0,0 +1,225 @@
+"""
+Command line batch runner for defect studies.
+
+    tlpy study.json [more_studies.json ...] [--workers N] [--chunk-size N] [--output DIR]
+
+Each study is a JSON file describing a host, its defects, a set of labelled chemical potential
+limits, and a temperature grid:
+
+    { "name"        : "germanate",
+      "host"        : { "energy" : -2884.79313425, "vbm" : 0.4657, "cbm" : 4.0154,
+                        "elemental_energies" : { "Ge" : -4.48604, "P" : -5.18405, "O" : -4.54934575 },
+                        "correction_scaling" : 0.099720981,
+                        "site_densities" : { "O" : 4.2e22 },
+                        "dos" : [ [ -10.0, 3.1e22 ], [ -9.99, 3.2e22 ], ... ] },
+      "defects"     : [ { "name" : "V_O1", "site" : "O", "stoichiometry" : { "O" : -1 },
+                          "charge_states" : [ { "charge" : 0, "energy" : -2876.05861202 },
+                                              { "charge" : 1, "energy" : -2877.36415986, "degeneracy" : 2 } ] } ],
+      "limits"      : { "A" : { "Ge" : -4.8746, "P" : -8.165, "O" : 0.0 }, ... },
+      "temperatures" : [ 300.0, 600.0, 900.0 ],
+      "output"      : "results" }
+
+Instead of "defects" a study may give "database", the path to a defect database directory
+(see tlpy.database), in which case the host is read from the database. "output", "chunk_size",
+"electron_dos_mass" and "hole_dos_mass" are optional, as are the host "site_densities" and "dos"
+(see tlpy.host.Host).
+
+The chemical potential limits of every study are split into chunks, and each chunk is one task
+for a pool of worker processes. The packed defect arrays for every study are sent to each worker
+once, when the worker starts (databases are memory-mapped by each worker instead), so each task
+only carries its chemical potentials. Each worker writes the result for its chunk to
+<output>/<name>_<chunk>.npz as soon as it is finished. Every result file holds the arrays:
+
+    names, charges, mask    the packed defects (see tlpy.defect_set.DefectSet)
+    labels, elements, delta_mu, temperatures
+    intercepts              formation energies at E_Fermi = 0, (n_defects, n_charge_states, n_limits)
+    e_fermi                 self-consistent Fermi energies, (n_limits, n_temperatures)
+    concentrations          charge state concentrations at e_fermi, (n_defects, n_charge_states, n_limits, n_temperatures)
+    pinned                  True where charge neutrality has no solution in the band gap, and e_fermi is pinned
+                            at the VBM or CBM, (n_limits, n_temperatures)
+
+e_fermi, concentrations and pinned are only written if the host defines site densities.
+"""
+
+from tlpy.chemical_potential import delta_mu_array
+from tlpy.database import load_defect_set
+from tlpy.defect import Defect
+from tlpy.defect_set import DefectSet
+from tlpy.fermi_level import CarrierTable, self_consistent_fermi_energy
+from tlpy.host import Host
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+_worker_studies = {}
+_worker_carrier_tables = {}
+
+def read_study( filename ):
+    """Reads a study specification from a JSON file.
+
+    Args:
+        filename (str): path to the JSON study file.
+
+    Returns:
+        dict: the study, with its defects packed into a DefectSet under the key 'defect_set'.
+
+    Raises:
+        KeyError: if a required entry is missing."""
+    with open( filename ) as f:
+        study = json.load( f )
+    study.setdefault( 'name', os.path.splitext( os.path.basename( filename ) )[0] )
+    if 'database' in study:
+        path = os.path.join( os.path.dirname( os.path.abspath( filename ) ), study[ 'database' ] )
+        study[ 'database' ] = path
+        study[ 'defect_set' ] = load_defect_set( path )
+    else:
+        host = Host( **study[ 'host' ] )
+        defects = []
+        for d in study[ 'defects' ]:
+            defect = Defect( d[ 'name' ], d[ 'stoichiometry' ], host, d[ 'site' ] )
+            for cs in d[ 'charge_states' ]:
+                defect.add_charge_state( cs[ 'charge' ], cs[ 'energy' ], cs.get( 'degeneracy', 1 ) )
+            defects.append( defect )
+        study[ 'defect_set' ] = DefectSet( defects )
+    return study
+
+def _host_parameters( host ):
+    return { 'energy'             : host.energy,
+             'vbm'                : host.vbm,
+             'cbm'                : host.cbm,
+             'elemental_energies' : dict( host.elemental_energies ),
+             'correction_scaling' : host.correction_scaling,
+             'site_densities'     : host.site_densities,
+             'dos'                : host.dos }
+
+def _packed_study( study ):
+    """The part of a study that is sent to each worker: either the database path, or the host parameters and packed arrays."""
+    if 'database' in study:
+        return { 'database' : study[ 'database' ] }
+    defect_set = study[ 'defect_set' ]
+    return { 'host' : _host_parameters( defect_set.host ), 'arrays' : defect_set.arrays() }
+
+def _init_worker( packed_studies ):
+    """Rebuilds the DefectSet for every study once, when a worker process starts."""
+    _worker_studies.clear()
+    _worker_carrier_tables.clear()
+    for name, packed in packed_studies.items():
+        if 'database' in packed:
+            _worker_studies[ name ] = load_defect_set( packed[ 'database' ] )
+        else:
+            _worker_studies[ name ] = DefectSet.from_arrays( Host( **packed[ 'host' ] ), **packed[ 'arrays' ] )
+
+def run_chunk( defect_set, filename, labels, delta_mu, temperatures, electron_dos_mass = 1.0, hole_dos_mass = 1.0, carrier_table = None ):
+    """Calculates the results for one chunk of chemical potential limits, and writes them to a .npz file.
+
+    Args:
+        defect_set (tlpy.defect_set.DefectSet): the defects.
+        filename (str): output filename.
+        labels (list(str)): chemical potential limit labels.
+        delta_mu (np.array): chemical potentials, with shape (n_limits, n_elements), in the order of defect_set.elements.
+        temperatures (np.array): temperatures (K).
+        electron_dos_mass (Optional(float)): conduction band density-of-states effective mass (units of m_e). Defaults to 1.
+        hole_dos_mass (Optional(float)): valence band density-of-states effective mass (units of m_e). Defaults to 1.
+        carrier_table (Optional(tlpy.fermi_level.CarrierTable)): carrier concentration table, for hosts with a density of states.
+
+    Returns:
+        str: the output filename."""
+    results = { 'names'        : np.array( defect_set.names, dtype = str ),
+                'charges'      : np.asarray( defect_set.charges ),
+                'mask'         : np.asarray( defect_set.mask ),
+                'labels'       : np.array( labels, dtype = str ),
+                'elements'     : np.array( defect_set.elements, dtype = str ),
+                'delta_mu'     : delta_mu,
+                'temperatures' : temperatures,
+                'intercepts'   : defect_set.intercepts( delta_mu ) }
+    if defect_set.host.site_densities is not None:
+        e_fermi, concentrations, pinned = self_consistent_fermi_energy( defect_set, defect_set.host, delta_mu, temperatures,
+                                                                        electron_dos_mass = electron_dos_mass,
+                                                                        hole_dos_mass = hole_dos_mass,
+                                                                        carrier_table = carrier_table,
+                                                                        return_pinned = True )
+        results[ 'e_fermi' ] = e_fermi
+        results[ 'concentrations' ] = concentrations
+        results[ 'pinned' ] = pinned
+    with open( filename, 'wb' ) as f:
+        np.savez( f, **results )
+    return filename
+
+def _run_task( task ):
+    name, filename, labels, delta_mu, temperatures, electron_dos_mass, hole_dos_mass = task
+    defect_set = _worker_studies[ name ]
+    # Every chunk of a study uses the same temperatures, so each worker tabulates the carrier concentrations once per study.
+    if defect_set.host.dos is not None and name not in _worker_carrier_tables:
+        _worker_carrier_tables[ name ] = CarrierTable( defect_set.host, temperatures )
+    return run_chunk( defect_set, filename, labels, delta_mu, temperatures, electron_dos_mass, hole_dos_mass,
+                      _worker_carrier_tables.get( name ) )
+
+def study_tasks( study, output = None, chunk_size = None ):
+    """Splits the chemical potential limits of a study into chunks.
+
+    Args:
+        study (dict): a study, as returned by read_study.
+        output (Optional(str)): output directory. Defaults to the study "output" entry, or the current directory.
+        chunk_size (Optional(int)): number of limits per chunk. Defaults to the study "chunk_size" entry, or 1.
+
+    Returns:
+        list(tuple): arguments for one call of run_chunk (excluding the DefectSet) per chunk."""
+    defect_set = study[ 'defect_set' ]
+    output = output or study.get( 'output', '.' )
+    chunk_size = chunk_size or study.get( 'chunk_size', 1 )
+    labels = list( study[ 'limits' ] )
+    delta_mu = delta_mu_array( [ study[ 'limits' ][ l ] for l in labels ], defect_set.elements )
+    temperatures = np.atleast_1d( np.asarray( study[ 'temperatures' ], dtype = float ) )
+    tasks = []
+    for i, start in enumerate( range( 0, len( labels ), chunk_size ) ):
+        filename = os.path.join( output, '{}_{:04d}.npz'.format( study[ 'name' ], i ) )
+        tasks.append( ( filename, labels[ start:start + chunk_size ], delta_mu[ start:start + chunk_size ], temperatures,
+                        study.get( 'electron_dos_mass', 1.0 ), study.get( 'hole_dos_mass', 1.0 ) ) )
+    return tasks
+
+def run_studies( studies, workers = None, output = None, chunk_size = None ):
+    """Runs every chunk of every study on a pool of worker processes.
+
+    Args:
+        studies (list(dict)): studies, as returned by read_study. Every study must have a different name.
+        workers (Optional(int)): number of worker processes. Defaults to the number of CPUs.
+        output (Optional(str)): output directory, overriding the study "output" entries.
+        chunk_size (Optional(int)): number of limits per chunk, overriding the study "chunk_size" entries.
+
+    Yields:
+        str: the name of each result file, as it is written."""
+    names = [ study[ 'name' ] for study in studies ]
+    if len( set( names ) ) != len( names ):
+        raise ValueError( 'Every study must have a different name' )
+    packed_studies = { study[ 'name' ] : _packed_study( study ) for study in studies }
+    tasks = []
+    for study in studies:
+        for task in study_tasks( study, output, chunk_size ):
+            os.makedirs( os.path.dirname( task[0] ) or '.', exist_ok = True )
+            tasks.append( ( study[ 'name' ], ) + task )
+    # multiprocessing.Pool, rather than concurrent.futures.ProcessPoolExecutor, which only takes an initializer from Python 3.7.
+    with multiprocessing.Pool( workers, initializer = _init_worker, initargs = ( packed_studies, ) ) as pool:
+        for filename in pool.imap_unordered( _run_task, tasks ):
+            yield filename
+
+def main( args = None ):
+    """Entry point for the tlpy command."""
+    parser = argparse.ArgumentParser( prog = 'tlpy', description = 'Run defect studies over chemical potential limits and temperatures.' )
+    parser.add_argument( 'studies', nargs = '+', help = 'JSON study files' )
+    parser.add_argument( '-w', '--workers', type = int, default = None, help = 'number of worker processes (default: number of CPUs)' )
+    parser.add_argument( '-c', '--chunk-size', type = int, default = None, help = 'number of chemical potential limits per task' )
+    parser.add_argument( '-o', '--output', default = None, help = 'output directory, overriding the study files' )
+    options = parser.parse_args( args )
+    studies = [ read_study( filename ) for filename in options.studies ]
+    for filename in run_studies( studies, options.workers, options.output, options.chunk_size ):
+        print( filename )
+        sys.stdout.flush()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit( main() )
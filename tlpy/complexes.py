@@ -0,0 +1,135 @@
+"""
+Binding energy screening for defect complexes.
+
+A complex is described by a Defect whose stoichiometry is the combined change in stoichiometry
+of its constituents, e.g. { 'O' : -1, 'Ge' : -1 } for a V_O-V_Ge divacancy. Every pair of point
+defects whose stoichiometries add up to that of a complex is a candidate pair of constituents.
+For each candidate pair, the binding energy of every combination of charge states is
+
+    E_b( q_c, q_a, q_b ) = H_f( complex, q_c ) - H_f( a, q_a ) - H_f( b, q_b ),
+
+so that negative binding energies mean the complex is more stable than the isolated defects.
+When q_c = q_a + q_b the Fermi energy and chemical potential terms cancel, and otherwise
+q_c - q_a - q_b electrons are exchanged with the Fermi level.
+
+The formation energies of the point defects and complexes are each evaluated once, as
+DefectSet arrays, and the binding energies for every pair and charge state combination
+are formed by broadcasting.
+"""
+
+from tlpy.chemical_potential import delta_mu_array, is_single_point
+from tlpy.defect_set import DefectSet
+
+import numpy as np
+
+def _as_defect_set( defects ):
+    return defects if isinstance( defects, DefectSet ) else DefectSet( defects )
+
+def _stoichiometry( defect_set, elements ):
+    columns = [ defect_set.elements.index( e ) if e in defect_set.elements else None for e in elements ]
+    stoichiometry = np.zeros( ( len( defect_set ), len( elements ) ) )
+    for k, c in enumerate( columns ):
+        if c is not None:
+            stoichiometry[ :, k ] = defect_set.stoichiometry[ :, c ]
+    return stoichiometry
+
+def _delta_mu_columns( delta_mu, defect_set, complex_set ):
+    """Chemical potentials as a dict of (n_points) arrays, covering the elements of both sets."""
+    elements = sorted( set( defect_set.elements ) | set( complex_set.elements ) )
+    mu = delta_mu_array( delta_mu, elements )
+    return { e : mu[ :, k ] for k, e in enumerate( elements ) }
+
+def constituent_pairs( defects, complexes ):
+    """Finds every pair of point defects whose combined stoichiometry equals the stoichiometry of each complex.
+
+    Args:
+        defects (list(tlpy.defect.Defect) or tlpy.defect_set.DefectSet): the point defects.
+        complexes (list(tlpy.defect.Defect) or tlpy.defect_set.DefectSet): the candidate complexes.
+
+    Returns:
+        (np.array(int), np.array(int), np.array(int)): for every matching (complex, defect a, defect b) combination,
+                                                       the index of the complex and the indices of the two point
+                                                       defects, with a <= b."""
+    defect_set = _as_defect_set( defects )
+    complex_set = _as_defect_set( complexes )
+    elements = sorted( set( defect_set.elements ) | set( complex_set.elements ) )
+    s_defects = _stoichiometry( defect_set, elements )
+    s_complexes = _stoichiometry( complex_set, elements )
+    pair_sums = s_defects[ :, np.newaxis, : ] + s_defects[ np.newaxis, :, : ]
+    matches = np.all( pair_sums[ np.newaxis ] == s_complexes[ :, np.newaxis, np.newaxis, : ], axis = -1 )
+    matches &= np.triu( np.ones( ( len( defect_set ), len( defect_set ) ), dtype = bool ) )
+    c, a, b = np.nonzero( matches )
+    return c, a, b
+
+def binding_energies( defects, complexes, e_fermi, delta_mu ):
+    """Binding energies of every complex, relative to every matching pair of point defects, for every combination of charge states.
+
+    Args:
+        defects (list(tlpy.defect.Defect) or tlpy.defect_set.DefectSet): the point defects.
+        complexes (list(tlpy.defect.Defect) or tlpy.defect_set.DefectSet): the candidate complexes.
+            Must share the same Host object as the point defects.
+        e_fermi (float or np.array): Fermi energies (relative to the host VBM).
+        delta_mu (dict, list(dict), or np.array): elemental chemical potentials.
+            See tlpy.chemical_potential.delta_mu_array for the accepted formats.
+            Array input must have columns ordered as the sorted elements of the point defects and complexes together.
+
+    Returns:
+        ((np.array(int), np.array(int), np.array(int)), np.array):
+            the (complex, defect a, defect b) indices of each pair (see constituent_pairs), and the binding energies,
+            with shape (n_pairs, n_complex_charge_states, n_charge_states, n_charge_states, n_fermi_energies)
+            for a single chemical potential point, or with an additional trailing n_points axis for multiple points.
+            The charge state axes follow the rows of DefectSet.charges for the complexes and point defects.
+            Combinations that include an unused charge state slot are np.nan.
+
+    Raises:
+        ValueError: if the complexes and point defects do not share the same Host object."""
+    defect_set = _as_defect_set( defects )
+    complex_set = _as_defect_set( complexes )
+    if defect_set.host is not complex_set.host:
+        raise ValueError( 'Complexes and point defects must share the same Host' )
+    c, a, b = constituent_pairs( defect_set, complex_set )
+    mu = _delta_mu_columns( delta_mu, defect_set, complex_set )
+    h_defects = defect_set.formation_energies( e_fermi, mu )
+    h_complexes = complex_set.formation_energies( e_fermi, mu )
+    with np.errstate( invalid = 'ignore' ):
+        energies = ( h_complexes[ c ][ :, :, np.newaxis, np.newaxis ]
+                     - h_defects[ a ][ :, np.newaxis, :, np.newaxis ]
+                     - h_defects[ b ][ :, np.newaxis, np.newaxis, : ] )
+    used = ( complex_set.mask[ c ][ :, :, np.newaxis, np.newaxis ]
+             & defect_set.mask[ a ][ :, np.newaxis, :, np.newaxis ]
+             & defect_set.mask[ b ][ :, np.newaxis, np.newaxis, : ] )
+    energies = np.where( used[ ..., np.newaxis, np.newaxis ], energies, np.nan )
+    if is_single_point( delta_mu ):
+        energies = energies[ ..., 0 ]
+    return ( c, a, b ), energies
+
+def ground_state_binding_energies( defects, complexes, e_fermi, delta_mu ):
+    """Binding energies of every complex relative to every matching pair of point defects, each in its lowest energy charge state.
+
+    Args:
+        defects (list(tlpy.defect.Defect) or tlpy.defect_set.DefectSet): the point defects.
+        complexes (list(tlpy.defect.Defect) or tlpy.defect_set.DefectSet): the candidate complexes.
+            Must share the same Host object as the point defects.
+        e_fermi (float or np.array): Fermi energies (relative to the host VBM).
+        delta_mu (dict, list(dict), or np.array): elemental chemical potentials (see binding_energies).
+
+    Returns:
+        ((np.array(int), np.array(int), np.array(int)), np.array):
+            the (complex, defect a, defect b) indices of each pair (see constituent_pairs), and the binding energies,
+            with shape (n_pairs, n_fermi_energies) for a single chemical potential point,
+            or (n_pairs, n_fermi_energies, n_points) for multiple points.
+
+    Raises:
+        ValueError: if the complexes and point defects do not share the same Host object."""
+    defect_set = _as_defect_set( defects )
+    complex_set = _as_defect_set( complexes )
+    if defect_set.host is not complex_set.host:
+        raise ValueError( 'Complexes and point defects must share the same Host' )
+    c, a, b = constituent_pairs( defect_set, complex_set )
+    mu = _delta_mu_columns( delta_mu, defect_set, complex_set )
+    h_defects = np.min( defect_set.formation_energies( e_fermi, mu ), axis = 1 )
+    h_complexes = np.min( complex_set.formation_energies( e_fermi, mu ), axis = 1 )
+    energies = h_complexes[ c ] - h_defects[ a ] - h_defects[ b ]
+    if is_single_point( delta_mu ):
+        energies = energies[ ..., 0 ]
+    return ( c, a, b ), energies
@@ -0,0 +1,140 @@
+from tlpy.chemical_potential import is_single_point
+from tlpy.defect_set import DefectSet
+
+import numpy as np
+
+BOLTZMANN_CONSTANT = 8.617333262e-5 # eV / K
+
+def logsumexp( a, axis ):
+    """Numerically stable log( sum( exp( a ) ) ) along one or more axes.
+
+    Args:
+        a (np.array): input array. Entries of -np.inf contribute zero to the sum.
+        axis (int or tuple(int)): axis or axes to sum over.
+
+    Returns:
+        np.array"""
+    a_max = np.max( a, axis = axis, keepdims = True, initial = -np.inf )
+    a_max = np.where( np.isfinite( a_max ), a_max, 0.0 )
+    with np.errstate( divide = 'ignore' ):
+        return np.log( np.sum( np.exp( a - a_max ), axis = axis ) ) + np.squeeze( a_max, axis = axis )
+
+def log_prefactors( defect_set, site_densities = None, rows = None ):
+    """Natural logarithm of the site density multiplied by the degeneracy, for every defect charge state.
+
+    Args:
+        defect_set (tlpy.defect_set.DefectSet): the defects.
+        site_densities (Optional(dict)): number of sites per cm^3 for each defect site label, e.g. { 'O' : 4.2e22 }.
+                                         Defaults to defect_set.host.site_densities.
+        rows (Optional(np.array(int))): only calculate for these defects. Defaults to every defect.
+
+    Returns:
+        np.array: shape (n_defects, n_charge_states).
+
+    Raises:
+        ValueError: if no site densities are given, and the host does not define any.
+        KeyError: if the site density is missing for any defect site."""
+    if site_densities is None:
+        site_densities = defect_set.host.site_densities if defect_set.host is not None else {}
+        if site_densities is None:
+            raise ValueError( 'No site densities were given, and the host does not define any' )
+    if rows is None:
+        rows = np.arange( len( defect_set ) )
+    sites = np.array( [ site_densities[ defect_set.sites[ i ] ] for i in rows ], dtype = float ).reshape( -1, 1 )
+    return np.log( sites ) + np.log( defect_set.degeneracies[ rows ] )
+
+def log_defect_concentrations( defects, e_fermi, temperature, delta_mu, site_densities = None, rows = None ):
+    """Natural logarithms of the concentration of every defect charge state, c = N_site g exp( -H_f / kT ).
+
+    Args:
+        defects (list(tlpy.defect.Defect) or tlpy.defect_set.DefectSet): the defects.
+        e_fermi (float or np.array): Fermi energies (relative to the host VBM).
+        temperature (float or np.array): temperatures (K).
+        delta_mu (dict, list(dict), or np.array): elemental chemical potentials.
+            See tlpy.chemical_potential.delta_mu_array for the accepted formats.
+        site_densities (Optional(dict)): number of sites per cm^3 for each defect site label.
+                                         Defaults to the host site densities.
+        rows (Optional(np.array(int))): only calculate for these defects. Defaults to every defect.
+
+    Returns:
+        np.array: log concentrations (cm^-3), with shape (n_defects, n_charge_states, n_temperatures, n_fermi_energies)
+                  for a single chemical potential point, or (n_defects, n_charge_states, n_temperatures, n_fermi_energies, n_points)
+                  for multiple points. Unused slots are -np.inf."""
+    defect_set = defects if isinstance( defects, DefectSet ) else DefectSet( defects )
+    kT = BOLTZMANN_CONSTANT * np.atleast_1d( np.asarray( temperature, dtype = float ) )
+    energies = defect_set.formation_energies( e_fermi, delta_mu, rows )[ :, :, np.newaxis, :, : ]
+    prefactors = log_prefactors( defect_set, site_densities, rows )[ :, :, np.newaxis, np.newaxis, np.newaxis ]
+    log_c = prefactors - energies / kT[ :, np.newaxis, np.newaxis ]
+    if is_single_point( delta_mu ):
+        return log_c[ ..., 0 ]
+    return log_c
+
+def defect_concentrations( defects, e_fermi, temperature, delta_mu, site_densities = None ):
+    """Concentrations of every defect charge state, and the total concentration of each defect.
+
+    The Boltzmann factors are evaluated in log space, and the per-defect totals are summed
+    with log-sum-exp, so that large formation energies at low temperature do not lose precision
+    before the final exponentiation.
+
+    Args:
+        defects (list(tlpy.defect.Defect) or tlpy.defect_set.DefectSet): the defects.
+        e_fermi (float or np.array): Fermi energies (relative to the host VBM).
+        temperature (float or np.array): temperatures (K).
+        delta_mu (dict, list(dict), or np.array): elemental chemical potentials.
+        site_densities (Optional(dict)): number of sites per cm^3 for each defect site label.
+                                         Defaults to the host site densities.
+
+    Returns:
+        (np.array, np.array): charge state concentrations (cm^-3), with shape (n_defects, n_charge_states, n_temperatures, n_fermi_energies),
+                              and total defect concentrations (cm^-3), with shape (n_defects, n_temperatures, n_fermi_energies).
+                              For multiple chemical potential points, both arrays have an additional trailing n_points axis."""
+    log_c = log_defect_concentrations( defects, e_fermi, temperature, delta_mu, site_densities )
+    return np.exp( log_c ), np.exp( logsumexp( log_c, axis = 1 ) )
+
+class ConcentrationTracker:
+    """Defect concentrations for a fixed set of conditions, that are kept up to date as charge state energies change.
+
+    When update() is called, only the defects whose rows in the DefectSet have changed are recalculated.
+
+    Attributes:
+        defect_set (tlpy.defect_set.DefectSet): the defects.
+        log_concentrations (np.array): log concentrations, as returned by log_defect_concentrations.
+    """
+
+    def __init__( self, defect_set, e_fermi, temperature, delta_mu, site_densities = None ):
+        """Create a ConcentrationTracker object, and calculate the concentrations of every defect."""
+        self.defect_set = defect_set
+        self.e_fermi = e_fermi
+        self.temperature = temperature
+        self.delta_mu = delta_mu
+        self.site_densities = site_densities
+        self.log_concentrations = log_defect_concentrations( defect_set, e_fermi, temperature, delta_mu, site_densities )
+        self._row_revisions = defect_set.row_revisions.copy()
+
+    def update( self ):
+        """Recalculates the concentrations of any defects that have changed.
+
+        Returns:
+            np.array(int): the indices of the defects that were recalculated."""
+        self.defect_set.refresh()
+        rows = np.flatnonzero( self.defect_set.row_revisions != self._row_revisions )
+        if len( rows ) == 0:
+            return rows
+        if self.defect_set.mask.shape[1] != self.log_concentrations.shape[1]:
+            self.log_concentrations = log_defect_concentrations( self.defect_set, self.e_fermi, self.temperature,
+                                                                 self.delta_mu, self.site_densities )
+        else:
+            self.log_concentrations[ rows ] = log_defect_concentrations( self.defect_set, self.e_fermi, self.temperature,
+                                                                         self.delta_mu, self.site_densities, rows )
+        self._row_revisions = self.defect_set.row_revisions.copy()
+        return rows
+
+    @property
+    def concentrations( self ):
+        """Concentrations of every defect charge state (cm^-3)."""
+        return np.exp( self.log_concentrations )
+
+    @property
+    def totals( self ):
+        """Total concentration of each defect (cm^-3)."""
+        return np.exp( logsumexp( self.log_concentrations, axis = 1 ) )
@@ -0,0 +1,317 @@
+"""
+Finite-size corrections for charged defect supercell calculations.
+
+A correction scheme is an object with an energy( charge_state ) method, returning the correction
+(in eV) that is added to the formation energy of a Defect_Charge_State. A scheme can be set for
+every charge state through Host.correction_scheme, or for individual charge states through
+Defect_Charge_State.correction_scheme. If neither is set, the correction is
+host.correction_scaling * q^2 (equivalent to ScaledQuadraticCorrection).
+
+Potential alignment uses planar-averaged electrostatic potentials from the host and defect
+supercells (see PotentialAlignment). The potentials are the electrostatic potential, in V,
+which is positive near a positive charge. Potentials that store the electron potential energy
+(e.g. VASP LOCPOT files) should be negated before use.
+
+Energies are in eV, lengths in Angstrom, and charges in units of e.
+"""
+
+import abc
+import hashlib
+import json
+import os
+import pathlib
+
+import numpy as np
+
+COULOMB_CONSTANT = 14.399645 # e^2 / ( 4 pi epsilon_0 ), eV Angstrom
+
+try:
+    _PATH_TYPES = ( str, os.PathLike )
+    _fspath = os.fspath
+except AttributeError: # os.PathLike and os.fspath are new in Python 3.6
+    _PATH_TYPES = ( str, pathlib.PurePath )
+    _fspath = str
+
+def planar_average( grid, axis ):
+    """Averages a volumetric grid over the planes perpendicular to one axis.
+
+    Args:
+        grid (np.array): volumetric data, with shape (n_a, n_b, n_c). May be a memory-mapped array.
+        axis (int): the axis that is not averaged over.
+
+    Returns:
+        np.array: shape (n_axis)."""
+    other_axes = tuple( i for i in range( 3 ) if i != axis )
+    return np.asarray( np.mean( grid, axis = other_axes, dtype = float ) )
+
+class CorrectionCache:
+    """On-disk cache for planar-averaged potentials.
+
+    Each entry is keyed by the absolute path, size and modification time of the volumetric grid file,
+    and by the averaging axis, so that the cache is ignored if the grid file changes.
+
+    Attributes:
+        directory (str): cache directory.
+    """
+
+    def __init__( self, directory ):
+        """Create a CorrectionCache object. The cache directory is created if it does not exist."""
+        self.directory = directory
+        os.makedirs( directory, exist_ok = True )
+
+    def _filename( self, path, axis ):
+        stat = os.stat( path )
+        key = json.dumps( [ os.path.abspath( path ), stat.st_size, stat.st_mtime_ns, axis ] )
+        return os.path.join( self.directory, hashlib.sha1( key.encode() ).hexdigest() + '.npy' )
+
+    def planar_average( self, path, axis ):
+        """Returns the planar average of a grid stored as a .npy file, reading the grid only if there is no cached result.
+
+        Args:
+            path (str): path to a .npy file holding the volumetric grid.
+            axis (int): the axis that is not averaged over.
+
+        Returns:
+            np.array"""
+        filename = self._filename( path, axis )
+        if os.path.exists( filename ):
+            return np.load( filename )
+        average = planar_average( np.load( path, mmap_mode = 'r' ), axis )
+        np.save( filename, average )
+        return average
+
+def _planar_average( grid, axis, cache ):
+    if isinstance( grid, _PATH_TYPES ):
+        path = _fspath( grid )
+        if cache is not None:
+            return cache.planar_average( path, axis )
+        return planar_average( np.load( path, mmap_mode = 'r' ), axis )
+    return planar_average( grid, axis )
+
+class PotentialAlignment:
+    """Potential alignment between a defect supercell and the host supercell.
+
+    Attributes:
+        host_potential (str, os.PathLike or np.array): host electrostatic potential grid, or the path to a .npy file holding it.
+        defect_potential (str, os.PathLike or np.array): defect electrostatic potential grid, or the path to a .npy file holding it.
+        axis (int): the planar averages are taken perpendicular to this lattice vector.
+        region (tuple(float,float)): fractional coordinates along axis of the region, far from the defect,
+                                     where the potentials are compared.
+        cache (tlpy.correction.CorrectionCache or None): on-disk cache for the planar averages.
+    """
+
+    def __init__( self, host_potential, defect_potential, axis = 2, region = ( 0.4, 0.6 ), cache = None ):
+        """Create a PotentialAlignment object.
+
+        .npy files are memory-mapped, so only the planar averages are held in memory."""
+        self.host_potential = host_potential
+        self.defect_potential = defect_potential
+        self.axis = axis
+        self.region = region
+        self.cache = cache
+        self._difference = None
+
+    def difference( self ):
+        """Planar-averaged potential difference, V_defect - V_host, along the alignment axis.
+
+        Returns:
+            np.array"""
+        if self._difference is None:
+            host = _planar_average( self.host_potential, self.axis, self.cache )
+            defect = _planar_average( self.defect_potential, self.axis, self.cache )
+            if host.shape != defect.shape:
+                raise ValueError( 'Host and defect potential grids have different shapes along axis {}'.format( self.axis ) )
+            self._difference = defect - host
+        return self._difference
+
+    def sampling_mask( self ):
+        """Boolean mask selecting the grid points along the alignment axis that lie inside the sampling region.
+
+        Returns:
+            np.array(bool)"""
+        n = len( self.difference() )
+        z = np.arange( n ) / n
+        start, end = self.region
+        return ( z >= start ) & ( z <= end )
+
+    def delta_v( self, model = None ):
+        """Average potential offset in the sampling region.
+
+        Args:
+            model (Optional(np.array)): planar-averaged model potential, subtracted from the potential difference.
+
+        Returns:
+            float"""
+        difference = self.difference() if model is None else self.difference() - model
+        return float( np.mean( difference[ self.sampling_mask() ] ) )
+
+class Correction( abc.ABC ):
+    """Abstract base class for correction schemes. Subclasses must implement energy."""
+
+    @abc.abstractmethod
+    def energy( self, charge_state ):
+        """The correction for a charge state (eV).
+
+        Args:
+            charge_state (tlpy.defect_charge_state.Defect_Charge_State): the charge state to correct.
+
+        Returns:
+            float"""
+
+    @staticmethod
+    def alignment_energy( charge_state ):
+        """Potential alignment term, -q delta_V, or 0.0 if the charge state has no potential alignment."""
+        if charge_state.potential_alignment is None:
+            return 0.0
+        return -charge_state.charge * charge_state.potential_alignment.delta_v()
+
+class ScaledQuadraticCorrection( Correction ):
+    """Image-charge correction that is a constant multiplied by q^2, plus optional potential alignment.
+
+    Attributes:
+        scaling (float): correction for a charge of 1 (eV)."""
+
+    def __init__( self, scaling ):
+        self.scaling = scaling
+
+    def energy( self, charge_state ):
+        return self.scaling * charge_state.charge * charge_state.charge + self.alignment_energy( charge_state )
+
+class FixedCorrection( Correction ):
+    """A correction that has already been calculated, e.g. one read back from a defect database.
+
+    The correction does not depend on the host, so it is not changed by later changes to the host.
+
+    Attributes:
+        correction (float): the correction, including any potential alignment (eV)."""
+
+    def __init__( self, correction ):
+        self.correction = correction
+
+    def energy( self, charge_state ):
+        return self.correction
+
+class MakovPayneCorrection( Correction ):
+    """Makov-Payne image-charge correction [G. Makov and M. C. Payne, PRB 51, 4014 (1995)],
+
+        E = q^2 alpha / ( 2 epsilon L ) + 2 pi q Q / ( 3 epsilon L^3 ),
+
+    plus optional potential alignment.
+
+    Attributes:
+        madelung_constant (float): Madelung constant, alpha, of the supercell lattice.
+        length (float): supercell length, L (Angstrom).
+        dielectric_constant (float): static dielectric constant, epsilon.
+        quadrupole_moment (float): defect quadrupole moment, Q (e Angstrom^2)."""
+
+    def __init__( self, madelung_constant, length, dielectric_constant, quadrupole_moment = 0.0 ):
+        self.madelung_constant = madelung_constant
+        self.length = length
+        self.dielectric_constant = dielectric_constant
+        self.quadrupole_moment = quadrupole_moment
+
+    def energy( self, charge_state ):
+        q = charge_state.charge
+        first_order = q * q * self.madelung_constant / ( 2.0 * self.dielectric_constant * self.length )
+        third_order = 2.0 * np.pi * q * self.quadrupole_moment / ( 3.0 * self.dielectric_constant * self.length**3 )
+        return COULOMB_CONSTANT * ( first_order + third_order ) + self.alignment_energy( charge_state )
+
+class LanyZungerCorrection( Correction ):
+    """Lany-Zunger image-charge correction [S. Lany and A. Zunger, PRB 78, 235104 (2008)],
+    which approximates the third-order Makov-Payne correction by scaling the first-order term,
+
+        E = [ 1 + c_sh ( 1 - 1 / epsilon ) ] q^2 alpha / ( 2 epsilon L ),
+
+    plus optional potential alignment.
+
+    Attributes:
+        madelung_constant (float): Madelung constant, alpha, of the supercell lattice.
+        length (float): supercell length, L (Angstrom).
+        dielectric_constant (float): static dielectric constant, epsilon.
+        shape_factor (float): supercell shape factor, c_sh."""
+
+    def __init__( self, madelung_constant, length, dielectric_constant, shape_factor ):
+        self.madelung_constant = madelung_constant
+        self.length = length
+        self.dielectric_constant = dielectric_constant
+        self.shape_factor = shape_factor
+
+    def energy( self, charge_state ):
+        q = charge_state.charge
+        scale = 1.0 + self.shape_factor * ( 1.0 - 1.0 / self.dielectric_constant )
+        first_order = q * q * self.madelung_constant / ( 2.0 * self.dielectric_constant * self.length )
+        return COULOMB_CONSTANT * scale * first_order + self.alignment_energy( charge_state )
+
+class FreysoldtCorrection( Correction ):
+    """Freysoldt-Neugebauer-Van de Walle correction [C. Freysoldt et al., PRL 102, 016402 (2009)],
+
+        E = E_iso - E_per - q delta_V,
+
+    for a Gaussian model charge, where E_iso and E_per are the electrostatic energies of the isolated
+    and periodic model charge, and delta_V is the potential alignment after the planar-averaged model
+    potential has been subtracted from the DFT potential difference. Every charge state that uses
+    this scheme must have a potential_alignment.
+
+    Attributes:
+        lattice_vectors (np.array): supercell lattice vectors, as rows (Angstrom).
+        dielectric_constant (float): static dielectric constant, epsilon.
+        position (float): fractional coordinate of the defect along the alignment axis.
+        gaussian_width (float): model charge width, sigma, for a charge density proportional to exp( -r^2 / sigma^2 ) (Angstrom).
+        energy_cutoff (float): reciprocal space sums include terms down to exp( -energy_cutoff )."""
+
+    def __init__( self, lattice_vectors, dielectric_constant, position = 0.0, gaussian_width = 1.0, energy_cutoff = 30.0 ):
+        self.lattice_vectors = np.asarray( lattice_vectors, dtype = float )
+        self.dielectric_constant = dielectric_constant
+        self.position = position
+        self.gaussian_width = gaussian_width
+        self.energy_cutoff = energy_cutoff
+        self.volume = abs( np.linalg.det( self.lattice_vectors ) )
+        self.reciprocal_vectors = 2.0 * np.pi * np.linalg.inv( self.lattice_vectors ).T
+
+    def _g_max( self ):
+        return np.sqrt( 2.0 * self.energy_cutoff ) / self.gaussian_width
+
+    def lattice_energy( self, charge ):
+        """Isolated minus periodic electrostatic energy of the Gaussian model charge, E_iso - E_per.
+
+        Args:
+            charge (int): model charge.
+
+        Returns:
+            float"""
+        sigma = self.gaussian_width
+        n_max = np.ceil( self._g_max() / np.linalg.norm( self.reciprocal_vectors, axis = 1 ) ).astype( int )
+        m = np.stack( np.meshgrid( *[ np.arange( -n, n + 1 ) for n in n_max ], indexing = 'ij' ), axis = -1 ).reshape( -1, 3 )
+        m = m[ np.any( m != 0, axis = 1 ) ]
+        g2 = np.sum( np.dot( m, self.reciprocal_vectors )**2, axis = 1 )
+        e_per = 2.0 * np.pi / ( self.dielectric_constant * self.volume ) * np.sum( np.exp( -g2 * sigma**2 / 2.0 ) / g2 )
+        e_iso = 1.0 / ( self.dielectric_constant * sigma * np.sqrt( 2.0 * np.pi ) )
+        return COULOMB_CONSTANT * charge * charge * ( e_iso - e_per )
+
+    def model_potential( self, charge, n_points, axis ):
+        """Planar-averaged electrostatic potential of the periodic Gaussian model charge along one lattice vector.
+
+        Args:
+            charge (int): model charge.
+            n_points (int): number of grid points along the axis.
+            axis (int): lattice vector index.
+
+        Returns:
+            np.array: shape (n_points)."""
+        b = np.linalg.norm( self.reciprocal_vectors[ axis ] )
+        m = np.arange( 1, int( np.ceil( self._g_max() / b ) ) + 1 )
+        g = m * b
+        z = np.arange( n_points ) / n_points - self.position
+        terms = np.exp( -g**2 * self.gaussian_width**2 / 4.0 ) / g**2
+        potential = 2.0 * np.sum( terms[ :, np.newaxis ] * np.cos( 2.0 * np.pi * m[ :, np.newaxis ] * z ), axis = 0 )
+        return COULOMB_CONSTANT * 4.0 * np.pi * charge / ( self.dielectric_constant * self.volume ) * potential
+
+    def energy( self, charge_state ):
+        q = charge_state.charge
+        if q == 0:
+            return 0.0
+        alignment = charge_state.potential_alignment
+        if alignment is None:
+            raise ValueError( 'FreysoldtCorrection requires a potential_alignment for charge state {}'.format( q ) )
+        model = self.model_potential( q, len( alignment.difference() ), alignment.axis )
+        return self.lattice_energy( q ) - q * alignment.delta_v( model )
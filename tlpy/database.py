@@ -0,0 +1,108 @@
+"""
+Columnar on-disk storage for large sets of defects.
+
+A defect database is a directory of .npy files, one per array, so that every array can be
+memory-mapped when the database is opened. (Arrays stored inside a single .npz archive cannot be
+memory-mapped by numpy.) The charge state arrays use the same padded (n_defects, n_charge_states)
+layout as tlpy.defect_set.DefectSet:
+
+    names.npy                 defect names, (n_defects)
+    sites.npy                 defect site labels, (n_defects)
+    elements.npy              element labels for the stoichiometry columns, (n_elements)
+    stoichiometry.npy         change in stoichiometry, (n_defects, n_elements)
+    charges.npy               charge state charges, (n_defects, n_charge_states)
+    energies.npy              charge state energies, (n_defects, n_charge_states)
+    corrections.npy           finite-size corrections, (n_defects, n_charge_states)
+    degeneracies.npy          charge state degeneracies, (n_defects, n_charge_states)
+    mask.npy                  True where a slot holds a charge state, (n_defects, n_charge_states)
+    host_parameters.npy       host energy, vbm, cbm, and correction_scaling
+    host_elements.npy         host elemental reference energy labels
+    host_elemental_energies.npy
+    host_sites.npy            host site density labels (optional)
+    host_site_densities.npy   (optional)
+    host_dos.npy              host density of states, (n_points, 2) (optional)
+
+Host.correction_scheme, and the correction schemes and potential alignments of individual charge
+states, are not saved. The corrections they give are saved in corrections.npy, and are used as they
+are by the defects in a loaded DefectSet, so a Host read from a database has no correction_scheme.
+"""
+
+from tlpy.defect_set import DefectSet
+from tlpy.host import Host
+
+import os
+
+import numpy as np
+
+ARRAYS = [ 'names', 'sites', 'elements', 'stoichiometry', 'charges', 'energies', 'corrections', 'degeneracies', 'mask' ]
+
+def save_defect_set( path, defects ):
+    """Writes a set of defects, and their host, to a defect database directory.
+
+    Args:
+        path (str): database directory. This is created if it does not exist.
+        defects (list(tlpy.defect.Defect) or tlpy.defect_set.DefectSet): the defects to save.
+
+    Returns:
+        None"""
+    defect_set = defects if isinstance( defects, DefectSet ) else DefectSet( defects )
+    os.makedirs( path, exist_ok = True )
+    arrays = defect_set.arrays()
+    for name in [ 'names', 'sites', 'elements' ]:
+        arrays[ name ] = np.array( arrays[ name ], dtype = str )
+    host = defect_set.host
+    arrays[ 'host_parameters' ] = np.array( [ host.energy, host.vbm, host.cbm, host.correction_scaling ], dtype = float )
+    arrays[ 'host_elements' ] = np.array( list( host.elemental_energies ), dtype = str )
+    arrays[ 'host_elemental_energies' ] = np.array( list( host.elemental_energies.values() ), dtype = float )
+    if host.site_densities is not None:
+        arrays[ 'host_sites' ] = np.array( list( host.site_densities ), dtype = str )
+        arrays[ 'host_site_densities' ] = np.array( list( host.site_densities.values() ), dtype = float )
+    if host.dos is not None:
+        arrays[ 'host_dos' ] = host.dos
+    for name, array in arrays.items():
+        np.save( os.path.join( path, name + '.npy' ), np.asarray( array ) )
+
+def load_host( path ):
+    """Reads the Host object from a defect database directory.
+
+    The Host correction_scheme is not saved, so the Host returned has correction_scheme = None.
+
+    Args:
+        path (str): database directory.
+
+    Returns:
+        (tlpy.host.Host)"""
+    energy, vbm, cbm, correction_scaling = np.load( os.path.join( path, 'host_parameters.npy' ) ).tolist()
+    elements = np.load( os.path.join( path, 'host_elements.npy' ) ).tolist()
+    elemental_energies = np.load( os.path.join( path, 'host_elemental_energies.npy' ) ).tolist()
+    site_densities = None
+    if os.path.exists( os.path.join( path, 'host_sites.npy' ) ):
+        sites = np.load( os.path.join( path, 'host_sites.npy' ) ).tolist()
+        densities = np.load( os.path.join( path, 'host_site_densities.npy' ) ).tolist()
+        site_densities = dict( zip( sites, densities ) )
+    dos = None
+    if os.path.exists( os.path.join( path, 'host_dos.npy' ) ):
+        dos = np.load( os.path.join( path, 'host_dos.npy' ) )
+    return Host( energy = energy,
+                 vbm = vbm,
+                 cbm = cbm,
+                 elemental_energies = dict( zip( elements, elemental_energies ) ),
+                 correction_scaling = correction_scaling,
+                 site_densities = site_densities,
+                 dos = dos )
+
+def load_defect_set( path, mmap_mode = 'r' ):
+    """Opens a defect database directory as a DefectSet.
+
+    The arrays are memory-mapped, and no Defect or Defect_Charge_State objects are created
+    until individual defects are accessed through DefectSet.defect().
+
+    Args:
+        path (str): database directory.
+        mmap_mode (Optional(str)): numpy memory-map mode, or None to read the arrays into memory. Defaults to 'r'.
+
+    Returns:
+        (tlpy.defect_set.DefectSet)"""
+    arrays = { name : np.load( os.path.join( path, name + '.npy' ), mmap_mode = mmap_mode ) for name in ARRAYS }
+    arrays[ 'elements' ] = np.asarray( arrays[ 'elements' ] ).tolist()
+    return DefectSet.from_arrays( load_host( path ), **arrays )
@@ -1,9 +1,15 @@
 from tlpy.defect_charge_state import Defect_Charge_State
+from tlpy.chemical_potential import delta_mu_array, is_single_point
+from tlpy.envelope import envelope_profile, lower_envelope
+
+import io
 
 import numpy as np
 
 def numpy_pprint( np_array ):
-    return "\n".join( [ ' '.join( [ '{}'.format( f ) for f in p ] ) for p in np_array ] )
+    output = io.StringIO()
+    np.savetxt( output, np_array, fmt = '%s' )
+    return output.getvalue()[:-1]
 
 class Defect:
     """A specific defect corresponding to a specified change in stoichiometry.
@@ -17,7 +23,9 @@ class Defect:
                              e.g. { '-1' : Defect_Charge_State(...) }.
                              Individual charge states can be added to a Defect object using the add_charge_state method.
         host (tlpy.host.Host): Host object describing the stoichiometric host system.
-        site (str): identifying label for the defect site in the host structure.""" 
+        site (str): identifying label for the defect site in the host structure.
+        revision (int): incremented every time a charge state is added, or the energy, correction scheme,
+                        or potential alignment of a charge state is changed.""" 
 
     def __init__( self, name, stoichiometry, host, site ):
         """Create a Defect object."""
@@ -26,19 +34,127 @@ class Defect:
         self.host = host
         self.site = site
         self.charge_state = {}
+        self.revision = 0
+        self._breakpoint_table = None
+        self._correction_host = None
+        self._correction_revision = -1
 
-    def add_charge_state( self, charge, energy ):
+    def add_charge_state( self, charge, energy, degeneracy = 1, correction_scheme = None, potential_alignment = None ):
         """Create a Defect_Charge_State object, and add it to the self.charge_state dict.
 
+        Any existing charge state with the same charge is replaced, and detached from this defect (its defect is set to None).
+
         Args:
             charge (int): charge for the charge state, e.g. +1 if 1 electron is transferred to the Fermi level.
             energy (float): energy of this charge state.
+            degeneracy (Optional(int)): degeneracy of this charge state (e.g. spin or orientational). Defaults to 1.
+            correction_scheme (Optional(tlpy.correction.Correction)): finite-size correction scheme for this charge state.
+                                                                      Defaults to the host correction scheme.
+            potential_alignment (Optional(tlpy.correction.PotentialAlignment)): potential alignment for this charge state.
 
         Returns:
             The new Defect_Charge_State object."""
-        self.charge_state[ charge ] = Defect_Charge_State( charge, energy, self.host, self.stoichiometry )
+        previous = self.charge_state.get( charge )
+        previous_intercept = None
+        if previous is not None:
+            previous_intercept = previous.relative_formation_energy( 0.0 )
+            # The replaced charge state no longer belongs to this defect, so later changes to it are not tracked here.
+            previous.defect = None
+        self.charge_state[ charge ] = Defect_Charge_State( charge, energy, self, degeneracy, correction_scheme, potential_alignment )
+        self._charge_state_changed( self.charge_state[ charge ], previous_intercept )
+        return self.charge_state[ charge ]
+
+    def update_charge_state( self, charge, energy ):
+        """Sets the energy of a charge state, adding the charge state if it does not already exist.
+
+        Setting Defect_Charge_State.energy directly has the same effect.
+
+        Args:
+            charge (int): charge for the charge state.
+            energy (float): new energy of this charge state.
+
+        Returns:
+            The updated Defect_Charge_State object."""
+        if charge in self.charge_state:
+            self.charge_state[ charge ].energy = energy
+        else:
+            self.add_charge_state( charge, energy )
         return self.charge_state[ charge ]
 
+    def _check_corrections( self ):
+        """Clears the cached finite-size corrections of every charge state if the Host has been changed or replaced since they were calculated."""
+        host = self.host
+        if self._correction_host is not host or self._correction_revision != host.revision:
+            for charge_state in self.charge_state.values():
+                charge_state._correction = None
+            self._correction_host = host
+            self._correction_revision = host.revision
+
+    def _charge_state_changed( self, charge_state, previous_intercept ):
+        """Updates the cached breakpoint table after one charge state has been added or changed.
+
+        If the charge state is new, or its relative formation energy at E_Fermi = 0 (its intercept) has
+        decreased, only the lines already on the envelope and the changed line can make up the new envelope,
+        so the envelope is rebuilt from these alone. If the intercept of a charge state on the envelope
+        has increased, previously hidden charge states may appear, and the table is rebuilt from every
+        charge state when next needed.
+
+        Args:
+            charge_state (Defect_Charge_State): the added or changed charge state.
+                Charge states that are no longer in self.charge_state are ignored.
+            previous_intercept (float or None): the intercept of the charge state this replaces, or None for a new charge."""
+        if self.charge_state.get( charge_state.charge ) is not charge_state:
+            return
+        self.revision += 1
+        if not self._breakpoint_table_is_current():
+            self._breakpoint_table = None
+            return
+        charges, breakpoints, intercepts = self._breakpoint_table[2]
+        q = charge_state.charge
+        intercept = charge_state.relative_formation_energy( 0.0 )
+        if previous_intercept is not None and intercept > previous_intercept:
+            if q in charges:
+                self._breakpoint_table = None
+            return
+        keep = charges != q
+        charges = np.append( charges[ keep ], q )
+        intercepts = np.append( intercepts[ keep ], intercept )
+        hull, breakpoints = lower_envelope( charges, intercepts )
+        self._breakpoint_table = ( self.host, self.host.revision, ( charges[ hull ], breakpoints, intercepts[ hull ] ) )
+
+    def _breakpoint_table_is_current( self ):
+        """The cached breakpoint table is keyed on the Host object and its revision, so it is rebuilt if the Host is changed or replaced."""
+        table = self._breakpoint_table
+        return table is not None and table[0] is self.host and table[1] == self.host.revision
+
+    def breakpoint_table( self ):
+        """Returns the sorted table of transition levels, and the stable charge state between each pair of levels.
+
+        The table is cached, and is updated when a charge state is added or changed, or rebuilt when the Host is changed or replaced.
+        The transition levels do not depend on the elemental chemical potentials, so one table serves every delta_mu.
+
+        Returns:
+            (np.array(int), np.array, np.array): the stable charge states, ordered by increasing Fermi energy,
+                                                 the Fermi energies (relative to the host VBM) of the transition levels between them,
+                                                 and the relative formation energies of the stable charge states at E_Fermi = 0."""
+        if not self._breakpoint_table_is_current():
+            charges = np.array( self.charge_state_list(), dtype = int )
+            intercepts = np.array( [ self.charge_state[ q ].relative_formation_energy( 0.0 ) for q in charges ] )
+            hull, breakpoints = lower_envelope( charges, intercepts )
+            self._breakpoint_table = ( self.host, self.host.revision, ( charges[ hull ], breakpoints, intercepts[ hull ] ) )
+        return self._breakpoint_table[2]
+
+    def charges_at_fermi_energy( self, e_fermi ):
+        """Returns the charge of the lowest formation energy charge state at each of an array of Fermi energies.
+
+        Args:
+            e_fermi (float or np.array): Fermi energies (relative to the host VBM).
+
+        Returns:
+            (np.array(int)): charges, with the same shape as e_fermi."""
+        charges, breakpoints, _ = self.breakpoint_table()
+        return charges[ np.searchsorted( breakpoints, e_fermi ) ]
+
     def charge_state_at_fermi_energy( self, e_fermi ):
         """Returns the charge state with the lowest formation energy at a given Fermi energy.
 
@@ -47,33 +163,73 @@ class Defect:
 
         Returns:
             (Defect_Charge_State)"""
-        return min( [ ( q, q.relative_formation_energy( e_fermi ) ) for q in self.charge_state.values() ], key = lambda x : x[1] )[0]
+        return self.charge_state[ int( self.charges_at_fermi_energy( e_fermi ) ) ]
 
     def tl_profile( self, delta_mu, ef_min, ef_max ):
         """Generates the set of points for a transition level diagram.
 
         Args:
-            delta_mu (?):
-            ef_min (float):
-            ef_max (float):
+            delta_mu (dict, list(dict), or np.array): elemental chemical potentials, e.g. { 'O' : -0.345 }.
+                Multiple chemical potential points can be given as a list of dicts, a dict of arrays,
+                or an (n_points, n_elements) array with columns ordered as the sorted elements of
+                self.stoichiometry (see tlpy.chemical_potential.delta_mu_array).
+            ef_min (float): minimum Fermi energy (relative to the host VBM).
+            ef_max (float): maximum Fermi energy (relative to the host VBM).
+
+        Returns:
+            points (np.array): (E_Fermi, formation energy) points, with shape (n_kinks, 2) for a single
+                               chemical potential point, or (n_points, n_kinks, 2) for multiple points."""
+        charges, breakpoints, intercepts = self.breakpoint_table()
+        points = envelope_profile( charges, breakpoints, intercepts, self.chemical_potential_terms( delta_mu ), ef_min, ef_max )
+        if is_single_point( delta_mu ):
+            return points[0]
+        return points
+
+    def lower_envelope( self ):
+        """Finds the charge states that make up the lower envelope of the formation energy as a function of Fermi energy.
+
+        The transition levels do not depend on the elemental chemical potentials, which shift every
+        charge state of this defect by the same amount.
+
+        Returns:
+            (np.array(int), np.array): the stable charge states, ordered by increasing Fermi energy,
+                                       and the Fermi energies (relative to the host VBM) of the transition levels between them."""
+        charges, breakpoints, _ = self.breakpoint_table()
+        return charges, breakpoints
+
+    def chemical_potential_terms( self, delta_mu ):
+        """Chemical potential contribution, -sum_i n_i (E_i + mu_i), to the formation energy of this defect.
+
+        Args:
+            delta_mu (dict, list(dict), or np.array): elemental chemical potentials.
+                Array input must have columns ordered as the sorted elements of self.stoichiometry,
+                as for DefectSet.elements.
 
         Returns:
-            points (np.array):"""
-        charge_state = self.charge_state_at_fermi_energy( ef_min )
-        points = [ ( ef_min, charge_state.formation_energy( ef_min, delta_mu ) ) ]
-        q1 = charge_state.charge
-        while q1 != min( self.charge_state_list() ):
-            next_point, next_q = min( ( ( self.transition_level( q1, q2, delta_mu ), q2 ) for q2 in ( q for q in self.charge_state if q < q1 ) ), key = lambda p : p[0][0] )
-            if next_point[0] < ef_max:
-                points.append( next_point )
-                q1 = next_q
-            else:
-                break
-        points.append( ( ef_max, self.charge_state[ q1 ].formation_energy( ef_max, delta_mu ) ) )
-        return np.array( points )
+            np.array: shape (n_points)."""
+        elements = sorted( self.stoichiometry )
+        mu = delta_mu_array( delta_mu, elements )
+        mu = mu + np.array( [ self.host.elemental_energies[ e ] for e in elements ], dtype = float )
+        return -np.dot( mu, np.array( [ self.stoichiometry[ e ] for e in elements ], dtype = float ) )
 
     def defect_energy_at_fermi_energy( self, e_fermi, delta_mu ):
-        return self.charge_state_at_fermi_energy( e_fermi ).formation_energy( e_fermi, delta_mu )
+        """Returns the formation energy of the lowest formation energy charge state.
+
+        Args:
+            e_fermi (float or np.array): Fermi energies (relative to the host VBM).
+            delta_mu (dict, list(dict), or np.array): elemental chemical potentials (see tl_profile).
+
+        Returns:
+            (float or np.array): formation energies, with the same shape as e_fermi for a single chemical
+                                 potential point, or with an additional leading n_points axis for multiple points."""
+        charges, breakpoints, intercepts = self.breakpoint_table()
+        e_fermi = np.asarray( e_fermi, dtype = float )
+        i = np.searchsorted( breakpoints, e_fermi )
+        energy = intercepts[ i ] + charges[ i ] * e_fermi
+        offsets = self.chemical_potential_terms( delta_mu )
+        if is_single_point( delta_mu ):
+            return energy + offsets[0]
+        return energy + offsets.reshape( ( -1, ) + ( 1, ) * e_fermi.ndim )
 
     def charge_state_list( self ):
         return [ q for q in self.charge_state ]
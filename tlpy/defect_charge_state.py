@@ -1,29 +1,107 @@
+from tlpy.correction import Correction
+
+# Setting any of these attributes changes the formation energy, so the parent Defect is told about it.
+_TRACKED_ATTRIBUTES = frozenset( ( 'energy', 'correction_scheme', 'potential_alignment' ) )
+
 class Defect_Charge_State:
+    """One charge state of a defect.
+
+    Every attribute is held in a slot, so that there is no per-object __dict__. The host and
+    stoichiometry are not stored per charge state, but are read from the parent Defect.
+    Reading an attribute is a plain slot lookup; setting energy, correction_scheme, or
+    potential_alignment also updates the parent Defect (cf. Host.revision).
+
+    Attributes:
+        charge (int): the defect charge.
+        energy (float): total energy of this charge state. Setting it updates the parent Defect.
+        degeneracy (float): degeneracy of this charge state.
+        correction_scheme (tlpy.correction.Correction or None): finite-size correction scheme for this charge state.
+                                                                Setting it updates the parent Defect.
+        potential_alignment (tlpy.correction.PotentialAlignment or None): potential alignment for this charge state.
+                                                                          Setting it updates the parent Defect.
+        correction (float): finite-size correction. Corrections from a correction scheme or potential alignment
+                            are cached, and recalculated after the host is changed or replaced (see
+                            Defect._check_corrections), or after correction_scheme or potential_alignment is changed.
+                            The default correction, host.correction_scaling * q^2, is calculated on every access.
+        defect (tlpy.defect.Defect or None): the parent Defect. This is None once the charge state has been
+                                             replaced by Defect.add_charge_state.
+        host (tlpy.host.Host): Host object of the parent Defect.
+        stoichiometry (dict): the change in stoichiometry of the parent Defect.
+    """
 
-    def __init__( self, charge, energy, host, stoichiometry ):
+    __slots__ = ( 'defect', 'charge', 'energy', 'degeneracy', 'correction_scheme', 'potential_alignment', '_correction' )
+
+    def __init__( self, charge, energy, defect, degeneracy = 1, correction_scheme = None, potential_alignment = None ):
+        self.defect = None
         self.charge = charge
         self.energy = energy
-        self.host = host
-#        self.correction = self.host.correction_scaling * self.charge * self.charge
-        self.stoichiometry = stoichiometry
+        self.degeneracy = degeneracy
+        self.correction_scheme = correction_scheme
+        self.potential_alignment = potential_alignment
+        self.defect = defect
+
+    def __setattr__( self, name, value ):
+        if name not in _TRACKED_ATTRIBUTES:
+            object.__setattr__( self, name, value )
+            return
+        defect = self.defect
+        previous_intercept = self.relative_formation_energy( 0.0 ) if defect is not None else None
+        object.__setattr__( self, name, value )
+        if name != 'energy':
+            object.__setattr__( self, '_correction', None )
+        if defect is not None:
+            defect._charge_state_changed( self, previous_intercept )
+
+    def __getstate__( self ):
+        return { name : getattr( self, name ) for name in self.__slots__ }
+
+    def __setstate__( self, state ):
+        # Restored slot by slot, bypassing __setattr__, since the parent Defect may only be partly unpickled.
+        for name, value in state.items():
+            object.__setattr__( self, name, value )
+
+    @property
+    def host( self ):
+        return self.defect.host
+
+    @property
+    def stoichiometry( self ):
+        return self.defect.stoichiometry
 
     def formation_energy( self, e_fermi, delta_mu ):
-        energy = self.energy - self.host.energy
-        for element in self.stoichiometry:
-            energy -= ( self.host.elemental_energies[ element ] + delta_mu[ element ] ) * self.stoichiometry[ element ]
-        energy += float( self.charge ) * ( self.host.vbm + e_fermi )
+        defect = self.defect
+        host = defect.host
+        stoichiometry = defect.stoichiometry
+        energy = self.energy - host.energy
+        for element in stoichiometry:
+            energy -= ( host.elemental_energies[ element ] + delta_mu[ element ] ) * stoichiometry[ element ]
+        energy += float( self.charge ) * ( host.vbm + e_fermi )
         energy += self.correction
         return energy
 
     def relative_formation_energy( self, e_fermi ):
-        energy = self.energy - self.host.energy
-        energy += float( self.charge ) * ( self.host.vbm + e_fermi )
+        host = self.defect.host
+        energy = self.energy - host.energy
+        energy += float( self.charge ) * ( host.vbm + e_fermi )
         energy += self.correction
         return energy
 
     @property
     def correction( self ):
-        return self.host.correction_scaling * self.charge * self.charge
+        defect = self.defect
+        host = defect.host
+        if self.correction_scheme is None and self.potential_alignment is None and host.correction_scheme is None:
+            return host.correction_scaling * self.charge * self.charge
+        defect._check_corrections()
+        if self._correction is None:
+            self._correction = self._calculate_correction( host )
+        return self._correction
+
+    def _calculate_correction( self, host ):
+        scheme = self.correction_scheme if self.correction_scheme is not None else host.correction_scheme
+        if scheme is None:
+            return host.correction_scaling * self.charge * self.charge + Correction.alignment_energy( self )
+        return scheme.energy( self )
 
 """
 Notes for the defect formation energy calculation approach currently used here:
@@ -45,8 +123,9 @@ The next term incorporates the Fermi energy (electronic chemical dependence) on
 
 The final term E_align includes a potential alignment term, and an image-charge correction term (finite size correction).
 
-The *current* implementation of the code neglects the potential alignment term (which should be an additional delta_E * q term): this code has previously only been used for defect calculations on Ge5O(PO4)6 in large enough unit cells that the potential alignment term was (I guess) negligible.
-The image charge correction term (as currently implemented) uses the Lany and Zunger "3rd order" correction scheme. This approximates the Makov-Payne correction (up to 3rd order) [1,2] with a scaled first order term (see Lany's `third_order_correction` code for details), that can be expressed as a constant energy, dependent on the supercell geometry and the host material (via the dielectric constant) multiplied by q^2. As currently implemented, the constant correction scaling factor is set in self.host.correction_scaling.
+By default the potential alignment term (an additional delta_E * q term) is neglected: this code has previously only been used for defect calculations on Ge5O(PO4)6 in large enough unit cells that the potential alignment term was (I guess) negligible. A potential alignment can be added to a charge state by setting self.potential_alignment to a tlpy.correction.PotentialAlignment object.
+The default image charge correction term uses the Lany and Zunger "3rd order" correction scheme. This approximates the Makov-Payne correction (up to 3rd order) [1,2] with a scaled first order term (see Lany's `third_order_correction` code for details), that can be expressed as a constant energy, dependent on the supercell geometry and the host material (via the dielectric constant) multiplied by q^2. This constant correction scaling factor is set in self.host.correction_scaling.
+Alternative correction schemes (Makov-Payne, Lany-Zunger, and Freysoldt) are implemented in tlpy.correction, and can be selected for every charge state through self.host.correction_scheme, or for one charge state through self.correction_scheme.
 
 [1] G. Makov and M. C. Payne, PRB 51, 4014 (1995)
 [2] S. Lany and A. Zunger, PRB 78, 235104 (2008)
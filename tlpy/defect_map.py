@@ -0,0 +1,113 @@
+from tlpy.defect_set import DefectSet
+from tlpy.envelope import lower_envelope
+from tlpy.fermi_level import self_consistent_fermi_energy
+
+import numpy as np
+
+def chemical_potential_grid( x_element, x, y_element, y, delta_mu, stability_region = None ):
+    """Builds a 2D grid of elemental chemical potentials.
+
+    Args:
+        x_element (str): element whose chemical potential varies along the x axis.
+        x (np.array): delta_mu values along the x axis.
+        y_element (str): element whose chemical potential varies along the y axis.
+        y (np.array): delta_mu values along the y axis.
+        delta_mu (dict): fixed chemical potentials for any other elements.
+        stability_region (Optional(tlpy.stability_region.StabilityRegion)): if given, the chemical potential
+            of the one host element not otherwise specified is set by the host stability condition,
+            and grid points outside the stability region are flagged.
+
+    Returns:
+        (dict, np.array(bool)): chemical potentials for every element, as a dict of arrays with shape (n_y, n_x),
+                                and a mask that is False for grid points outside the stability region.
+
+    Raises:
+        ValueError: if a stability region is given, but does not leave exactly one host element to be constrained."""
+    grid_x, grid_y = np.meshgrid( np.asarray( x, dtype = float ), np.asarray( y, dtype = float ) )
+    mu = { e : np.full( grid_x.shape, float( v ) ) for e, v in delta_mu.items() }
+    mu[ x_element ] = grid_x
+    mu[ y_element ] = grid_y
+    inside = np.ones( grid_x.shape, dtype = bool )
+    if stability_region is not None:
+        dependent = [ e for e in stability_region.elements if e not in mu ]
+        if len( dependent ) != 1:
+            raise ValueError( 'Exactly one host element must be left for the stability condition to constrain, not {}'.format( dependent ) )
+        dependent = dependent[0]
+        composition = dict( zip( stability_region.elements, stability_region.host_composition ) )
+        mu[ dependent ] = ( stability_region.formation_enthalpy
+                            - sum( composition[ e ] * mu[ e ] for e in stability_region.elements if e != dependent ) ) / composition[ dependent ]
+        points = np.stack( [ mu[ e ].ravel() for e in stability_region.elements ], axis = 1 )
+        inside = stability_region.contains( points ).reshape( grid_x.shape )
+    return mu, inside
+
+def dominant_defect_map( defects, x_element, x, y_element, y, delta_mu, e_fermi = None, temperature = None,
+                         stability_region = None, site_densities = None, tolerance = 1e-8 ):
+    """Finds the lowest formation energy defect and charge state at every point of a 2D chemical potential grid.
+
+    For a fixed Fermi energy, the lowest energy charge state of each defect does not depend on the chemical
+    potentials, so the charge state minimum is taken once over the (n_defects, n_charge_states) intercept array,
+    and only the defect minimum is broadcast over the grid.
+
+    Without a fixed Fermi energy, the self-consistent Fermi energy is found at every grid point
+    (see tlpy.fermi_level.self_consistent_fermi_energy), without calculating the concentrations, which are not needed.
+    The lowest energy charge state of each defect at each of these Fermi energies is then read from the lower envelope
+    of its charge states, so that no (n_defects, n_charge_states, n_points) array is built. A looser tolerance needs
+    fewer root finding steps, and rarely changes which defect is dominant.
+
+    Args:
+        defects (list(tlpy.defect.Defect) or tlpy.defect_set.DefectSet): the defects.
+        x_element (str): element whose chemical potential varies along the x axis.
+        x (np.array): delta_mu values along the x axis.
+        y_element (str): element whose chemical potential varies along the y axis.
+        y (np.array): delta_mu values along the y axis.
+        delta_mu (dict): fixed chemical potentials for any other elements.
+        e_fermi (Optional(float)): Fermi energy (relative to the host VBM).
+                                   If this is not given, the self-consistent Fermi energy is found at each grid point.
+        temperature (Optional(float)): temperature (K) for the self-consistent Fermi energy.
+        stability_region (Optional(tlpy.stability_region.StabilityRegion)): constrains the chemical potential of
+            the one remaining host element, and flags grid points where the host is unstable.
+        site_densities (Optional(dict)): site densities for the self-consistent Fermi energy. Defaults to the host site densities.
+        tolerance (Optional(float)): convergence tolerance for the self-consistent Fermi energy (eV). Defaults to 1e-8 eV.
+
+    Returns:
+        (np.array(int), np.array(int), np.array): the index of the dominant defect, its charge, and its formation energy,
+                                                  each with shape (n_y, n_x). Grid points outside the stability region
+                                                  have a defect index of -1 and a formation energy of np.nan.
+
+    Raises:
+        ValueError: if neither e_fermi nor temperature is given."""
+    defect_set = defects if isinstance( defects, DefectSet ) else DefectSet( defects )
+    mu, inside = chemical_potential_grid( x_element, x, y_element, y, delta_mu, stability_region )
+    shape = inside.shape
+    offsets = defect_set.chemical_potential_terms( mu )
+    if e_fermi is not None:
+        energies = defect_set.reference_energies + defect_set.charges * e_fermi
+        best_charge = np.argmin( energies, axis = 1 )
+        rows = np.arange( len( defect_set ) )
+        energies = energies[ rows, best_charge ][ :, np.newaxis ] + offsets
+        best_defect = np.argmin( energies, axis = 0 )
+        charge = defect_set.charges[ best_defect, best_charge[ best_defect ] ]
+    else:
+        if temperature is None:
+            raise ValueError( 'Either a Fermi energy or a temperature must be given' )
+        e_fermi, _ = self_consistent_fermi_energy( defect_set, defect_set.host, mu, temperature, site_densities,
+                                                   tolerance = tolerance, return_concentrations = False )
+        e_fermi = e_fermi[ :, 0 ]
+        energies = np.empty( offsets.shape )
+        charges = np.empty( offsets.shape, dtype = int )
+        for i in range( len( defect_set ) ):
+            used = defect_set.mask[ i ]
+            envelope_charges = defect_set.charges[ i ][ used ]
+            intercepts = defect_set.reference_energies[ i ][ used ]
+            hull, breakpoints = lower_envelope( envelope_charges, intercepts )
+            segment = np.searchsorted( breakpoints, e_fermi )
+            charges[ i ] = envelope_charges[ hull ][ segment ]
+            energies[ i ] = intercepts[ hull ][ segment ] + charges[ i ] * e_fermi + offsets[ i ]
+        best_defect = np.argmin( energies, axis = 0 )
+        charge = charges[ best_defect, np.arange( len( best_defect ) ) ]
+    points = np.arange( energies.shape[1] )
+    energy = energies[ best_defect, points ]
+    best_defect = np.where( inside.ravel(), best_defect, -1 ).reshape( shape )
+    charge = np.where( inside.ravel(), charge, 0 ).reshape( shape )
+    energy = np.where( inside.ravel(), energy, np.nan ).reshape( shape )
+    return best_defect, charge, energy
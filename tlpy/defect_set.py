@@ -0,0 +1,276 @@
+from tlpy.chemical_potential import delta_mu_array
+from tlpy.correction import FixedCorrection
+from tlpy.defect import Defect
+
+import numpy as np
+
+def _as_number( x ):
+    x = float( x )
+    return int( x ) if x.is_integer() else x
+
+class DefectSet:
+    """A collection of defects, packed into arrays for batched formation energy calculations.
+
+    Charge states are stored in a rectangular (n_defects, n_charge_states) layout, where n_charge_states
+    is the largest number of charge states for any one defect. Within each row, charge states are sorted
+    by increasing charge. Unused slots are flagged as False in `mask`, and have infinite formation energies.
+
+    The arrays are a snapshot of the defects and host at the time the DefectSet is created.
+    A DefectSet can also be created directly from arrays (see from_arrays and tlpy.database.load_defect_set),
+    in which case Defect objects are only built when they are accessed.
+    The defects passed to a DefectSet are not changed by it.
+
+    Attributes:
+        defects (list(tlpy.defect.Defect)): the defects in this set.
+        host (tlpy.host.Host): Host object shared by every defect in this set.
+        names (list(str)): defect names.
+        sites (list(str)): defect site labels.
+        elements (list(str)): every element that appears in any defect stoichiometry, in sorted order.
+        charges (np.array): defect charges, with shape (n_defects, n_charge_states).
+        energies (np.array): raw charge state energies, with shape (n_defects, n_charge_states).
+        corrections (np.array): finite-size corrections, with shape (n_defects, n_charge_states).
+        degeneracies (np.array): charge state degeneracies, with shape (n_defects, n_charge_states).
+        mask (np.array(bool)): True for every slot that holds a charge state.
+        stoichiometry (np.array): change in stoichiometry for each defect, with shape (n_defects, n_elements).
+        elemental_energies (np.array): host elemental reference energies, with shape (n_elements).
+        row_revisions (np.array(int)): incremented for each defect every time its row of the packed arrays changes.
+                                       Consumers of the arrays can compare these to find which defects need recalculating.
+        reference_energies (np.array): formation energies at E_Fermi = 0 and delta_mu = 0, excluding the
+                                       elemental reference energies, with shape (n_defects, n_charge_states).
+                                       These are equal to Defect_Charge_State.relative_formation_energy( 0.0 ).
+    """
+
+    def __init__( self, defects ):
+        """Create a DefectSet object.
+
+        Args:
+            defects (list(tlpy.defect.Defect)): the defects to pack into this set.
+
+        Raises:
+            ValueError: if the defects do not all share the same Host object."""
+        self._defects = list( defects )
+        hosts = set( id( d.host ) for d in self._defects )
+        if len( hosts ) > 1:
+            raise ValueError( 'All defects in a DefectSet must share the same Host' )
+        self.host = self._defects[0].host if self._defects else None
+        self.names = [ d.name for d in self._defects ]
+        self.sites = [ d.site for d in self._defects ]
+        self.elements = sorted( set( e for d in self._defects for e in d.stoichiometry ) )
+        n_defects = len( self._defects )
+        n_charge_states = max( [ len( d.charge_state ) for d in self._defects ] + [ 0 ] )
+        shape = ( n_defects, n_charge_states )
+        self.charges = np.zeros( shape, dtype = int )
+        self.energies = np.full( shape, np.nan )
+        self.corrections = np.zeros( shape )
+        self.degeneracies = np.ones( shape )
+        self.mask = np.zeros( shape, dtype = bool )
+        self.stoichiometry = np.array( [ [ d.stoichiometry.get( e, 0 ) for e in self.elements ] for d in self._defects ],
+                                       dtype = float ).reshape( n_defects, len( self.elements ) )
+        self.row_revisions = np.zeros( n_defects, dtype = int )
+        self._defect_revisions = [ None ] * n_defects
+        self._pack_host()
+        for i in range( n_defects ):
+            self._pack_row( i )
+        self.row_revisions[:] = 0
+
+    @classmethod
+    def from_arrays( cls, host, names, sites, elements, stoichiometry, charges, energies, corrections, degeneracies, mask ):
+        """Create a DefectSet directly from packed arrays, without creating any Defect objects.
+
+        The arrays are used as given, so memory-mapped arrays stay memory-mapped.
+        Defect objects are only built when they are accessed through `defects` or `defect()`.
+
+        Args:
+            host (tlpy.host.Host): Host object shared by every defect.
+            names (np.array(str)): defect names, with shape (n_defects).
+            sites (np.array(str)): defect site labels, with shape (n_defects).
+            elements (list(str)): element labels for the stoichiometry columns.
+            stoichiometry (np.array): change in stoichiometry for each defect, with shape (n_defects, n_elements).
+            charges (np.array(int)): with shape (n_defects, n_charge_states).
+            energies (np.array): with shape (n_defects, n_charge_states).
+            corrections (np.array): with shape (n_defects, n_charge_states).
+            degeneracies (np.array): with shape (n_defects, n_charge_states).
+            mask (np.array(bool)): with shape (n_defects, n_charge_states).
+
+        Returns:
+            DefectSet"""
+        defect_set = cls.__new__( cls )
+        defect_set._defects = [ None ] * len( names )
+        defect_set.host = host
+        defect_set.names = names
+        defect_set.sites = sites
+        defect_set.elements = [ str( e ) for e in elements ]
+        defect_set.stoichiometry = stoichiometry
+        defect_set.charges = charges
+        defect_set.energies = energies
+        defect_set.corrections = corrections
+        defect_set.degeneracies = degeneracies
+        defect_set.mask = mask
+        defect_set.row_revisions = np.zeros( len( names ), dtype = int )
+        defect_set._defect_revisions = [ None ] * len( names )
+        defect_set._pack_host()
+        return defect_set
+
+    def arrays( self ):
+        """The packed per-defect arrays, as keyword arguments for from_arrays.
+
+        Returns:
+            dict: names, sites, elements, stoichiometry, charges, energies, corrections, degeneracies, and mask."""
+        return { 'names'         : self.names,
+                 'sites'         : self.sites,
+                 'elements'      : self.elements,
+                 'stoichiometry' : self.stoichiometry,
+                 'charges'       : self.charges,
+                 'energies'      : self.energies,
+                 'corrections'   : self.corrections,
+                 'degeneracies'  : self.degeneracies,
+                 'mask'          : self.mask }
+
+    def _pack_host( self ):
+        self._host_revision = self.host.revision if self.host is not None else None
+        if self.host is None:
+            self.elemental_energies = np.zeros( 0 )
+            self.reference_energies = np.zeros( self.mask.shape )
+        else:
+            self.elemental_energies = np.array( [ self.host.elemental_energies[ e ] for e in self.elements ], dtype = float )
+            self.reference_energies = np.where( self.mask,
+                                                self.energies - self.host.energy + self.charges * self.host.vbm + self.corrections,
+                                                np.inf )
+
+    def _pack_row( self, i ):
+        """Copies the charge states of one Defect object into row i of the packed arrays."""
+        defect = self._defects[ i ]
+        charges = sorted( defect.charge_state )
+        if len( charges ) > self.mask.shape[1]:
+            self._grow( len( charges ) )
+        self.charges[ i ] = 0
+        self.energies[ i ] = np.nan
+        self.corrections[ i ] = 0.0
+        self.degeneracies[ i ] = 1.0
+        self.mask[ i ] = False
+        for j, q in enumerate( charges ):
+            self.charges[ i, j ] = q
+            self.energies[ i, j ] = defect.charge_state[ q ].energy
+            self.corrections[ i, j ] = defect.charge_state[ q ].correction
+            self.degeneracies[ i, j ] = defect.charge_state[ q ].degeneracy
+            self.mask[ i, j ] = True
+        if self.host is not None:
+            self.reference_energies[ i ] = np.where( self.mask[ i ],
+                                                     self.energies[ i ] - self.host.energy + self.charges[ i ] * self.host.vbm + self.corrections[ i ],
+                                                     np.inf )
+        self._defect_revisions[ i ] = defect.revision
+        self.row_revisions[ i ] += 1
+
+    def _grow( self, n_charge_states ):
+        """Adds unused charge state slots, so that every row can hold n_charge_states charge states."""
+        padding = ( ( 0, 0 ), ( 0, n_charge_states - self.mask.shape[1] ) )
+        self.charges = np.pad( self.charges, padding, constant_values = 0 )
+        self.energies = np.pad( self.energies, padding, constant_values = np.nan )
+        self.corrections = np.pad( self.corrections, padding, constant_values = 0.0 )
+        self.degeneracies = np.pad( self.degeneracies, padding, constant_values = 1.0 )
+        self.mask = np.pad( self.mask, padding, constant_values = False )
+        self.reference_energies = np.pad( self.reference_energies, padding, constant_values = np.inf )
+
+    def update_charge_state( self, i, charge, energy ):
+        """Sets the energy of one charge state of one defect, adding the charge state if necessary.
+
+        Only the Defect object and the packed arrays for this one defect are updated.
+        Sets loaded with a read-only memory map (mmap_mode = 'r') cannot be updated.
+
+        Args:
+            i (int): defect index.
+            charge (int): charge for the charge state.
+            energy (float): new energy of this charge state.
+
+        Returns:
+            None"""
+        self.defect( i ).update_charge_state( charge, energy )
+        self._pack_row( i )
+
+    def refresh( self ):
+        """Repacks the rows for any Defect objects that have changed since they were packed.
+
+        If the Host has changed, the reference energies are recalculated for every row. Rows for
+        defects that have never been built as Defect objects keep their stored corrections.
+
+        Returns:
+            np.array(int): the indices of the rows that have changed."""
+        changed = set()
+        if self.host is not None and self.host.revision != self._host_revision:
+            self._pack_host()
+            self.row_revisions += 1
+            changed.update( range( len( self ) ) )
+        for i, defect in enumerate( self._defects ):
+            if defect is not None and defect.revision != self._defect_revisions[ i ]:
+                self._pack_row( i )
+                changed.add( i )
+        return np.array( sorted( changed ), dtype = int )
+
+    def __len__( self ):
+        return len( self._defects )
+
+    @property
+    def defects( self ):
+        return [ self.defect( i ) for i in range( len( self ) ) ]
+
+    def defect( self, i ):
+        """Returns one defect from this set, building the Defect object from the packed arrays if necessary.
+
+        The charge states of a Defect built from the packed arrays keep the stored corrections
+        (as a tlpy.correction.FixedCorrection for each charge state), rather than recalculating them from the Host.
+
+        Args:
+            i (int): defect index.
+
+        Returns:
+            (tlpy.defect.Defect)"""
+        if self._defects[ i ] is None:
+            stoichiometry = { e : _as_number( n ) for e, n in zip( self.elements, self.stoichiometry[ i ] ) if n != 0 }
+            defect = Defect( str( self.names[ i ] ), stoichiometry, self.host, str( self.sites[ i ] ) )
+            for j in np.flatnonzero( self.mask[ i ] ):
+                defect.add_charge_state( int( self.charges[ i, j ] ), float( self.energies[ i, j ] ), _as_number( self.degeneracies[ i, j ] ),
+                                         correction_scheme = FixedCorrection( float( self.corrections[ i, j ] ) ) )
+            self._defects[ i ] = defect
+            self._defect_revisions[ i ] = defect.revision
+        return self._defects[ i ]
+
+    def chemical_potential_terms( self, delta_mu, rows = None ):
+        """Chemical potential contribution, -sum_i n_i (E_i + mu_i), to the formation energy of each defect.
+
+        Args:
+            delta_mu (dict, list(dict), or np.array): elemental chemical potentials.
+                See tlpy.chemical_potential.delta_mu_array for the accepted formats.
+            rows (Optional(np.array(int))): only calculate for these defects. Defaults to every defect.
+
+        Returns:
+            np.array: shape (n_defects, n_points)."""
+        mu = delta_mu_array( delta_mu, self.elements ) + self.elemental_energies
+        stoichiometry = self.stoichiometry if rows is None else self.stoichiometry[ rows ]
+        return -np.dot( stoichiometry, mu.T )
+
+    def intercepts( self, delta_mu, rows = None ):
+        """Formation energies of every charge state at E_Fermi = 0 (i.e. at the host VBM).
+
+        Args:
+            delta_mu (dict, list(dict), or np.array): elemental chemical potentials.
+            rows (Optional(np.array(int))): only calculate for these defects. Defaults to every defect.
+
+        Returns:
+            np.array: shape (n_defects, n_charge_states, n_points). Unused slots are np.inf."""
+        reference_energies = self.reference_energies if rows is None else self.reference_energies[ rows ]
+        return reference_energies[ :, :, np.newaxis ] + self.chemical_potential_terms( delta_mu, rows )[ :, np.newaxis, : ]
+
+    def formation_energies( self, e_fermi, delta_mu, rows = None ):
+        """Formation energies of every charge state, for every combination of Fermi energy and chemical potentials.
+
+        Args:
+            e_fermi (float or np.array): Fermi energies (relative to the host VBM).
+            delta_mu (dict, list(dict), or np.array): elemental chemical potentials.
+            rows (Optional(np.array(int))): only calculate for these defects. Defaults to every defect.
+
+        Returns:
+            np.array: shape (n_defects, n_charge_states, n_fermi_energies, n_points). Unused slots are np.inf."""
+        e_fermi = np.atleast_1d( np.asarray( e_fermi, dtype = float ) )
+        charges = self.charges if rows is None else self.charges[ rows ]
+        return ( self.intercepts( delta_mu, rows )[ :, :, np.newaxis, : ]
+                 + charges[ :, :, np.newaxis, np.newaxis ] * e_fermi[ np.newaxis, np.newaxis, :, np.newaxis ] )
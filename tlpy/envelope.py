@@ -0,0 +1,62 @@
+import numpy as np
+
+def lower_envelope( slopes, intercepts ):
+    """Finds the lower envelope of a set of straight lines, y = intercept + slope * x.
+
+    For defect formation energies the slopes are the defect charges, and the intercepts are the
+    formation energies at E_Fermi = 0, so the lower envelope gives the stable charge state at each
+    Fermi energy, and the breakpoints are the thermodynamic transition levels.
+
+    The envelope is constructed in O(n log n) time by sorting the lines by decreasing slope
+    and sweeping through them once (the "convex hull trick").
+
+    Args:
+        slopes (np.array): line slopes.
+        intercepts (np.array): line intercepts.
+
+    Returns:
+        (np.array(int), np.array): indices of the lines that make up the envelope, ordered by increasing x,
+                                   and the x values of the breakpoints between consecutive envelope lines."""
+    slopes = np.asarray( slopes, dtype = float )
+    intercepts = np.asarray( intercepts, dtype = float )
+    # sort by decreasing slope, then by increasing intercept, so that the first of any parallel lines is the lowest.
+    order = np.lexsort( ( intercepts, -slopes ) )
+    hull = []
+    for i in order:
+        if hull and slopes[ hull[-1] ] == slopes[ i ]:
+            continue
+        while len( hull ) > 1:
+            j, k = hull[-2], hull[-1]
+            # line k is redundant if line i overtakes line j no later than line k does.
+            if ( intercepts[ i ] - intercepts[ j ] ) * ( slopes[ j ] - slopes[ k ] ) <= ( intercepts[ k ] - intercepts[ j ] ) * ( slopes[ j ] - slopes[ i ] ):
+                hull.pop()
+            else:
+                break
+        hull.append( i )
+    hull = np.array( hull, dtype = int )
+    breakpoints = ( intercepts[ hull[1:] ] - intercepts[ hull[:-1] ] ) / ( slopes[ hull[:-1] ] - slopes[ hull[1:] ] )
+    return hull, breakpoints
+
+def envelope_profile( slopes, breakpoints, intercepts, offsets, x_min, x_max ):
+    """The (x, y) points along a lower envelope between x_min and x_max, for each of a set of constant offsets.
+
+    Args:
+        slopes (np.array): slopes of the envelope lines, ordered by increasing x.
+        breakpoints (np.array): x values of the breakpoints between consecutive envelope lines.
+        intercepts (np.array): intercepts of the envelope lines.
+        offsets (np.array): constant offsets added to the envelope, with shape (n_offsets).
+        x_min (float): first x value.
+        x_max (float): last x value.
+
+    Returns:
+        np.array: (x, y) points at x_min, every breakpoint between x_min and x_max, and x_max,
+                  with shape (n_offsets, n_breakpoints + 2, 2)."""
+    first = np.searchsorted( breakpoints, x_min, side = 'right' )
+    last = np.searchsorted( breakpoints, x_max, side = 'left' )
+    x = np.concatenate( ( [ x_min ], breakpoints[ first:last ], [ x_max ] ) )
+    segment = np.concatenate( ( [ first ], np.arange( first, last ), [ last ] ) )
+    y = intercepts[ segment ] + slopes[ segment ] * x
+    points = np.empty( ( len( offsets ), len( x ), 2 ) )
+    points[ :, :, 0 ] = x
+    points[ :, :, 1 ] = y + np.asarray( offsets )[ :, np.newaxis ]
+    return points
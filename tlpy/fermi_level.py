@@ -0,0 +1,284 @@
+from tlpy.concentration import BOLTZMANN_CONSTANT, log_prefactors, logsumexp
+from tlpy.defect_set import DefectSet
+
+import warnings
+
+import numpy as np
+
+EFFECTIVE_DOS_300K = 2.5094e19 # cm^-3, 2 ( 2 pi m_e k T / h^2 )^(3/2) at T = 300 K
+
+def log_carrier_concentrations( host, e_fermi, temperature, electron_dos_mass = 1.0, hole_dos_mass = 1.0 ):
+    """Natural logarithms of the free electron and hole concentrations, using parabolic bands and Boltzmann statistics.
+
+    Args:
+        host (tlpy.host.Host): Host object.
+        e_fermi (np.array): Fermi energies (relative to the host VBM).
+        temperature (np.array): temperatures (K). Must broadcast against e_fermi.
+        electron_dos_mass (Optional(float)): conduction band density-of-states effective mass (units of m_e). Defaults to 1.
+        hole_dos_mass (Optional(float)): valence band density-of-states effective mass (units of m_e). Defaults to 1.
+
+    Returns:
+        (np.array, np.array): log( n ) and log( p ), with n and p in cm^-3."""
+    temperature = np.asarray( temperature, dtype = float )
+    kT = BOLTZMANN_CONSTANT * temperature
+    log_nc = np.log( EFFECTIVE_DOS_300K * electron_dos_mass**1.5 ) + 1.5 * np.log( temperature / 300.0 )
+    log_nv = np.log( EFFECTIVE_DOS_300K * hole_dos_mass**1.5 ) + 1.5 * np.log( temperature / 300.0 )
+    log_n = log_nc - ( host.fundamental_gap - e_fermi ) / kT
+    log_p = log_nv - e_fermi / kT
+    return log_n, log_p
+
+def carrier_concentrations( host, e_fermi, temperature, electron_dos_mass = 1.0, hole_dos_mass = 1.0 ):
+    """Free electron and hole concentrations, using parabolic bands and Boltzmann statistics.
+
+    Args:
+        host (tlpy.host.Host): Host object.
+        e_fermi (np.array): Fermi energies (relative to the host VBM).
+        temperature (np.array): temperatures (K). Must broadcast against e_fermi.
+        electron_dos_mass (Optional(float)): conduction band density-of-states effective mass (units of m_e). Defaults to 1.
+        hole_dos_mass (Optional(float)): valence band density-of-states effective mass (units of m_e). Defaults to 1.
+
+    Returns:
+        (np.array, np.array): electron and hole concentrations, n and p (cm^-3)."""
+    log_n, log_p = log_carrier_concentrations( host, e_fermi, temperature, electron_dos_mass, hole_dos_mass )
+    return np.exp( log_n ), np.exp( log_p )
+
+class CarrierTable:
+    """Free electron and hole concentrations from a host density of states, tabulated over temperature and Fermi energy.
+
+    The Fermi-Dirac integrals over the conduction and valence bands,
+
+        n = int_{E > cbm} g(E) f(E) dE,    p = int_{E < vbm} g(E) ( 1 - f(E) ) dE,
+
+    are evaluated once, with the trapezium rule on the DOS energy grid, for every temperature on a
+    uniform grid of Fermi energies. The tables store log( n ) and log( p ), which are close to linear in
+    the Fermi energy and in 1 / T, and later evaluations interpolate linearly in Fermi energy and inverse temperature.
+    Values at the tabulated temperatures are exact up to the Fermi energy interpolation.
+
+    Attributes:
+        temperatures (np.array): tabulated temperatures (K), in increasing order.
+        e_fermi (np.array): tabulated Fermi energies (relative to the host VBM), on a uniform grid.
+        log_n (np.array): log electron concentrations (cm^-3), with shape (n_temperatures, n_fermi_energies).
+        log_p (np.array): log hole concentrations (cm^-3), with shape (n_temperatures, n_fermi_energies).
+    """
+
+    def __init__( self, host, temperatures, ef_min = None, ef_max = None, spacing = 0.002, block_size = 256 ):
+        """Create a CarrierTable object.
+
+        Args:
+            host (tlpy.host.Host): Host object, with a density of states.
+            temperatures (float or np.array): temperatures to tabulate (K).
+            ef_min (Optional(float)): lowest tabulated Fermi energy (relative to the host VBM). Defaults to 0.0 eV.
+            ef_max (Optional(float)): highest tabulated Fermi energy (relative to the host VBM). Defaults to the host fundamental gap.
+            spacing (Optional(float)): largest Fermi energy grid spacing (eV). Defaults to 0.002 eV.
+            block_size (Optional(int)): number of Fermi energies integrated at once, which limits the memory used. Defaults to 256.
+
+        Raises:
+            ValueError: if the host does not have a density of states."""
+        if host.dos is None:
+            raise ValueError( 'The host does not have a density of states' )
+        ef_min = 0.0 if ef_min is None else float( ef_min )
+        ef_max = host.fundamental_gap if ef_max is None else float( ef_max )
+        self.temperatures = np.unique( np.atleast_1d( np.asarray( temperatures, dtype = float ) ) )
+        self.e_fermi = np.linspace( ef_min, ef_max, max( int( np.ceil( ( ef_max - ef_min ) / spacing ) ), 1 ) + 1 )
+        energies, dos = host.dos[ :, 0 ], host.dos[ :, 1 ]
+        weights = np.zeros( len( energies ) )
+        widths = np.diff( energies )
+        weights[ :-1 ] += 0.5 * widths
+        weights[ 1: ] += 0.5 * widths
+        with np.errstate( divide = 'ignore' ):
+            log_weights = np.log( weights * dos )
+        conduction = energies >= host.cbm
+        valence = energies <= host.vbm
+        energies = energies - host.vbm
+        shape = ( len( self.temperatures ), len( self.e_fermi ) )
+        self.log_n = np.empty( shape )
+        self.log_p = np.empty( shape )
+        for i, kT in enumerate( BOLTZMANN_CONSTANT * self.temperatures ):
+            for start in range( 0, len( self.e_fermi ), block_size ):
+                e_fermi = self.e_fermi[ start:start + block_size, np.newaxis ]
+                block = slice( start, start + block_size )
+                # log f( E ) = -log( 1 + exp( ( E - E_F ) / kT ) ), and log( 1 - f( E ) ) = -log( 1 + exp( ( E_F - E ) / kT ) ).
+                self.log_n[ i, block ] = logsumexp( log_weights[ conduction ]
+                                                    - np.logaddexp( 0.0, ( energies[ conduction ] - e_fermi ) / kT ), axis = 1 )
+                self.log_p[ i, block ] = logsumexp( log_weights[ valence ]
+                                                    - np.logaddexp( 0.0, ( e_fermi - energies[ valence ] ) / kT ), axis = 1 )
+        # A finite floor for bands with no states, so that interpolation weights of zero do not give 0 * -inf.
+        self.log_n = np.maximum( self.log_n, -1e300 )
+        self.log_p = np.maximum( self.log_p, -1e300 )
+
+    def _interpolate( self, table, e_fermi, temperature ):
+        n_e, n_t = len( self.e_fermi ), len( self.temperatures )
+        x = ( e_fermi - self.e_fermi[0] ) / ( self.e_fermi[-1] - self.e_fermi[0] ) * ( n_e - 1 )
+        i = np.clip( np.floor( x ).astype( int ), 0, n_e - 2 )
+        fx = x - i
+        if n_t == 1:
+            return ( 1.0 - fx ) * table[ 0, i ] + fx * table[ 0, i + 1 ]
+        t = np.clip( np.searchsorted( self.temperatures, temperature ) - 1, 0, n_t - 2 )
+        # log( n ) and log( p ) are close to linear in 1 / T.
+        ft = ( 1.0 / temperature - 1.0 / self.temperatures[ t ] ) / ( 1.0 / self.temperatures[ t + 1 ] - 1.0 / self.temperatures[ t ] )
+        lower = ( 1.0 - fx ) * table[ t, i ] + fx * table[ t, i + 1 ]
+        upper = ( 1.0 - fx ) * table[ t + 1, i ] + fx * table[ t + 1, i + 1 ]
+        return ( 1.0 - ft ) * lower + ft * upper
+
+    def log_carrier_concentrations( self, e_fermi, temperature ):
+        """Natural logarithms of the free electron and hole concentrations, interpolated from the tables.
+
+        Fermi energies and temperatures outside the table are extrapolated linearly from the nearest tabulated interval.
+        A table with a single temperature is used for every temperature.
+
+        Args:
+            e_fermi (np.array): Fermi energies (relative to the host VBM).
+            temperature (np.array): temperatures (K). Must broadcast against e_fermi.
+
+        Returns:
+            (np.array, np.array): log( n ) and log( p ), with n and p in cm^-3."""
+        e_fermi, temperature = np.broadcast_arrays( np.asarray( e_fermi, dtype = float ), np.asarray( temperature, dtype = float ) )
+        return self._interpolate( self.log_n, e_fermi, temperature ), self._interpolate( self.log_p, e_fermi, temperature )
+
+def self_consistent_fermi_energy( defects, host, delta_mu, temperature, site_densities = None,
+                                  electron_dos_mass = 1.0, hole_dos_mass = 1.0,
+                                  ef_min = None, ef_max = None, tolerance = 1e-8, carrier_table = None,
+                                  return_concentrations = True, return_pinned = False ):
+    """Solves the charge neutrality condition for the equilibrium Fermi energy, for every combination of chemical potentials and temperature.
+
+    Every condition is solved simultaneously on arrays, by bracketed root finding on the log of the ratio of
+    the positive and negative charge, which is found from the log-sum-exp of the positive and negative charge
+    contributions, so that very large or very small concentrations neither overflow nor underflow.
+    Each step is an Illinois (modified regula falsi) step, or a bisection step if the bracket is not shrinking fast
+    enough, and only the conditions that have not yet converged are stepped, so most conditions take a few steps.
+    Every charge state with the same charge q depends on the Fermi energy through the same factor
+    exp( -q E_Fermi / kT ), so their contributions are summed once, before the root finding starts,
+    and each step only sums over the distinct charges.
+
+    If the host has a density of states, the free carrier concentrations are interpolated from a CarrierTable,
+    which is built once for every temperature before the root finding starts. Otherwise parabolic bands are assumed.
+
+    The net charge decreases with increasing Fermi energy, so charge neutrality has a solution in [ef_min, ef_max]
+    only if the net charge is positive at ef_min and negative at ef_max. Conditions without a solution are pinned:
+    their Fermi energy is set to ef_min (if the net charge is negative everywhere) or ef_max (if it is positive everywhere),
+    these are not charge neutral, and a RuntimeWarning is issued. Pass return_pinned = True to find which conditions these are.
+
+    Args:
+        defects (list(tlpy.defect.Defect) or tlpy.defect_set.DefectSet): the defects to include.
+        host (tlpy.host.Host): Host object.
+        delta_mu (dict, list(dict), or np.array): elemental chemical potentials.
+            See tlpy.chemical_potential.delta_mu_array for the accepted formats.
+        temperature (float or np.array): temperatures (K).
+        site_densities (Optional(dict)): number of sites per cm^3 for each defect site label, e.g. { 'O' : 4.2e22 }.
+                                         Defaults to the host site densities.
+        electron_dos_mass (Optional(float)): conduction band density-of-states effective mass (units of m_e). Defaults to 1.
+        hole_dos_mass (Optional(float)): valence band density-of-states effective mass (units of m_e). Defaults to 1.
+        ef_min (Optional(float)): lower bound for the Fermi energy (relative to the host VBM). Defaults to 0.0 eV.
+        ef_max (Optional(float)): upper bound for the Fermi energy (relative to the host VBM). Defaults to the host fundamental gap.
+        tolerance (Optional(float)): convergence tolerance for the Fermi energy (eV). Defaults to 1e-8 eV.
+        carrier_table (Optional(tlpy.fermi_level.CarrierTable)): precomputed carrier concentration table, which can be reused
+                                                                 between calls. Defaults to a new table if the host has a density of states.
+        return_concentrations (Optional(bool)): if False, the concentrations are not calculated, and None is returned in their place.
+                                                Defaults to True.
+        return_pinned (Optional(bool)): also return a mask of the conditions that are pinned at ef_min or ef_max. Defaults to False.
+
+    Returns:
+        (np.array, np.array): the equilibrium Fermi energies, with shape (n_points, n_temperatures),
+                              and the concentration of every defect charge state (cm^-3) at these Fermi energies,
+                              including site multiplicities and charge state degeneracies,
+                              with shape (n_defects, n_charge_states, n_points, n_temperatures).
+        If return_pinned is True, a third np.array(bool), with shape (n_points, n_temperatures), is True for every
+        condition without a charge neutral Fermi energy in [ef_min, ef_max].
+
+    Raises:
+        KeyError: if a site density or chemical potential is missing."""
+    defect_set = defects if isinstance( defects, DefectSet ) else DefectSet( defects )
+    if ef_min is None:
+        ef_min = 0.0
+    if ef_max is None:
+        ef_max = host.fundamental_gap
+    temperature = np.atleast_1d( np.asarray( temperature, dtype = float ) )
+    kT = BOLTZMANN_CONSTANT * temperature
+    # log c = log( N_site g ) - ( reference energy + chemical potential terms + q E_Fermi ) / kT, split into
+    # a (n_defects, n_charge_states, n_temperatures) part, and a (n_defects, n_points, n_temperatures) part.
+    constants = log_prefactors( defect_set, site_densities )[ :, :, np.newaxis ] - defect_set.reference_energies[ :, :, np.newaxis ] / kT
+    offsets = defect_set.chemical_potential_terms( delta_mu )[ :, :, np.newaxis ] / kT
+
+    if carrier_table is None and host.dos is not None:
+        carrier_table = CarrierTable( host, temperature, ef_min, ef_max )
+
+    # log( sum of |q| c ) at E_Fermi = 0, over the charge states with each distinct non-zero charge q,
+    # with shape (n_distinct_charges, n_points, n_temperatures).
+    used = defect_set.mask & ( defect_set.charges != 0 )
+    distinct_charges = np.unique( defect_set.charges[ used ] )
+    log_charge_sums = np.empty( ( len( distinct_charges ), offsets.shape[1], len( temperature ) ) )
+    for i, q in enumerate( distinct_charges ):
+        rows, slots = np.nonzero( used & ( defect_set.charges == q ) )
+        log_charge_sums[ i ] = logsumexp( constants[ rows, slots, np.newaxis, : ] - offsets[ rows ], axis = 0 ) + np.log( abs( q ) )
+    positive_charges = distinct_charges > 0
+    negative_charges = distinct_charges < 0
+    distinct_charges = distinct_charges[ :, np.newaxis ]
+
+    # Every condition is solved on one flat axis, so that converged conditions can be dropped.
+    shape = ( offsets.shape[1], len( temperature ) )
+    log_charge_sums = log_charge_sums.reshape( len( distinct_charges ), shape[0] * shape[1] )
+    flat_temperature = np.broadcast_to( temperature, shape ).ravel()
+    flat_kT = BOLTZMANN_CONSTANT * flat_temperature
+
+    def log_charge_ratio( e_fermi, conditions ):
+        """log( positive charge ) - log( negative charge ), which decreases with increasing Fermi energy."""
+        log_c = log_charge_sums[ :, conditions ] - distinct_charges * e_fermi / flat_kT[ conditions ]
+        if carrier_table is not None:
+            log_n, log_p = carrier_table.log_carrier_concentrations( e_fermi, flat_temperature[ conditions ] )
+        else:
+            log_n, log_p = log_carrier_concentrations( host, e_fermi, flat_temperature[ conditions ], electron_dos_mass, hole_dos_mass )
+        log_positive = np.logaddexp( logsumexp( log_c[ positive_charges ], axis = 0 ), log_p )
+        log_negative = np.logaddexp( logsumexp( log_c[ negative_charges ], axis = 0 ), log_n )
+        return log_positive - log_negative
+
+    n_conditions = flat_kT.size
+    lower = np.full( n_conditions, float( ef_min ) )
+    upper = np.full( n_conditions, float( ef_max ) )
+    ratio_lower = log_charge_ratio( lower, slice( None ) )
+    ratio_upper = log_charge_ratio( upper, slice( None ) )
+    pinned_low = ~( ratio_lower > 0 )
+    pinned_high = ratio_upper > 0
+    # The bracket [lower, upper] always contains the root. A bisection step is taken instead of an Illinois step whenever
+    # the previous step did not shrink the bracket enough, so no condition takes more than twice as many steps as bisection.
+    last_side = np.zeros( n_conditions, dtype = int )
+    last_width = np.full( n_conditions, np.inf )
+    active = np.flatnonzero( ~( pinned_low | pinned_high ) & ( upper - lower > tolerance ) )
+    max_iterations = 2 * max( int( np.ceil( np.log2( ( ef_max - ef_min ) / tolerance ) ) ), 1 )
+    for _ in range( max_iterations ):
+        if not active.size:
+            break
+        a, b = lower[ active ], upper[ active ]
+        ratio_a, ratio_b = ratio_lower[ active ], ratio_upper[ active ]
+        with np.errstate( invalid = 'ignore', divide = 'ignore', over = 'ignore' ):
+            secant = ( a * ratio_b - b * ratio_a ) / ( ratio_b - ratio_a )
+        use_secant = np.isfinite( secant ) & ( b - a < 0.75 * last_width[ active ] )
+        last_width[ active ] = b - a
+        # Secant steps stay tolerance / 2 inside the bracket, so that a step next to the root also closes the bracket on it.
+        e_fermi = np.where( use_secant, np.clip( secant, a + 0.5 * tolerance, b - 0.5 * tolerance ), 0.5 * ( a + b ) )
+        ratio = log_charge_ratio( e_fermi, active )
+        positive = ratio > 0
+        side = np.where( positive, 1, -1 )
+        repeated = side == last_side[ active ]
+        lower[ active ] = np.where( ratio >= 0, e_fermi, a )
+        upper[ active ] = np.where( ratio <= 0, e_fermi, b )
+        ratio_lower[ active ] = np.where( positive, ratio, np.where( repeated, 0.5 * ratio_a, ratio_a ) )
+        ratio_upper[ active ] = np.where( positive, np.where( repeated, 0.5 * ratio_b, ratio_b ), ratio )
+        last_side[ active ] = side
+        active = active[ upper[ active ] - lower[ active ] > tolerance ]
+    e_fermi = ( 0.5 * ( lower + upper ) ).reshape( shape )
+    pinned_low = pinned_low.reshape( shape )
+    pinned_high = pinned_high.reshape( shape )
+    e_fermi[ pinned_low ] = ef_min
+    e_fermi[ pinned_high ] = ef_max
+    pinned = pinned_low | pinned_high
+    if np.any( pinned ):
+        warnings.warn( 'Charge neutrality has no solution between {} and {} eV for {} of {} conditions, '
+                       'which are pinned at these bounds'.format( ef_min, ef_max, np.count_nonzero( pinned ), pinned.size ),
+                       RuntimeWarning )
+    concentrations = None
+    if return_concentrations:
+        concentrations = np.exp( constants[ :, :, np.newaxis, : ] - offsets[ :, np.newaxis, :, : ]
+                                 - defect_set.charges[ :, :, np.newaxis, np.newaxis ] * e_fermi / kT )
+    if return_pinned:
+        return e_fermi, concentrations, pinned
+    return e_fermi, concentrations
@@ -1,9 +1,33 @@
+import numpy as np
+
 class Host:
+    """The stoichiometric host system.
+
+    Attributes:
+        dos (np.array or None): electronic density of states, with shape (n_points, 2): the energies (eV, on the same scale
+                                as vbm and cbm) in increasing order, and the density of states (states / eV / cm^3).
+                                A DOS calculated per simulation cell should be divided by the cell volume in cm^3.
+                                If set, free carrier concentrations are calculated from the DOS (see tlpy.fermi_level.CarrierTable),
+                                otherwise parabolic bands are assumed.
+        revision (int): incremented every time any other attribute of this Host is set.
+                        Used by Defect objects to detect when cached results are out of date."""
 
-    def __init__( self, energy, vbm, cbm, elemental_energies, correction_scaling ):
+    __slots__ = ( 'energy', 'vbm', 'cbm', 'elemental_energies', 'correction_scaling', 'fundamental_gap',
+                  'site_densities', 'correction_scheme', 'dos', 'revision' )
+
+    def __init__( self, energy, vbm, cbm, elemental_energies, correction_scaling, site_densities = None, correction_scheme = None, dos = None ):
+        super().__setattr__( 'revision', 0 )
         self.energy = energy
         self.vbm = vbm
         self.cbm = cbm
         self.elemental_energies = elemental_energies
         self.correction_scaling = correction_scaling
         self.fundamental_gap = cbm - vbm
+        self.site_densities = site_densities
+        self.correction_scheme = correction_scheme
+        self.dos = None if dos is None else np.asarray( dos, dtype = float ).reshape( -1, 2 )
+
+    def __setattr__( self, name, value ):
+        super().__setattr__( name, value )
+        if name != 'revision':
+            super().__setattr__( 'revision', getattr( self, 'revision', 0 ) + 1 )
@@ -0,0 +1,155 @@
+"""
+Opt-in call counting and timing for the formation energy hot paths.
+
+    with Instrumentation() as stats:
+        defect.tl_profile( delta_mu, 0.0, 4.0 )
+    print( stats.report() )
+
+The instrumented methods are only wrapped while the context is active, and the original
+functions are restored when it exits, so there is no overhead at all when instrumentation
+is not in use. Calls are attributed to the defect that made them: the Defect name for Defect
+methods, and the name of the parent Defect for Defect_Charge_State methods.
+Times are wall-clock and inclusive, i.e. they include time spent in any instrumented methods
+that are called from inside another one.
+"""
+
+from tlpy.defect import Defect
+from tlpy.defect_charge_state import Defect_Charge_State
+from tlpy.defect_set import DefectSet
+
+import functools
+import time
+
+DEFAULT_TARGETS = [ ( Defect_Charge_State, 'formation_energy' ),
+                    ( Defect_Charge_State, 'relative_formation_energy' ),
+                    ( Defect_Charge_State, 'correction' ),
+                    ( Defect, 'breakpoint_table' ),
+                    ( Defect, 'charge_state_at_fermi_energy' ),
+                    ( Defect, 'defect_energy_at_fermi_energy' ),
+                    ( Defect, 'transition_level' ),
+                    ( Defect, 'tl_profile' ),
+                    ( Defect, 'xmgrace_output' ),
+                    ( Defect, 'matplotlib_data' ),
+                    ( DefectSet, 'formation_energies' ) ]
+
+def _defect_name( obj ):
+    if isinstance( obj, Defect ):
+        return obj.name
+    defect = getattr( obj, 'defect', None )
+    return defect.name if defect is not None else None
+
+class Instrumentation:
+    """Context manager that counts calls to, and times, a set of methods.
+
+    Attributes:
+        targets (list(tuple(type,str))): the (class, method name) pairs that are instrumented.
+                                         Properties are instrumented through their getter.
+        records (dict): [ number of calls, total time (s) ], keyed by ( defect name, method name ).
+                        The defect name is None for calls that do not belong to a defect.
+    """
+
+    def __init__( self, targets = None ):
+        """Create an Instrumentation object.
+
+        Args:
+            targets (Optional(list(tuple(type,str)))): methods to instrument. Defaults to DEFAULT_TARGETS."""
+        self.targets = list( DEFAULT_TARGETS if targets is None else targets )
+        self.records = {}
+        self._originals = []
+
+    def _wrap( self, function, method_name ):
+        records = self.records
+
+        @functools.wraps( function )
+        def wrapper( obj, *args, **kwargs ):
+            start = time.perf_counter()
+            try:
+                return function( obj, *args, **kwargs )
+            finally:
+                elapsed = time.perf_counter() - start
+                record = records.setdefault( ( _defect_name( obj ), method_name ), [ 0, 0.0 ] )
+                record[0] += 1
+                record[1] += elapsed
+        return wrapper
+
+    def __enter__( self ):
+        for cls, name in self.targets:
+            original = cls.__dict__[ name ]
+            method_name = '{}.{}'.format( cls.__name__, name )
+            if isinstance( original, property ):
+                wrapped = property( self._wrap( original.fget, method_name ), original.fset, original.fdel, original.__doc__ )
+            else:
+                wrapped = self._wrap( original, method_name )
+            self._originals.append( ( cls, name, original ) )
+            setattr( cls, name, wrapped )
+        return self
+
+    def __exit__( self, exc_type, exc_value, traceback ):
+        while self._originals:
+            cls, name, original = self._originals.pop()
+            setattr( cls, name, original )
+        return False
+
+    def _select( self, method, defect ):
+        return [ record for ( d, m ), record in self.records.items()
+                 if ( method is None or m == method ) and ( defect is None or d == defect ) ]
+
+    def calls( self, method = None, defect = None ):
+        """Number of calls, optionally restricted to one method (e.g. 'Defect_Charge_State.formation_energy') and/or one defect.
+
+        Returns:
+            int"""
+        return sum( record[0] for record in self._select( method, defect ) )
+
+    def time( self, method = None, defect = None ):
+        """Total wall time (s), optionally restricted to one method and/or one defect.
+
+        Returns:
+            float"""
+        return sum( record[1] for record in self._select( method, defect ) )
+
+    def by_method( self ):
+        """Number of calls and total wall time for each method, summed over every defect.
+
+        Returns:
+            dict: [ number of calls, total time (s) ], keyed by method name."""
+        totals = {}
+        for ( _, method ), ( calls, seconds ) in self.records.items():
+            total = totals.setdefault( method, [ 0, 0.0 ] )
+            total[0] += calls
+            total[1] += seconds
+        return totals
+
+    def rows( self ):
+        """Every record, sorted by decreasing total time.
+
+        Returns:
+            list(tuple(str,str,int,float)): ( defect name, method name, number of calls, total time (s) )."""
+        rows = [ ( defect, method, calls, seconds ) for ( defect, method ), ( calls, seconds ) in self.records.items() ]
+        return sorted( rows, key = lambda row: -row[3] )
+
+    def report( self ):
+        """Returns a plain text table of the calls and times for each method, and for each defect and method.
+
+        Returns:
+            str"""
+        lines = [ '{:<45} {:>10} {:>12}'.format( 'method', 'calls', 'time (s)' ) ]
+        for method, ( calls, seconds ) in sorted( self.by_method().items(), key = lambda item: -item[1][1] ):
+            lines.append( '{:<45} {:>10d} {:>12.6f}'.format( method, calls, seconds ) )
+        lines.append( '' )
+        lines.append( '{:<20} {:<45} {:>10} {:>12}'.format( 'defect', 'method', 'calls', 'time (s)' ) )
+        for defect, method, calls, seconds in self.rows():
+            lines.append( '{:<20} {:<45} {:>10d} {:>12.6f}'.format( str( defect ), method, calls, seconds ) )
+        return '\n'.join( lines )
+
+    def write_csv( self, f ):
+        """Writes every record as CSV, with columns defect,method,calls,time.
+
+        Args:
+            f (file): open text file handle.
+
+        Returns:
+            None"""
+        f.write( 'defect,method,calls,time\n' )
+        for defect, method, calls, seconds in self.rows():
+            f.write( '{},{},{},{!r}\n'.format( '' if defect is None else defect, method, calls, seconds ) )
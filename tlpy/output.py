@@ -0,0 +1,135 @@
+"""
+Streaming output of transition level profiles for many defects and chemical potential sets.
+
+Each writer takes an open file handle, a collection of defects, and a set of chemical potentials,
+and writes one profile at a time, so output appears as soon as each defect has been processed.
+The profiles for every chemical potential set are calculated together for each defect
+(see Defect.tl_profile), and each profile is formatted as a whole array with np.savetxt.
+"""
+
+from tlpy.defect_set import DefectSet
+from tlpy.envelope import envelope_profile, lower_envelope
+
+import numpy as np
+
+BINARY_DTYPE = np.dtype( [ ( 'defect', 'U64' ), ( 'label', 'U64' ), ( 'e_fermi', 'f8' ), ( 'formation_energy', 'f8' ) ] )
+
+def _labelled_delta_mu( delta_mu_sets ):
+    if isinstance( delta_mu_sets, dict ):
+        return list( delta_mu_sets ), list( delta_mu_sets.values() )
+    return [ str( i ) for i in range( len( delta_mu_sets ) ) ], list( delta_mu_sets )
+
+def _defect_set_profiles( defect_set, delta_mu, ef_min, ef_max ):
+    """Profiles for each row of a DefectSet, from the packed arrays alone, so that no Defect objects are built."""
+    upper = ef_max if ef_max else defect_set.host.fundamental_gap
+    offsets = defect_set.chemical_potential_terms( delta_mu )
+    for i in range( len( defect_set ) ):
+        used = defect_set.mask[ i ]
+        charges = np.asarray( defect_set.charges[ i ][ used ] )
+        intercepts = np.asarray( defect_set.reference_energies[ i ][ used ] )
+        hull, breakpoints = lower_envelope( charges, intercepts )
+        yield str( defect_set.names[ i ] ), envelope_profile( charges[ hull ], breakpoints, intercepts[ hull ], offsets[ i ], ef_min, upper )
+
+def iter_profiles( defects, delta_mu_sets, ef_min = 0.0, ef_max = None ):
+    """Generates the transition level profile for every defect and chemical potential set.
+
+    The profiles for a DefectSet are calculated from its packed arrays, one row at a time,
+    so no Defect objects are built (e.g. for a memory-mapped database, see tlpy.database.load_defect_set).
+
+    Args:
+        defects (list(tlpy.defect.Defect) or tlpy.defect_set.DefectSet): the defects.
+        delta_mu_sets (dict or list(dict)): chemical potential sets, either as a list of delta_mu dicts,
+            or as a dict of delta_mu dicts keyed by a label, e.g. { 'A' : { 'O' : 0.0, ... }, 'B' : { ... } }.
+        ef_min (Optional(float)): minimum Fermi energy (relative to the host VBM). Defaults to 0.0 eV.
+        ef_max (Optional(float)): maximum Fermi energy (relative to the host VBM). Defaults to the host fundamental gap.
+
+    Yields:
+        (str, str, np.array): the defect name, the chemical potential set label, and the (n_kinks, 2) profile."""
+    labels, delta_mu = _labelled_delta_mu( delta_mu_sets )
+    if isinstance( defects, DefectSet ):
+        for name, profiles in _defect_set_profiles( defects, delta_mu, ef_min, ef_max ):
+            for label, profile in zip( labels, profiles ):
+                yield name, label, profile
+        return
+    for defect in defects:
+        upper = ef_max if ef_max else defect.host.fundamental_gap
+        profiles = defect.tl_profile( delta_mu, ef_min, upper )
+        for label, profile in zip( labels, profiles ):
+            yield defect.name, label, profile
+
+def write_xmgrace( f, defects, delta_mu_sets, ef_min = 0.0, ef_max = None, fmt = '%.10g' ):
+    """Writes transition level profiles as a multi-set xmgrace data file, with one set per defect and chemical potential set.
+
+    Args:
+        f (file): open text file handle.
+        defects (list(tlpy.defect.Defect) or tlpy.defect_set.DefectSet): the defects.
+        delta_mu_sets (dict or list(dict)): chemical potential sets (see iter_profiles).
+        ef_min (Optional(float)): minimum Fermi energy (relative to the host VBM). Defaults to 0.0 eV.
+        ef_max (Optional(float)): maximum Fermi energy (relative to the host VBM). Defaults to the host fundamental gap.
+        fmt (Optional(str)): number format passed to np.savetxt. Defaults to '%.10g'.
+
+    Returns:
+        None
+
+    Example output:
+        # V_O A
+        0 -2.4
+        1.3 0.8
+        2.6 0.8
+        &"""
+    for name, label, profile in iter_profiles( defects, delta_mu_sets, ef_min, ef_max ):
+        f.write( '# {} {}\n'.format( name, label ) )
+        np.savetxt( f, profile, fmt = fmt )
+        f.write( '&\n' )
+
+def write_csv( f, defects, delta_mu_sets, ef_min = 0.0, ef_max = None, fmt = '%.10g' ):
+    """Writes transition level profiles as CSV, with columns defect,label,e_fermi,formation_energy.
+
+    Args:
+        f (file): open text file handle.
+        defects (list(tlpy.defect.Defect) or tlpy.defect_set.DefectSet): the defects.
+        delta_mu_sets (dict or list(dict)): chemical potential sets (see iter_profiles).
+        ef_min (Optional(float)): minimum Fermi energy (relative to the host VBM). Defaults to 0.0 eV.
+        ef_max (Optional(float)): maximum Fermi energy (relative to the host VBM). Defaults to the host fundamental gap.
+        fmt (Optional(str)): number format passed to np.savetxt. Defaults to '%.10g'.
+
+    Returns:
+        None"""
+    f.write( 'defect,label,e_fermi,formation_energy\n' )
+    for name, label, profile in iter_profiles( defects, delta_mu_sets, ef_min, ef_max ):
+        prefix = '{},{},'.format( name, label ).replace( '%', '%%' )
+        np.savetxt( f, profile, fmt = prefix + fmt + ',' + fmt )
+
+def write_binary( f, defects, delta_mu_sets, ef_min = 0.0, ef_max = None ):
+    """Writes transition level profiles as a sequence of .npy records, one structured array (BINARY_DTYPE) per profile.
+
+    Args:
+        f (file): open binary file handle.
+        defects (list(tlpy.defect.Defect) or tlpy.defect_set.DefectSet): the defects.
+        delta_mu_sets (dict or list(dict)): chemical potential sets (see iter_profiles).
+        ef_min (Optional(float)): minimum Fermi energy (relative to the host VBM). Defaults to 0.0 eV.
+        ef_max (Optional(float)): maximum Fermi energy (relative to the host VBM). Defaults to the host fundamental gap.
+
+    Returns:
+        None"""
+    for name, label, profile in iter_profiles( defects, delta_mu_sets, ef_min, ef_max ):
+        record = np.empty( len( profile ), dtype = BINARY_DTYPE )
+        record[ 'defect' ] = name
+        record[ 'label' ] = label
+        record[ 'e_fermi' ] = profile[ :, 0 ]
+        record[ 'formation_energy' ] = profile[ :, 1 ]
+        np.save( f, record )
+
+def read_binary( f ):
+    """Reads the profiles written by write_binary.
+
+    Args:
+        f (file): open binary file handle.
+
+    Yields:
+        np.array: one structured array (BINARY_DTYPE) per profile."""
+    while True:
+        try:
+            yield np.load( f )
+        except EOFError:
+            return
@@ -0,0 +1,173 @@
+import numpy as np
+
+def formation_enthalpy( composition, energy, elemental_energies ):
+    """Formation enthalpy of a compound relative to its elemental reference energies.
+
+    Args:
+        composition (dict): number of atoms of each element, e.g. { 'Mg' : 1, 'O' : 1 }.
+        energy (float): total energy for this composition.
+        elemental_energies (dict): elemental reference energies, e.g. { 'Mg' : -1.6, 'O' : -4.9 }.
+
+    Returns:
+        float"""
+    return energy - sum( n * elemental_energies[ e ] for e, n in composition.items() )
+
+class StabilityRegion:
+    """The region of elemental chemical potential (delta_mu) space where a host compound is stable.
+
+    The host is stable where
+        \\sum_i n_i delta_mu_i = delta_H_f(host),
+        delta_mu_i <= 0 for every element, and
+        \\sum_i m_i delta_mu_i <= delta_H_f(phase) for every competing phase,
+    which defines a convex polytope lying in the host hyperplane.
+
+    Attributes:
+        elements (list(str)): the host elements, in sorted order. Arrays of chemical potentials use this column order.
+        host_composition (np.array): number of atoms of each element in the host formula, with shape (n_elements).
+        formation_enthalpy (float): host formation enthalpy.
+        phase_names (list(str)): competing phase names.
+        constraints (np.array): inequality constraints A, with shape (n_constraints, n_elements), such that A delta_mu <= b.
+                                The first n_elements rows are the delta_mu_i <= 0 constraints; the remainder are the competing phases.
+        bounds (np.array): inequality constraints b, with shape (n_constraints).
+        vertices (np.array): polytope vertices, with shape (n_vertices, n_elements).
+        tolerance (float): numerical tolerance used to decide whether a point satisfies the constraints.
+    """
+
+    def __init__( self, host_composition, host_energy, elemental_energies, competing_phases, tolerance = 1e-8 ):
+        """Create a StabilityRegion object.
+
+        Args:
+            host_composition (dict): number of atoms of each element in the host, e.g. { 'Ge' : 5, 'P' : 6, 'O' : 25 }.
+            host_energy (float): total energy of the host for this composition.
+            elemental_energies (dict): elemental reference energies.
+            competing_phases (dict): competing phase compositions and energies, keyed by name,
+                                     e.g. { 'GeO2' : ( { 'Ge' : 1, 'O' : 2 }, -25.3 ) }.
+            tolerance (Optional(float)): numerical tolerance for the constraints. Defaults to 1e-8.
+
+        Raises:
+            ValueError: if the host composition is not positive for every element,
+                        or if a competing phase contains an element that is not in the host."""
+        self.elements = sorted( host_composition )
+        self.tolerance = tolerance
+        self.host_composition = np.array( [ host_composition[ e ] for e in self.elements ], dtype = float )
+        if np.any( self.host_composition <= 0.0 ):
+            raise ValueError( 'The host composition must be positive for every element' )
+        self.formation_enthalpy = formation_enthalpy( host_composition, host_energy, elemental_energies )
+        self.phase_names = list( competing_phases )
+        rows = [ np.eye( len( self.elements ) ) ]
+        bounds = [ np.zeros( len( self.elements ) ) ]
+        for name in self.phase_names:
+            composition, energy = competing_phases[ name ]
+            unknown = set( composition ) - set( self.elements )
+            if unknown:
+                raise ValueError( 'Competing phase {} contains elements not in the host: {}'.format( name, sorted( unknown ) ) )
+            rows.append( np.array( [ [ composition.get( e, 0 ) for e in self.elements ] ], dtype = float ) )
+            bounds.append( np.array( [ formation_enthalpy( composition, energy, elemental_energies ) ] ) )
+        self.constraints = np.concatenate( rows )
+        self.bounds = np.concatenate( bounds )
+        self.vertices = self._find_vertices()
+
+    def _find_vertices( self ):
+        """Enumerates the polytope vertices, using the double description method.
+
+        On the host hyperplane, the delta_mu_i <= 0 constraints bound a simplex, whose vertices are the
+        elemental limits. This simplex is cut by each competing phase constraint in turn. Every vertex
+        keeps a record of the constraints that are active there, and two vertices are joined by an edge
+        if they share at least (n_elements - 2) active constraints, and no other vertex has all of these
+        active. Each cut removes the vertices that violate the new constraint, and adds a new vertex
+        where it crosses each edge from a kept vertex to a removed vertex. The work therefore scales with
+        the number of vertices, rather than with the number of combinations of constraints."""
+        n_elements = len( self.elements )
+        if self.formation_enthalpy > self.tolerance:
+            return np.zeros( ( 0, n_elements ) )
+        vertices = np.diag( self.formation_enthalpy / self.host_composition )
+        active = np.zeros( ( n_elements, len( self.constraints ) ), dtype = bool )
+        active[ :, :n_elements ] = ~np.eye( n_elements, dtype = bool )
+        for k in range( n_elements, len( self.constraints ) ):
+            values = np.dot( vertices, self.constraints[ k ] ) - self.bounds[ k ]
+            outside = values > self.tolerance
+            active[ np.abs( values ) <= self.tolerance, k ] = True
+            if not np.any( outside ):
+                continue
+            kept = np.flatnonzero( values < -self.tolerance )
+            removed = np.flatnonzero( outside )
+            n_shared = np.dot( active[ kept ].astype( int ), active[ removed ].T.astype( int ) )
+            u, v = np.nonzero( n_shared >= n_elements - 2 )
+            u, v = kept[ u ], removed[ v ]
+            shared = active[ u ] & active[ v ]
+            # The number of vertices, including u and v, that have every shared constraint active.
+            n_containing = np.sum( np.dot( shared.astype( int ), ( ~active ).T.astype( int ) ) == 0, axis = 1 )
+            edges = n_containing == 2
+            u, v, shared = u[ edges ], v[ edges ], shared[ edges ]
+            t = values[ u ] / ( values[ u ] - values[ v ] )
+            shared[ :, k ] = True
+            vertices = np.concatenate( ( vertices[ ~outside ], vertices[ u ] + t[ :, np.newaxis ] * ( vertices[ v ] - vertices[ u ] ) ) )
+            active = np.concatenate( ( active[ ~outside ], shared ) )
+        vertices = vertices[ self.contains( vertices ) ]
+        if len( vertices ) == 0:
+            return vertices
+        _, unique = np.unique( np.round( vertices / self.tolerance ** 0.5 ), axis = 0, return_index = True )
+        return vertices[ np.sort( unique ) ]
+
+    def contains( self, delta_mu ):
+        """Tests whether chemical potential points lie inside the stability region.
+
+        Args:
+            delta_mu (np.array): chemical potentials, with shape (n_points, n_elements).
+
+        Returns:
+            np.array(bool): shape (n_points)."""
+        delta_mu = np.atleast_2d( delta_mu )
+        on_plane = np.abs( np.dot( delta_mu, self.host_composition ) - self.formation_enthalpy ) <= self.tolerance
+        inside = np.all( np.dot( delta_mu, self.constraints.T ) <= self.bounds + self.tolerance, axis = 1 )
+        return on_plane & inside
+
+    def vertices_as_dicts( self ):
+        """Returns the polytope vertices as delta_mu dicts, e.g. [ { 'Ge' : 0.0, 'P' : -2.0888, 'O' : -2.4332 }, ... ]
+
+        Returns:
+            list(dict)"""
+        return [ dict( zip( self.elements, v ) ) for v in self.vertices ]
+
+    def sample( self, n_points, seed = None, batch_size = 100000, max_batches = 100 ):
+        """Draws uniformly distributed chemical potential points from inside the stability region.
+
+        The chemical potential of the most abundant host element is fixed by the host hyperplane;
+        the others are drawn from the bounding box of the vertices, and points outside the region are rejected.
+        A region of lower dimension than the host hyperplane (e.g. a line, where two competing phases are
+        both limiting everywhere) has zero volume, so almost every candidate is rejected, and the number of
+        batches drawn is capped.
+
+        Args:
+            n_points (int): number of points.
+            seed (Optional(int)): random number generator seed.
+            batch_size (Optional(int)): number of candidate points to draw at a time.
+            max_batches (Optional(int)): maximum number of batches to draw. Defaults to 100.
+
+        Returns:
+            np.array: chemical potentials, with shape (n_points, n_elements).
+
+        Raises:
+            ValueError: if the stability region is empty, or if fewer than n_points points are accepted after max_batches batches."""
+        if len( self.vertices ) == 0:
+            raise ValueError( 'The stability region is empty' )
+        rng = np.random.RandomState( seed )
+        dependent = int( np.argmax( np.abs( self.host_composition ) ) )
+        free = [ i for i in range( len( self.elements ) ) if i != dependent ]
+        low = self.vertices[ :, free ].min( axis = 0 )
+        high = self.vertices[ :, free ].max( axis = 0 )
+        samples = []
+        n_accepted = 0
+        for _ in range( max_batches ):
+            if n_accepted >= n_points:
+                break
+            candidates = np.empty( ( batch_size, len( self.elements ) ) )
+            candidates[ :, free ] = rng.uniform( low, high, size = ( batch_size, len( free ) ) )
+            candidates[ :, dependent ] = ( self.formation_enthalpy - np.dot( candidates[ :, free ], self.host_composition[ free ] ) ) / self.host_composition[ dependent ]
+            accepted = candidates[ self.contains( candidates ) ]
+            samples.append( accepted )
+            n_accepted += len( accepted )
+        if n_accepted < n_points:
+            raise ValueError( 'Only {} of {} points were accepted after {} batches: '
+                              'the stability region may have zero volume'.format( n_accepted, n_points, max_batches ) )
+        return np.concatenate( samples )[ :n_points ]
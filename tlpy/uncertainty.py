@@ -0,0 +1,97 @@
+"""
+Monte Carlo propagation of uncertainties in the input energies to defect transition levels.
+
+Each source of error can be given as a float, which is used as the standard deviation of a
+normal distribution centred on zero, or as a callable f( rng, size ) that returns an array of
+random deviations with the requested size, drawn from any distribution, e.g.
+
+    lambda rng, size : rng.uniform( -0.05, 0.05, size = size )
+
+All samples are evaluated together as arrays, without creating any Defect objects per sample.
+"""
+
+import itertools
+import warnings
+
+import numpy as np
+
+def _draw( error, rng, size ):
+    if callable( error ):
+        return np.asarray( error( rng, size ), dtype = float ).reshape( size )
+    return rng.normal( 0.0, error, size = size ) if error else np.zeros( size )
+
+def sample_intercepts( defect, n_samples, energy_error = 0.0, vbm_error = 0.0, correction_scaling_error = 0.0, seed = None ):
+    """Draws samples of the relative formation energy at E_Fermi = 0 for every charge state of a defect.
+
+    Args:
+        defect (tlpy.defect.Defect): the defect.
+        n_samples (int): number of samples.
+        energy_error (Optional(float, callable, or dict)): error in the charge state energies.
+            A dict gives a separate error for each charge, e.g. { 0 : 0.02, +1 : 0.05 }. Defaults to 0.0.
+        vbm_error (Optional(float or callable)): error in the host VBM. Defaults to 0.0.
+        correction_scaling_error (Optional(float or callable)): error in the host correction_scaling, i.e. in the
+            coefficient of the q^2 image-charge correction. Defaults to 0.0.
+        seed (Optional(int)): random number generator seed.
+
+    Returns:
+        (np.array(int), np.array): the charges, sorted in decreasing order, and the sampled intercepts,
+                                   with shape (n_samples, n_charge_states)."""
+    rng = np.random.RandomState( seed )
+    charges = np.array( sorted( defect.charge_state, reverse = True ), dtype = int )
+    energies = np.array( [ defect.charge_state[ q ].energy for q in charges ], dtype = float )
+    corrections = np.array( [ defect.charge_state[ q ].correction for q in charges ], dtype = float )
+    if isinstance( energy_error, dict ):
+        energy_noise = np.stack( [ _draw( energy_error.get( q, 0.0 ), rng, n_samples ) for q in charges ], axis = 1 )
+    else:
+        energy_noise = _draw( energy_error, rng, ( n_samples, len( charges ) ) )
+    vbm = defect.host.vbm + _draw( vbm_error, rng, ( n_samples, 1 ) )
+    correction_noise = _draw( correction_scaling_error, rng, ( n_samples, 1 ) ) * charges * charges
+    intercepts = energies + energy_noise - defect.host.energy + charges * vbm + corrections + correction_noise
+    return charges, intercepts
+
+def sample_transition_levels( defect, n_samples, energy_error = 0.0, vbm_error = 0.0, correction_scaling_error = 0.0, seed = None ):
+    """Draws samples of the transition level for every pair of charge states of a defect.
+
+    Args:
+        defect (tlpy.defect.Defect): the defect.
+        n_samples (int): number of samples.
+        energy_error (Optional(float, callable, or dict)): error in the charge state energies (see sample_intercepts).
+        vbm_error (Optional(float or callable)): error in the host VBM. Defaults to 0.0.
+        correction_scaling_error (Optional(float or callable)): error in the host correction_scaling. Defaults to 0.0.
+        seed (Optional(int)): random number generator seed.
+
+    Returns:
+        (list(tuple(int,int)), np.array, np.array(bool)):
+            the charge state pairs (q1, q2), with q1 > q2;
+            the sampled transition levels e(q1/q2) (relative to the host VBM), with shape (n_samples, n_pairs);
+            and whether each sampled level lies on the lower envelope, i.e. whether it is a thermodynamic
+            transition level for that sample, with shape (n_samples, n_pairs)."""
+    charges, intercepts = sample_intercepts( defect, n_samples, energy_error, vbm_error, correction_scaling_error, seed )
+    pairs = list( itertools.combinations( range( len( charges ) ), 2 ) )
+    i = np.array( [ p[0] for p in pairs ], dtype = int )
+    j = np.array( [ p[1] for p in pairs ], dtype = int )
+    levels = ( intercepts[ :, j ] - intercepts[ :, i ] ) / ( charges[ i ] - charges[ j ] )
+    energy = intercepts[ :, i ] + charges[ i ] * levels
+    lowest = np.min( intercepts[ :, np.newaxis, : ] + charges * levels[ :, :, np.newaxis ], axis = 2 )
+    on_envelope = energy <= lowest + 1e-9 * np.maximum( 1.0, np.abs( lowest ) )
+    return [ ( int( charges[ a ] ), int( charges[ b ] ) ) for a, b in pairs ], levels, on_envelope
+
+def confidence_intervals( samples, confidence = 0.95, mask = None ):
+    """Median and central confidence interval of each column of a set of samples.
+
+    Args:
+        samples (np.array): samples, with shape (n_samples, n_quantities).
+        confidence (Optional(float)): width of the confidence interval. Defaults to 0.95.
+        mask (Optional(np.array(bool))): if given, only samples where mask is True are included,
+                                         e.g. the on_envelope array from sample_transition_levels.
+
+    Returns:
+        (np.array, np.array, np.array): the lower bound, median, and upper bound for each quantity.
+                                        Quantities with no included samples are np.nan."""
+    if mask is not None:
+        samples = np.where( mask, samples, np.nan )
+    percentiles = [ 50.0 * ( 1.0 - confidence ), 50.0, 50.0 * ( 1.0 + confidence ) ]
+    with warnings.catch_warnings():
+        warnings.simplefilter( 'ignore', RuntimeWarning )
+        lower, median, upper = np.nanpercentile( samples, percentiles, axis = 0 )
+    return lower, median, upper